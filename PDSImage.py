@@ -1,6 +1,8 @@
 #! /usr/local/bin/python
 
-import os, sys, string, numpy, re, decimal
+import os, sys, numpy, re, ast, mmap
+import listfauxfile
+import pdscache
 
 class PDSImage:
     """PDSImage.
@@ -51,29 +53,55 @@ class PDSImage:
     2010-06
       - Multiple bands allowed
       - Bugs in parser have been fixed
+    2026-10
+      - Faster, iterative label parser; raw label kept as one string
+      - getAttribs uses a flat index of the header, no eval()
+      - extractAttribs:  early-exit query of in-memory labels
+      - getObjectData(memmap=True):  zero-copy views of mapped data
+      - getObjectWindow:  line/sample/band windows, read or mapped
+      - Optional persistent parsed-label cache; see pdscache.py
     
     """
 
-    def __init__(self, fn='', dim=(1024,1024,), seek=0):
+    ### Members saved in, and restored from, parsed-label cache
+    _CACHED = ('_attribs', '_pointers', '_RawPDSLabel', '_LINENUM', '_rb')
+
+    def __init__(self, fn='', dim=(1024,1024,), seek=0, cache=None):
         """Initialize PDSImage.
         
         Keyword arguments:
         fn -- file name (default '')
         dim -- x,y tuple (default (1024,1024))
+        seek -- byte offset of label in file (default 0)
+        cache -- parsed-label cache; see pdscache.py (default None)
+                 - None:  use SQLite file named by environment variable
+                   PDSIMAGE_CACHE, if it is set
+                 - False:  no cache
+                 - SQLite file name, or pdscache.LabelCache instance
         
         With no arguments, creates an empty 1024x1024 PDSImage.
         """
 
         self._fn = fn
         self._seek = seek
+
+        if cache is None:
+            cache = os.environ.get('PDSIMAGE_CACHE') or False
+        if cache and not hasattr(cache, 'get'):
+            cache = pdscache.opencache(cache)
+        self._cache = cache
         self._attribs = {}
-        self._RawPDSLabel = []
+        self._indexOf = None
+        self._RawPDSLabel = ''
         ###self._lut = []
         self._dim = dim
         self._rb = 0
         
         self.signedRe = [ re.compile("^SIGNED"), re.compile("_SIGNED") ]
 
+        ### Numeric attribute value:  group 1 => decimal point, 2 => exponent
+        self.numberRe = re.compile(r"[-+]?[0-9]*(\.)?[0-9]+([eE][-+]?[0-9]+)?$")
+
         ###self._zeroarray = numpy.zeros(dim)
         ###self._im = numpy.zeros(dim, dtype=numpy.int16)
         ###self._im8 = numpy.zeros(dim, dtype=numpy.int8)
@@ -199,7 +227,7 @@ class PDSImage:
                 ,'ITEM_BYTES/SAMPLE_BITS/ITEM_BITS not in OBJECT ' + ptrKwd)
 
             if bytpp is None:
-                bytpp = bitpp / 8
+                bytpp = bitpp // 8
 
             if bitpp != (8*bytpp):
                 raise AssertionError(2 \
@@ -307,115 +335,159 @@ class PDSImage:
 
     ####################################################################
 
-    def getObjectData(self,ptrKwdArg='image'):
-        """Read IMAGE or HISTOGRAM data
+    def getObjectLayout(self,ptrKwdArg='image'):
+        """Locate IMAGE or HISTOGRAM data in its file
 
            - Argument is pointer keyword (e.g. IMAGE, IMAGE_HISTOGRAM)
-           - Returns 3-tuple:
-             - on failure:  (None, sys.exc_info(), None)
-             - on success:  (data, linePrefixBytes, lineSuffixBytes)
-               - Data will be a numpy.ndarray
-               - if present, prefix &/or suffix will be numpy.ndarray
-                 - either/both may be None
+           - Returns dict; raises exception on failure:
+             - fn:  file name
+             - offset:  byte offset of object in file
+             - size:  bytes in object, including prefix and suffix bytes
+             - dtype:  numpy.dtype of samples, with byte order
+             - shape:  (samples,), (lines,samples) or (bands,lines,samples)
+             - strides:  byte strides of shape; line strides include
+               prefix and suffix bytes
+             - pfxb, sfxb:  line prefix and suffix bytes
+        """
+
+        parsed = self.parseDataType( ptrKwdArg)
+        if not parsed['success']:
+            raise parsed['except'][1]
+
+        npDT = numpy.dtype( parsed['ctyp'] + str(parsed['bitpp']))
+        if npDT == numpy.dtype('int8'):
+            kwdType = self.getAttribs(ptrKwdArg+'/sample_type')
+            if not kwdType:
+                kwdType = self.getAttribs(ptrKwdArg+'/data_type')
+            npDT = numpy.dtype('uint8')
+            for rgx in self.signedRe:
+                if rgx.search(kwdType): npDT = numpy.dtype('int8')
+        npDT = npDT.newbyteorder(parsed['border'] == 'big' and '>' or '<')
+
+        fn,recNum,exc = self.getPointerToPath(ptrKwdArg)
+        if fn is None:
+            raise exc[1]
+
+        dim = parsed['dim']
+        bytpp = int(parsed['bytpp'])
+        pfxb,sfxb = parsed['pfxsfxbyt']
+
+        if len(dim) == 1:
+            pfxb,sfxb = 0,0
+            shape = dim
+            strides = (bytpp,)
+        elif len(dim) == 2:
+            lineBytes = pfxb+(bytpp*dim[0])+sfxb
+            shape = (dim[1],dim[0],)
+            strides = (lineBytes,bytpp,)
+        elif len(dim) == 3:
+            lineBytes = pfxb+(bytpp*dim[0])+sfxb
+            shape = (dim[2],dim[1],dim[0],)
+            strides = (dim[1]*lineBytes,lineBytes,bytpp,)
+        else:
+            raise AssertionError(2 \
+              , str(len(dim))+' dimensions not yet implemented')
+
+        return { 'fn': fn \
+               , 'offset': self.getAttribs('record_bytes') * (recNum-1) \
+               , 'size': shape[0] * strides[0] \
+               , 'dtype': npDT \
+               , 'shape': shape \
+               , 'strides': strides \
+               , 'pfxb': pfxb \
+               , 'sfxb': sfxb \
+               }
+
+
+    ####################################################################
+
+    def _mapObject(self,layout):
+        """Views of object data, prefix and suffix bytes in memory map
 
+           Prefix and suffix bytes are skipped via strides, not copied;
+           pages of the file are only read when the views are accessed
         """
 
+        mm = numpy.memmap(layout['fn'], dtype=numpy.uint8, mode='r' \
+                         , offset=layout['offset'], shape=(layout['size'],))
+
+        return self._objectViews(layout, mm)
+
+
+    def _readObject(self,layout):
+        """Read object bytes; return data, in native byte order, and views
+           of prefix and suffix bytes, as writable arrays
+        """
+
+        buf = bytearray(layout['size'])
+        f = open(layout['fn'],'rb')
         try:
+            f.seek(layout['offset'])
+            n = f.readinto(buf)
+        finally:
+            f.close()
 
-            ############################################################
-            ### Parse data type from DATA_TYPE or SAMPLE_TYPE
-            ###   => int/real/complex/bit_string
+        data, pfxRaw, sfxRaw = self._objectViews(layout \
+                                 , numpy.frombuffer(buf, dtype=numpy.uint8)[:n])
 
-            parsed = self.parseDataType( ptrKwdArg)
+        return data.astype(data.dtype.newbyteorder('=')), pfxRaw, sfxRaw
 
-            if not parsed['success']:
-                raise parsed['except']
 
-            ############################################################
-            ### Convert parsed info to numpy.dtype
+    def _objectViews(self,layout,buf):
+        """Views of object data, prefix and suffix bytes in buf, a uint8
+           array of the object's bytes; see getObjectLayout()
+        """
 
-            npDT = numpy.dtype( parsed['ctyp'] + str(parsed['bitpp']))
+        shape = layout['shape']
+        strides = layout['strides']
+        pfxb = layout['pfxb']
+        sfxb = layout['sfxb']
 
-            ############################################################
-            ### Get filename pointer and object record number
+        data = numpy.ndarray(shape, dtype=layout['dtype'], buffer=buf \
+                            , offset=pfxb, strides=strides)
 
-            fn,recNum,exc = self.getPointerToPath(ptrKwdArg)
-            if fn is None:
-                raise exc
+        pfxRaw = None
+        sfxRaw = None
+        if pfxb > 0:
+            pfxRaw = numpy.ndarray(shape[:-1]+(pfxb,), dtype=numpy.int8 \
+                                  , buffer=buf, offset=0 \
+                                  , strides=strides[:-1]+(1,))
+        if sfxb > 0:
+            sfxRaw = numpy.ndarray(shape[:-1]+(sfxb,), dtype=numpy.int8 \
+                                  , buffer=buf, offset=pfxb+shape[-1]*strides[-1] \
+                                  , strides=strides[:-1]+(1,))
 
-            rb = self.getAttribs('record_bytes')
+        return data, pfxRaw, sfxRaw
 
-            ############################################################
-            ### Calculate sizes and offsets
-
-            dim = parsed['dim']
-            bytpp = parsed['bytpp']
-            pfxsfx = parsed['pfxsfxbyt']
-
-            pfxb = pfxsfx[0]
-            sfxb = pfxsfx[1]
-
-            lenDim = len(dim)
-
-            if lenDim == 1:
-                bytSize = bytpp * dim[0]
-                bytDim = (bytSize,)
-                npShape = dim
-            elif lenDim == 2:
-                bytDim = (dim[1], pfxb+(bytpp*dim[0])+sfxb,)
-                bytSize = bytDim[0] * bytDim[1]
-                npShape = (dim[1],dim[0], )
-            elif lenDim == 3:
-                bytDim = (dim[2], dim[1], pfxb+(bytpp*dim[0])+sfxb, )
-                bytSize = bytDim[0] * bytDim[1] * bytDim[2]
-                npShape = (dim[2],dim[1],dim[0], )
-            else:
-                raise AssertionError(2 \
-                  , str(len(dim))+' dimensions not yet implemented')
 
-            ############################################################
-            ### Read data as raw bytes
+    ####################################################################
 
-            f = open(fn,'rb')
-            f.seek( rb * (recNum-1))
-            raw = numpy.fromstring(f.read(bytSize),dtype=numpy.int8).reshape(bytDim)
-            f.close()
+    def getObjectData(self,ptrKwdArg='image',memmap=False):
+        """Read IMAGE or HISTOGRAM data
 
-            ############################################################
-            ### Strip off prefix and suffix bytes
-
-            pfxRaw=None
-            sfxRaw=None
-            if pfxb>0 and sfxb>0:
-                pfxRaw=raw[:,:pfxb]
-                sfxRaw=raw[:,-sfxb:]
-                raw=raw[:,pfxb:-sfxb]
-            elif pfxb>0:
-                pfxRaw=raw[:,:pfxb]
-                raw=raw[:,pfxb:]
-            elif sfxb>0:
-                sfxRaw=raw[:,-sfxb:]
-                raw=raw[:,:-sfxb]
-
-            if npDT is numpy.int8 or npDT is numpy.dtype('int8'):
-                kwdType = self.getAttribs(ptrKwdArg+'/sample_type')
-                if not kwdType:
-                    kwdType = self.getAttribs(ptrKwdArg+'/data_type')
-                for rgx in self.signedRe:
-                  if rgx.search(kwdType): return raw, pfxRaw, sfxRaw
-                return raw.astype(numpy.uint8), pfxRaw, sfxRaw
+           - Argument is pointer keyword (e.g. IMAGE, IMAGE_HISTOGRAM)
+           - memmap=False:  read the object's bytes; data are copied
+             to native byte order
+           - memmap=True:  no read and no copies; return read-only views,
+             with the file's byte order, of a numpy.memmap of the object
+           - both use the layout of getObjectLayout()
+           - Returns 3-tuple:
+             - on failure:  (None, sys.exc_info(), None)
+             - on success:  (data, linePrefixBytes, lineSuffixBytes)
+               - Data will be a numpy.ndarray
+               - if present, prefix &/or suffix will be numpy.ndarray
+                 - either/both may be None
 
-            ############################################################
-            ### Convert bytes to numpy.dtype and reshape
+        """
 
-            raw = raw.tostring()
-            rtn = numpy.fromstring(raw, dtype=npDT).reshape(npShape)
+        try:
 
-            ############################################################
-            ### Byteswap if necessary
+            layout = self.getObjectLayout(ptrKwdArg)
 
-            if parsed['border'] != sys.byteorder:
-                rtn.byteswap(True)
+            if memmap:
+                return self._mapObject(layout)
+
+            rtn, pfxRaw, sfxRaw = self._readObject(layout)
 
         ################################################################
         ### Handle any exception above
@@ -427,6 +499,171 @@ class PDSImage:
         return rtn, pfxRaw, sfxRaw
 
 
+    ####################################################################
+
+    def _windowAxis(self,sel,n):
+        """Window selection => (first index, count, step) along an axis
+
+           sel is None (all), an int, a slice, or a (start,stop[,step])
+           tuple; step must be positive
+        """
+
+        if sel is None:
+            sel = slice(None)
+        elif isinstance(sel,tuple):
+            sel = slice(*sel)
+        elif not isinstance(sel,slice):
+            sel = slice(sel,sel+1)
+
+        start,stop,step = sel.indices(n)
+        if step < 1:
+            raise ValueError('Window step must be positive')
+
+        return start, max(0,(stop-start+step-1)//step), step
+
+
+    def getObjectWindow(self,ptrKwdArg='image',lines=None,samples=None \
+                       ,bands=None,memmap=False,prefixSuffix=False):
+        """Read a window of IMAGE data:  ranges of lines, samples, bands
+
+           - lines, samples, bands:  None (all), index, slice, or
+             (start,stop[,step]) tuple; lines and bands are ignored for
+             objects without them
+           - File byte offsets of the window are calculated from
+             RECORD_BYTES, the pointer record and the line prefix and
+             suffix bytes; only the bytes of the window are read
+             - adjacent runs of bytes are coalesced into single reads
+           - memmap=True:  map only the span of the file holding the
+             window; return read-only strided views of that map, with
+             the file's byte order, instead of reading
+           - prefixSuffix=True:  also return the line prefix and suffix
+             bytes of the lines in the window
+           - Returns 3-tuple, as getObjectData():
+             - on failure:  (None, sys.exc_info(), None)
+             - on success:  (data, linePrefixBytes, lineSuffixBytes)
+               - data has the dimensions of the object, e.g.
+                 (bands,lines,samples)
+               - prefix &/or suffix are None unless requested and present
+        """
+
+        try:
+
+            layout = self.getObjectLayout(ptrKwdArg)
+
+            ### As (bands,lines,samples) with byte strides
+            shape = layout['shape']
+            strides = layout['strides']
+            nDim = len(shape)
+            shape3 = (1,1,)[:3-nDim] + tuple(shape)
+            strides3 = (shape[0]*strides[0],)*(3-nDim) + tuple(strides)
+            if nDim == 1:
+                strides3 = (strides3[0],strides3[0],strides3[2],)
+
+            if nDim < 3:
+                bands = None
+            if nDim < 2:
+                lines = None
+
+            b0,nb,bStep = self._windowAxis(bands,shape3[0])
+            l0,nl,lStep = self._windowAxis(lines,shape3[1])
+            s0,ns,sStep = self._windowAxis(samples,shape3[2])
+
+            outShape = (nb,nl,ns,)[3-nDim:]
+
+            bytpp = strides3[2]
+            pfxb = prefixSuffix and layout['pfxb'] or 0
+            sfxb = prefixSuffix and layout['sfxb'] or 0
+            lineBytes = layout['pfxb'] + shape3[2]*bytpp + layout['sfxb']
+
+            ### One run of bytes per (band,line):  from prefix or first
+            ### sample, to suffix or last sample
+            sampleStart = layout['pfxb'] + s0*bytpp
+            sampleEnd = sampleStart + ((ns-1)*sStep+1)*bytpp
+            if ns == 0:
+                sampleStart = sampleEnd = lineBytes - layout['sfxb']
+            runStart = sampleStart
+            runEnd = sampleEnd
+            if pfxb:
+                runStart = 0
+            if sfxb:
+                runEnd = lineBytes
+            if pfxb and not ns and not sfxb:
+                runEnd = pfxb
+            runBytes = runEnd - runStart
+
+            if not (nb and nl and runBytes > 0):
+                data = numpy.empty(outShape,dtype=layout['dtype'].newbyteorder('='))
+                pfxRaw = None
+                sfxRaw = None
+                if pfxb:
+                    pfxRaw = numpy.empty(outShape[:-1]+(pfxb,),dtype=numpy.int8)
+                if sfxb:
+                    sfxRaw = numpy.empty(outShape[:-1]+(sfxb,),dtype=numpy.int8)
+                return data, pfxRaw, sfxRaw
+
+            lineStarts = ( layout['offset'] + runStart \
+                         + (b0 + bStep*numpy.arange(nb))[:,None]*strides3[0] \
+                         + (l0 + lStep*numpy.arange(nl))[None,:]*strides3[1] \
+                         ).ravel()
+
+            if memmap:
+
+                ### Map the span from first to last run; strides of file
+                spanStart = int(lineStarts[0])
+                spanBytes = int(lineStarts[-1]) + runBytes - spanStart
+                buf = numpy.memmap(layout['fn'], dtype=numpy.uint8, mode='r' \
+                                  , offset=spanStart, shape=(spanBytes,))
+                runStrides = (strides3[0]*bStep,strides3[1]*lStep,)
+
+            else:
+
+                ### Read runs, coalescing adjacent runs, into one buffer
+                buf = numpy.empty(nb*nl*runBytes,dtype=numpy.uint8)
+                breaks = numpy.flatnonzero(lineStarts[1:] != lineStarts[:-1] + runBytes) + 1
+                first = numpy.concatenate(([0],breaks,))
+                last = numpy.concatenate((breaks,[len(lineStarts)],))
+                f = open(layout['fn'],'rb')
+                try:
+                    for i,j in zip(first,last):
+                        f.seek(int(lineStarts[i]))
+                        buf[i*runBytes:j*runBytes] = numpy.frombuffer( \
+                          f.read((j-i)*runBytes),dtype=numpy.uint8)
+                finally:
+                    f.close()
+                runStrides = (nl*runBytes,runBytes,)
+
+            runStrides = runStrides[3-nDim:2]
+
+            if ns:
+                data = numpy.ndarray(outShape,dtype=layout['dtype'],buffer=buf \
+                                    , offset=sampleStart-runStart \
+                                    , strides=runStrides+(bytpp*sStep,))
+            else:
+                data = numpy.empty(outShape,dtype=layout['dtype'])
+
+            pfxRaw = None
+            sfxRaw = None
+            if pfxb:
+                pfxRaw = numpy.ndarray(outShape[:-1]+(pfxb,),dtype=numpy.int8 \
+                                      , buffer=buf, offset=0 \
+                                      , strides=runStrides+(1,))
+            if sfxb:
+                sfxRaw = numpy.ndarray(outShape[:-1]+(sfxb,),dtype=numpy.int8 \
+                                      , buffer=buf, offset=runBytes-sfxb \
+                                      , strides=runStrides+(1,))
+
+            ### Reads:  contiguous, native byte order, like getObjectData
+            if not memmap:
+                data = data.astype(layout['dtype'].newbyteorder('='))
+                if pfxRaw is not None: pfxRaw = pfxRaw.copy()
+                if sfxRaw is not None: sfxRaw = sfxRaw.copy()
+
+        except:
+            return None, sys.exc_info(), None
+
+        return data, pfxRaw, sfxRaw
+
+
     ####################################################################
 
     def getPDSFile(self, fn):
@@ -435,13 +672,38 @@ class PDSImage:
         self._LINENUM = 0
         self._pointers = {}
 
-        f = open(fn, 'rb')
-        f.seek(0,2)
-        if f.tell() <= self._seek: return # Empty file
-        f.seek(self._seek)
+        state = self._cache and self._cache.get(fn, self._seek)
+
+        if state and set(self._CACHED+('_index',)) <= set(state):
+            for k in self._CACHED:
+                setattr(self, k, state[k])
+            ### Flat index was pickled with ._attribs; see _buildIndex()
+            self._index = state['_index']
+            self._indexOf = self._attribs
+            self._memo = {}
 
-        self._attribs = self._downone( f)
-        f.close()
+        else:
+            f = open(fn, 'rb')
+            try:
+                f.seek(0,2)
+                if f.tell() <= self._seek: return # Empty file
+                ### Label lines are read from a map of the file; see listfauxfile
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            finally:
+                f.close()
+
+            faux = listfauxfile.BUFFER(mm)
+            faux.seek(self._seek)
+            self._attribs = self._downone( faux)
+            faux.close()
+            mm.close()
+
+            self._buildIndex()
+
+            if self._cache:
+                state = dict([(k,getattr(self, k)) for k in self._CACHED])
+                state['_index'] = self._index
+                self._cache.put(fn, self._seek, state)
 
         self._dim = (self.getAttribs('/image/line_samples'),self.getAttribs('/image/lines'))
 
@@ -451,112 +713,192 @@ class PDSImage:
     ####################################################################
 
     def _downone( self, f):
-        """Recursive PDS label parser"""
-
-        foundEND=0
-        foundEND_GO=0
-
-        thisObjGrp={}
-
-        while 1:
+        """PDS label parser
+
+        Reads lines from f (readline/tell) up to END, or to the END_GROUP
+        or END_OBJECT closing the current level, or to EOF.  Returns the
+        nested dict of GROUPs, OBJECTs and attributes:  repeated GROUPs
+        or OBJECTs become lists, counted by '**listCOUNT@<name>' keys;
+        '**foundEND' of each dict is 'TOP' (closed by END), 'NOTTOP'
+        (closed by END_GROUP/END_OBJECT) or 'NONE' (EOF).
+
+        Iterative, with an explicit stack of open GROUPs and OBJECTs, and
+        precompiled patterns; the raw label is appended to _RawPDSLabel
+        as one string at the end.
+        """
 
-            lastTell = f.tell()
-            fullline = f.readline()
-            if "PDSIMAGE_DEBUG" in os.environ: sys.stdout.write( fullline)
-            if lastTell == f.tell():
+        debug = "PDSIMAGE_DEBUG" in os.environ
+        numberMatch = self.numberRe.match
+        readline = f.readline
+        tell = f.tell
+        rawLines = []
+        addRaw = rawLines.append
+
+        top = {}
+        stack = [top]
+        thisObjGrp = top
+
+        while stack:
+
+            lastTell = tell()
+            fullline = readline()
+            if debug: sys.stdout.write( fullline)
+            if lastTell == tell():
+                ### EOF:  close all open levels
+                for objGrp in stack: objGrp['**foundEND'] = 'NONE'
                 break
-            self._RawPDSLabel += fullline
+            addRaw(fullline)
             l = fullline.split()
 
             self._LINENUM += 1
-            # Exit if this is actually a VICAR file...
-            if self._LINENUM == 1 and (l+[''])[0][:7] == 'LBLSIZE':
-                break
+            # Exit this level if this is actually a VICAR file...
+            if self._LINENUM == 1 and l and l[0][:7] == 'LBLSIZE':
+                stack.pop()['**foundEND'] = 'NONE'
+                thisObjGrp = stack and stack[-1]
+                continue
 
             # Skip blank lines and comments
             if not l:
                 continue
-            if l[0][:2] == '/*':
+            l0 = l[0]
+            if l0[:2] == '/*':
+                continue
+            nl = len(l)
+            if nl > 1 and l[1][:2] == '/*':
+                l = l[:1]
+                nl = 1
+
+            # End of header, or of this GROUP or OBJECT?
+            if nl == 1 and l0 == 'END':
+                stack.pop()['**foundEND'] = 'TOP'
+                thisObjGrp = stack and stack[-1]
+                continue
+            if l0 == 'END_GROUP' or l0 == 'END_OBJECT':
+                stack.pop()['**foundEND'] = 'NOTTOP'
+                thisObjGrp = stack and stack[-1]
                 continue
-            if len(l)>1 and l[1][:2] == '/*':
-              l = l[:1]
-
-            # End of header?
-            if len(l) == 1 and l[0] == 'END':
-                foundEND=1
-                break
-            if l[0] == 'END_GROUP' or l[0] == 'END_OBJECT':
-                foundEND_GO=1
-                break
 
-            # Where is the IMAGE?
-            if len(l) > 2 and l[0] == 'RECORD_BYTES':
-                self._rb = self.getAttribs('RECORD_BYTES')
-            if len(l) > 2 and l[0] == 'LABEL_RECORDS':
-                lr = int(l[2])
-            if len(l) > 2 and l[0][0] == '^' :
-                self._pointers[l[0][1:]] = l[2]
-
-            # Flatten lines
-            if  len(l) > 2 and  l[1] == '=' and l[2][0] == '"':
-                if len(l[2]) == 1 and len(l) == 3:
-                    l[2] += ' '
-                while l[-1][-1] != '"':
-                    lastTell=f.tell()
-                    fullline = f.readline()
-                    if lastTell==f.tell():
-                        break
-                    self._RawPDSLabel += fullline
-                    l += fullline.split()
-                if l[2] == '" ':
-                    l[2] = '"'
-                l[2] = string.join(l[2:])[1:-1]
-                l = l[:3]    
-            if  len(l) > 2 and  l[1] == '=' and l[2][0] == '(':
-                while l[-1][-1] != ')':
-                    lastTell=f.tell()
-                    fullline = f.readline()
-                    if lastTell==f.tell():
-                        break
-                    self._RawPDSLabel += fullline
-                    l += fullline.split()
-                l[2] = string.join(l[2:])[1:-1]
-                l = l[:3]
+            if nl > 2:
+
+                # Where is the IMAGE?
+                if l0[0] == '^':
+                    self._pointers[l0[1:]] = l[2]
+
+                # Flatten quoted and parenthesized values
+                if l[1] == '=':
+                    l2 = l[2]
+                    if l2[0] == '"':
+                        if l2 == '"' and nl == 3:
+                            l[2] = '" '
+                        while l[-1][-1] != '"':
+                            lastTell = tell()
+                            fullline = readline()
+                            if lastTell == tell():
+                                break
+                            addRaw(fullline)
+                            l += fullline.split()
+                        if l[2] == '" ':
+                            l[2] = '"'
+                        l = [l0, '=', ' '.join(l[2:])[1:-1]]
+                    elif l2[0] == '(':
+                        while l[-1][-1] != ')':
+                            lastTell = tell()
+                            fullline = readline()
+                            if lastTell == tell():
+                                break
+                            addRaw(fullline)
+                            l += fullline.split()
+                        l = [l0, '=', ' '.join(l[2:])[1:-1]]
 
             # Drill down into GROUPs and OBJECTs
-            if l[0] == "GROUP" or l[0] == "OBJECT":
-                kwd=l[2]
+            if l0 == "GROUP" or l0 == "OBJECT":
+                kwd = l[2]
+                child = {}
                 if kwd in thisObjGrp:
                     if type(thisObjGrp[kwd]) is dict:
                         thisObjGrp[kwd] = [ thisObjGrp[kwd] ]
                         thisObjGrp['**listCOUNT@'+kwd] = 1
-                    thisObjGrp[kwd] += [self._downone( f)]
+                    thisObjGrp[kwd] += [child]
                     thisObjGrp['**listCOUNT@'+kwd] += 1
                 else:
-                    thisObjGrp[kwd] = self._downone( f)
+                    thisObjGrp[kwd] = child
+                stack.append(child)
+                thisObjGrp = child
+
+            # Add to attributes of this level; convert numbers
+            elif nl > 2 and l0 != 'END':
+                value = l[2]
+                mo = numberMatch(value)
+                if mo:
+                    if mo.group(1) is None and mo.group(2) is None:
+                        value = int(value)
+                    else:
+                        value = float(value)
+                thisObjGrp[l0] = value
+                if l0 == 'RECORD_BYTES':
+                    self._rb = value
+
+        self._RawPDSLabel += ''.join(rawLines)
+
+        return top
+
+
+    def _buildIndex(self):
+        """Build flat index of ._attribs:  path tuple => value
+
+        Path tuples hold upper-case GROUP/OBJECT/attribute names, and
+        list indices as ints, e.g. ('IMAGE','LINES') or ('SUB',0,'X');
+        every GROUP, OBJECT, list and attribute has an entry.  Rebuilt by
+        getAttribs() whenever ._attribs is replaced.
+        """
 
-            # Add to top level attributes
+        index = {}
+        todo = [ ((), self._attribs) ]
+        while todo:
+            prefix, obj = todo.pop()
+            if type(obj) is dict:
+                items = obj.items()
             else:
-                if len(l) > 2 and l[0] != "END_GROUP" and l[0] != "END_OBJECT" and l[0] != "END":
-                    if re.match(r"^[\-\+]?([0-9]*\.)?[0-9]+([eE][\-\+]?[0-9]+)?\b$", l[2]):
-                        if re.search(r"[.Ee]", l[2]):
-                            l[2] = float(l[2])
-                        elif (decimal.Decimal(l[2]) - int(decimal.Decimal(l[2]))) != 0:
-                            l[2] = float(l[2])
-                        else:
-                            l[2] = int(decimal.Decimal(l[2]))
-                    if len(l) > 2:# and l[2] not in self._NF:
-                        thisObjGrp[l[0]] = l[2]
-
-
-        if foundEND == 1:
-          thisObjGrp['**foundEND']='TOP'
-        elif foundEND_GO == 1:
-          thisObjGrp['**foundEND']='NOTTOP'
-        else:
-          thisObjGrp['**foundEND']='NONE'
+                items = enumerate(obj)
+            for k, v in items:
+                key = prefix + (k,)
+                index[key] = v
+                if type(v) is dict or type(v) is list:
+                    todo.append((key, v))
+
+        self._index = index
+        self._indexOf = self._attribs
+        self._memo = {}
+
+
+    def _pathKey(self, e):
+        """Convert getAttribs() search string to path tuple of flat index"""
+
+        if e[:1] == '/':
+            e = e[1:]
+        key = []
+        for i in e.split('/'):
+            if i[:2] == '**':
+                iAtsign = i.find('@')
+                if iAtsign > -1:
+                    i = i[:iAtsign] + i[iAtsign:].upper()
+            else:
+                i = i.upper()
+            if len(i) > 2 and i[:1] == '[' and i[-1:] == ']':
+                i = ast.literal_eval(i[1:-1])    ### e.g. [0] => 0
+            key.append(i)
+        return tuple(key)
+
+
+    def _walk(self, obj, key):
+        """Look up path tuple by walking dicts and lists; None if absent"""
 
-        return thisObjGrp
+        try:
+            for k in key:
+                obj = obj[k]
+        except:
+            return None
+        return obj
 
 
     def getAttribs(self, e=''):
@@ -567,60 +909,172 @@ class PDSImage:
 
         For member of PDS GROUP or OBJECT, separate GROUP name 
         and GROUP MEMBER name with '/'.  For instance, 
-        'image/bands' (or even '/image/bands').
+        'image/bands' (or even '/image/bands').  Element n of a
+        repeated GROUP or OBJECT is .../[n].
+
+        Without arguments, returns header as a dictionary.  Returns None
+        if the search string is not found.
 
-        Without arguments, returns header as a dictionary.  
+        Lookups are memoized, and use a flat index of the header built
+        from ._attribs; see _buildIndex().
         """
-        s = 'self._attribs'
         if e == '':
             return self._attribs
+
+        if self._indexOf is not self._attribs:
+            self._buildIndex()
+
+        try:
+            return self._memo[e]
+        except KeyError:
+            pass
+
+        try:
+            key = self._pathKey(e)
+        except:
+            key = None
+
+        if key is None:
+            x = None
+        elif key in self._index:
+            x = self._index[key]
         else:
-            if e[0] == '/':
-                e = e[1:]
-            ###l = e.upper().split('/')
-            l = e.split('/')
-            for i in l:
-                if i[:2] == '**':
-                  iAtsign = i.find('@')
-                  if iAtsign > -1:
-                    i = i[:iAtsign] + i[iAtsign:].upper()
-                else:
-                  i=i.upper()
-                if len(i) < 3 or i[:1] != '[' or i[-1:] != ']':
-                  i='[\''+i+'\']'
-                s = '%s%s' % (s, i)
-            try:
-                x = eval(s)
-            except:
-                x = None    ### Was ''
-            return x
+            ### e.g. negative list index
+            x = self._walk(self._attribs, key)
+
+        self._memo[e] = x
+        return x
+
+    def extractAttribs(self, label, paths):
+        """Selective, early-exit header query of an in-memory label
+
+        Arguments:
+        label -- ODL label:  file-like object with readline, tell and
+                 seek, e.g. listfauxfile.BUFFER; or str, bytes or other
+                 buffer, which is wrapped in a listfauxfile.BUFFER
+        paths -- list of getAttribs() search strings of attributes, e.g.
+                 'INVENTORYMETADATA/RANGEDATETIME/RANGEBEGINNINGDATE/VALUE'
+
+        Returns list of values, one per path.
+
+        Reads label line by line, tracking only the names of open GROUPs
+        and OBJECTs, and stops as soon as all paths have been found; a
+        repeated GROUP or OBJECT gives the values of its first instance.
+
+        Falls back to the full parser, ._attribs = ._downone(...), and
+        getAttribs(), for paths with '[n]' or '**' components, and paths
+        that are not found or are GROUPs or OBJECTs.
+        """
+
+        if not hasattr(label, 'readline'):
+            if not isinstance(label, bytes):
+                label = label.encode('latin-1')
+            label = listfauxfile.BUFFER(label)
+
+        start = label.tell()
+        keys = [self._pathKey(e) for e in paths]
+        found = {}
+
+        for key in keys:
+            for k in key:
+                if type(k) is not str or k[:2] == '**':
+                    return self._extractFull(label, start, paths)
+
+        numberMatch = self.numberRe.match
+        readline = label.readline
+        stack = []
+
+        while len(found) < len(keys):
+
+            fullline = readline()
+            if not fullline:
+                break
+            l = fullline.split()
+
+            if not l or l[0][:2] == '/*':
+                continue
+            l0 = l[0]
+            if len(l) > 1 and l[1][:2] == '/*':
+                l = l[:1]
+
+            if (len(l) == 1 and l0 == 'END') or l0 == 'END_GROUP' or l0 == 'END_OBJECT':
+                if not stack:
+                    break
+                stack.pop()
+                continue
+
+            if len(l) < 3:
+                continue
+
+            # Flatten quoted and parenthesized values, as _downone() does
+            value = l[2]
+            if l[1] == '=' and value[0] in '"(':
+                close = value[0] == '"' and '"' or ')'
+                if value == '"' and len(l) == 3:
+                    l[2] = '" '
+                while l[-1][-1] != close:
+                    fullline = readline()
+                    if not fullline:
+                        break
+                    l += fullline.split()
+                if l[2] == '" ':
+                    l[2] = '"'
+                value = ' '.join(l[2:])[1:-1]
+
+            key = tuple(stack) + (l0,)
+
+            if l0 == "GROUP" or l0 == "OBJECT":
+                if tuple(stack) + (value,) in keys:
+                    break    ### GROUP or OBJECT requested:  full parser
+                stack.append(value)
+                continue
+
+            if key in keys and key not in found:
+                mo = numberMatch(value)
+                if mo:
+                    if mo.group(1) is None and mo.group(2) is None:
+                        value = int(value)
+                    else:
+                        value = float(value)
+                found[key] = value
+
+        if len(found) < len(keys):
+            return self._extractFull(label, start, paths)
+
+        return [found[key] for key in keys]
+
+
+    def _extractFull(self, label, start, paths):
+        """extractAttribs() fallback:  parse all of label, query paths"""
+
+        self._LINENUM = 0
+        self._pointers = {}
+        label.seek(start)
+        self._attribs = self._downone(label)
+
+        return [self.getAttribs(e) for e in paths]
+
 
     def getRawPDSLabel(self):
         return self._RawPDSLabel
 
     def getAttribsDrilldown(self, attribArg=None, skipIfNone=False, e=''):
+        """Query dict attribArg (default ._attribs) with search string e"""
 
         if attribArg is None:
             if skipIfNone is True:
                 return None
-            return getAttribsDrillDown( attribArg=self._attribs, skipIfNone=True, e=e)
+            attribArg = self._attribs
 
         if e == '':
             return attribArg
 
         try:
-            l = e.upper().split('/')
-            for i in l:
-                if i == '':
-                    continue
-                ks=attribs.keys()
-                if i in ks:
-                  s = '%s[\'%s\']' % (s, i)
-                x = eval(s)
+            key = self._pathKey(e)
         except:
-            return self.getAttribsDrilldown( attribArg=None)
+            return None
 
-        return self.getAttribsDrilldown( attribArg=None)
+        return self._walk(attribArg, key)
 
 
     def getDimensions(self):
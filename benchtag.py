@@ -0,0 +1,207 @@
+"""
+benchtag.py - Stage-level benchmark of the tag.py pipeline
+
+Writes a synthetic TOMS/EP granule (synthtoms.py), then times each stage
+of tag.py on it, repeatedly:
+
+  read      - HDF5 read of the geolocation fields (tag.readgeolocation)
+  metadata  - CoreMetadata start time extraction (tag.starttime)
+  odlparse  - full CoreMetadata ODL parse via PDSImage._downone
+  sun       - Sun unit vectors for all rows, cold cache (tag.sunvectors)
+  glint     - glint angle calculation (glintvec.glintangles)
+  copy      - copy of all top level groups to a new file (tag.copygroups)
+  write     - GlintAngle dataset creation and file close
+
+Runs offline, using only the kernels in this directory:  if de432s.bsp
+is absent, the stand-in Sun ephemeris of sunephem.py (approxsun) is used
+in place of spkezr.
+
+Results are written as one JSON document (--output), with the minimum
+and median time of each stage, and can be compared with the results of
+an earlier run, e.g. from another commit (--compare).
+
+Usage:
+
+  python benchtag.py [--rows=750] [--pixels=35] [--repeat=5]
+                     [--metadata-attributes=0]
+                     [--output=bench_results.json] [--compare=OLD.json]
+
+"""
+
+import os
+import sys
+import json
+import time
+import h5py
+import numpy
+import spice
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import tag
+import PDSImage
+import glintvec
+import kernelpool
+import sunephem
+import synthtoms
+import utcet
+
+### Directory of this script and of the kernels
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = ['read','metadata','odlparse','sun','glint','copy','write']
+
+
+########################################################################
+def setup():
+  """Load kernels from this directory, set up tag.py module globals
+
+     Returns name of Sun ephemeris source
+  """
+  for kernel in ('naif0011.tls','pck00010.tpc',):
+    spice.furnsh(os.path.join(HERE,kernel))
+  utcet.load(os.path.join(HERE,'naif0011.tls'))
+
+  spk = os.path.join(HERE,'de432s.bsp')
+  if os.path.exists(spk): spice.furnsh(spk)
+
+  tag.re,tag.rp = kernelpool.earthradii(os.path.join(HERE,'pck00010.tpc'))
+  tag.options = tag.makeparser().parse_args([])
+
+  return os.path.exists(spk) and 'de432s.bsp' or 'stand-in'
+
+
+########################################################################
+def gitcommit():
+  """Current git commit of this directory, or None"""
+  try:
+    devnull = open(os.devnull,'w')
+    return subprocess.check_output(['git','rev-parse','HEAD'],cwd=HERE,stderr=devnull).decode('ascii').strip()
+  except:
+    return None
+
+
+########################################################################
+def runonce(fnInput,fnOutput,standin):
+  """Time each stage once; return dict of stage => seconds"""
+
+  seconds = {}
+  def timed(stage,function,*args):
+    t0 = time.time()
+    rtn = function(*args)
+    seconds[stage] = time.time() - t0
+    return rtn
+
+  fInput = h5py.File(fnInput,'r')
+
+  tomsOffsetTimes,surfLatDegs,surfLonDegs,scAltKms,scLatDegs,scLonDegs = timed('read',tag.readgeolocation,fInput)
+
+  firstTomsUTC = timed('metadata',tag.starttime,fInput)
+
+  def odlparse():
+    return PDSImage.PDSImage()._downone(tag.metadatafile(fInput))
+
+  timed('odlparse',odlparse)
+
+  tomsZeroEpoch = utcet.utc2et(firstTomsUTC) - tomsOffsetTimes[0]
+
+  ### New ephemeris every time:  cold cache, as for the first granule
+  tag.sunEphemeris = sunephem.SunEphemeris(standin=standin)
+  uvEarth2Suns = timed('sun',tag.sunvectors,tomsZeroEpoch,tomsOffsetTimes)
+
+  glintAngles = timed('glint',glintvec.glintangles
+                     ,scAltKms,scLonDegs,scLatDegs,surfLonDegs,surfLatDegs,uvEarth2Suns,tag.re,tag.rp
+                     )
+
+  fOutput = h5py.File(fnOutput,'w')
+  timed('copy',tag.copygroups,fInput,fOutput)
+  fInput.close()
+
+  def write():
+    fOutput.create_dataset(tag.GLINTANGLE,data=glintAngles)
+    fOutput.close()
+
+  timed('write',write)
+
+  os.remove(fnOutput)
+
+  return seconds
+
+
+########################################################################
+def compare(results,fnOld):
+  """Print stage timings of results against those in file fnOld"""
+
+  old = json.load(open(fnOld))
+
+  sys.stdout.write('%-10s %12s %12s %8s\n' % ('stage','old median','new median','new/old',))
+  for stage in STAGES + ['total']:
+    if stage not in old['stages']: continue
+    o = old['stages'][stage]['median']
+    n = results['stages'][stage]['median']
+    sys.stdout.write('%-10s %11.6fs %11.6fs %8.3f\n' % (stage,o,n,o and n/o or 0.,))
+
+
+########################################################################
+def main(argv):
+
+  parser = argparse.ArgumentParser(description='Benchmark tag.py stages on a synthetic granule')
+  parser.add_argument('--rows',type=int,default=synthtoms.NROWS,help='Rows (scans) in synthetic granule')
+  parser.add_argument('--pixels',type=int,default=synthtoms.NPIXELS,help='Pixels per row')
+  parser.add_argument('--metadata-attributes',type=int,default=0,help='Extra CoreMetadata containers')
+  parser.add_argument('--repeat',type=int,default=5,help='Number of timed runs')
+  parser.add_argument('--output',default='bench_results.json',help='Results file (JSON)')
+  parser.add_argument('--compare',default=None,metavar='OLD.json',help='Compare with earlier results file')
+  options = parser.parse_args(argv)
+
+  ephemeris = setup()
+
+  tmpDir = tempfile.mkdtemp(prefix='benchtag')
+  try:
+    fnInput = synthtoms.writegranule(os.path.join(tmpDir,'bench.he5'),options.rows,options.pixels
+                                    ,extraMetadata=options.metadata_attributes
+                                    )
+    fnOutput = os.path.join(tmpDir,'bench_glint.he5')
+    runs = [runonce(fnInput,fnOutput,ephemeris=='stand-in') for i in range(options.repeat)]
+    inputBytes = os.path.getsize(fnInput)
+  finally:
+    shutil.rmtree(tmpDir)
+
+  for run in runs: run['total'] = sum([run[stage] for stage in STAGES])
+
+  results = dict(commit=gitcommit()
+                ,date=time.strftime('%Y-%m-%dT%H:%M:%S')
+                ,host=platform.node()
+                ,python=platform.python_version()
+                ,numpy=numpy.__version__
+                ,h5py=h5py.__version__
+                ,sunephemeris=ephemeris
+                ,rows=options.rows
+                ,pixels=options.pixels
+                ,metadataattributes=options.metadata_attributes
+                ,inputbytes=inputBytes
+                ,repeat=options.repeat
+                ,stages=dict([(stage,dict(min=min([run[stage] for run in runs])
+                                         ,median=float(numpy.median([run[stage] for run in runs]))
+                                         ,)
+                              ) for stage in STAGES + ['total']
+                             ])
+                )
+  results['pixelspersecond'] = options.rows * options.pixels / results['stages']['total']['median']
+
+  f = open(options.output,'w')
+  json.dump(results,f,indent=1,sort_keys=True)
+  f.write('\n')
+  f.close()
+
+  for stage in STAGES + ['total']:
+    sys.stdout.write('%-10s %11.6fs (min %.6fs)\n' % (stage,results['stages'][stage]['median'],results['stages'][stage]['min'],))
+  sys.stdout.write('%-10s %11.0f\n' % ('pixels/s',results['pixelspersecond'],))
+
+  if options.compare: compare(results,options.compare)
+
+
+if __name__=="__main__":
+  main(sys.argv[1:])
@@ -1,17 +1,167 @@
 import sys
+import numpy
+import argparse
 import spice
+import glintvec
+import kernelpool
 
 rpd,dpr = spice.rpd(),spice.dpr()
 
-if __name__=="__main__":
+### Batched streaming mode (--stream, or any binary --input/--output):
+###
+###   python glint.py --stream < glint.py
+###   python glint.py --input=npy --output=npy < points.npy > angles.npy
+###   python glint.py --input=raw --output=raw --dtype=float32 < points.f32 > angles.f32
+###
+### Text input is read in blocks of about --block-bytes, columns parsed
+### with NumPy and glint angles calculated per block (glintvec.py);
+### output text is the same as per-line mode.  Binary input records are
+### the 8 numeric columns (UTC is not used):  TOMS altitude (m),
+### longitude, latitude (deg), Earth-Sun vector (ECEF), surface
+### longitude, latitude (deg); .npy arrays are shaped (N,8).  Binary
+### output is one glint angle (deg) per record, 999.9 where the surface
+### point is dark; .npy output of text input is written at the end.
+
+### Number of numeric input columns
+NCOLUMNS = 8
+
+### Text output
+DARKTEXT = 'Surface point is dark'
+LEGEND = '=Inputs[TOMS(alt,lon,lat),(Earth2Sun),Surface(lon,lat),UTC],GlintAngle'
+
+
+########################################################################
+def textblocks(stream,blockBytes):
+  """Yield (stripped lines, (n,NCOLUMNS) float64 array) of data: lines"""
+  prefix = 'data:'
+  while True:
+    lines = stream.readlines(blockBytes)
+    if not lines: return
+    linestrips = [line[5:].strip() for line in lines if line[:5]==prefix]
+    if not linestrips: continue
+    values = numpy.array([linestrip.split()[:NCOLUMNS] for linestrip in linestrips],dtype=numpy.float64)
+    yield linestrips,values
+
+
+def readfully(stream,nBytes):
+  """Read up to nBytes, fewer only at end of stream"""
+  chunks = []
+  while nBytes > 0:
+    chunk = stream.read(nBytes)
+    if not chunk: break
+    chunks.append(chunk)
+    nBytes -= len(chunk)
+  return b''.join(chunks)
+
+
+def npyheader(stream):
+  """Read .npy header of (N,NCOLUMNS) array; return (N, dtype,)"""
+  version = numpy.lib.format.read_magic(stream)
+  if version == (1,0):
+    shape,fortranOrder,dtype = numpy.lib.format.read_array_header_1_0(stream)
+  else:
+    shape,fortranOrder,dtype = numpy.lib.format.read_array_header_2_0(stream)
+  if fortranOrder or len(shape)!=2 or shape[1]!=NCOLUMNS:
+    raise ValueError('Input .npy array must be C-ordered, shape (N,%d); got %s' % (NCOLUMNS,shape,))
+  return shape[0],dtype
+
+
+def binaryblocks(stream,dtype,blockRecords):
+  """Yield (None, (n,NCOLUMNS) float64 array) of binary input records"""
+  recordBytes = NCOLUMNS * dtype.itemsize
+  while True:
+    raw = readfully(stream,blockRecords*recordBytes)
+    if len(raw) % recordBytes:
+      raise ValueError('Input ends within a record')
+    if not raw: return
+    yield None,numpy.frombuffer(raw,dtype=dtype).reshape((-1,NCOLUMNS)).astype(numpy.float64)
+
+
+########################################################################
+def glintblock(values,re,rp):
+  """Glint angles, degrees, float64, of (n,NCOLUMNS) input records"""
+  return glintvec.glintangles(1e-3*values[:,0],values[:,1],values[:,2]
+                             ,values[:,6],values[:,7]
+                             ,glintvec.vhat(values[:,3:6])
+                             ,re,rp
+                             ,dtype=numpy.float64
+                             )
+
+
+def streammain(options,re,rp):
+  """Batched streaming mode"""
+
+  textIn = options.input == 'text'
+  textOut = options.output == 'text'
+  dtype = numpy.dtype(options.dtype)
+
+  stdin = sys.stdin
+  if not textIn: stdin = getattr(sys.stdin,'buffer',sys.stdin)
+  stdout = sys.stdout
+  if not textOut: stdout = getattr(sys.stdout,'buffer',sys.stdout)
+
+  count = None
+  if textIn:
+    blocks = textblocks(stdin,options.block_bytes)
+  elif options.input == 'npy':
+    count,inDtype = npyheader(stdin)
+    blocks = binaryblocks(stdin,inDtype,options.block_records)
+  else:
+    blocks = binaryblocks(stdin,dtype,options.block_records)
+
+  ### .npy output:  write header now if record count is known, else keep
+  ### results until the end
+  keep = None
+  if options.output == 'npy':
+    if count is None:
+      keep = []
+    else:
+      numpy.lib.format.write_array_header_1_0(stdout,dict(descr=numpy.lib.format.dtype_to_descr(dtype)
+                                                         ,fortran_order=False
+                                                         ,shape=(count,)
+                                                         ))
+
+  for linestrips,values in blocks:
+
+    glintAngles = glintblock(values,re,rp)
+
+    if textOut:
+      if linestrips is None: linestrips = [' '.join(['%r' % v for v in row]) for row in values.tolist()]
+      stdout.write(''.join([angle==glintvec.DARK and ('%s  =>  %7s\n' % (linestrip,DARKTEXT,))
+                                                  or ('%s  =>  %7.2f %s\n' % (linestrip,angle,LEGEND,))
+                            for linestrip,angle in zip(linestrips,glintAngles.tolist())
+                           ]))
+    elif keep is None:
+      stdout.write(glintAngles.astype(dtype).tobytes())
+    else:
+      keep.append(glintAngles.astype(dtype))
+
+  if keep is not None:
+    numpy.save(stdout,numpy.concatenate(keep or [numpy.zeros(0,dtype=dtype)]))
+
+  stdout.flush()
+
 
-  spice.furnsh(__file__)
+if __name__=="__main__":
 
-  ### Earth equatorial and polar radii calculate flattening
-  re = spice.gdpool('BODY399_RADII',0,1)[1]
-  rp = spice.gdpool('BODY399_RADII',2,1)[1]
+  parser = argparse.ArgumentParser(description='Glint angles of data: lines on stdin')
+  parser.add_argument('--stream',action='store_true',default=False,help='Batched streaming mode')
+  parser.add_argument('--input',choices=('text','npy','raw',),default='text',help='Input format; binary implies --stream')
+  parser.add_argument('--output',choices=('text','npy','raw',),default='text',help='Output format; binary implies --stream')
+  parser.add_argument('--dtype',choices=('float64','float32',),default='float64',help='Raw input and binary output type')
+  parser.add_argument('--block-bytes',type=int,default=1<<20,help='Text input block size, bytes')
+  parser.add_argument('--block-records',type=int,default=65536,help='Binary input block size, records')
+  options = parser.parse_args()
+
+  ### Earth equatorial and polar radii calculate flattening; read from
+  ### the kernels of this meta-kernel, without loading the kernel pool
+  re,rp = kernelpool.earthradii(__file__)
   f = (re-rp) / re
 
+  if options.stream or options.input!='text' or options.output!='text':
+    streammain(options,re,rp)
+    sys.exit(0)
+
   for line in sys.stdin:
 
     ### Read one line of input at a time; only use lines that start with data:
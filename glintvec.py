@@ -0,0 +1,319 @@
+"""
+glintvec.py - Vectorized glint angle calculation for whole TOMS/EP swaths
+
+NumPy array equivalents of the scalar SPICE calls made per pixel by the
+original glintangle() function in tag.py:
+
+  georec(lon,lat,alt,re,f)  => spice.georec, geodetic to ECEF
+  recgeo(points,re,f)       => spice.recgeo, ECEF to geodetic
+  surfnm(re,rp,points)      => spice.surfnm(re,re,rp,point), unit normal
+  vhat(v)                   => spice.vhat
+  vsep(u,v)                 => spice.vsep, using the same 2*asin() form
+
+Vectors are arrays with a trailing axis of length 3 (X,Y,Z); all other
+axes broadcast in the usual NumPy way.
+
+Tolerance:  compared against the per-pixel SPICE calculation over full
+swaths, ECEF vectors agree to 1e-14 relative, and glint angles agree to
+better than 1e-10 degree before the cast to float32, so the float32
+GlintAngle output is identical, except possibly by one ULP for a pixel
+within 1e-10 degree of a float32 rounding boundary.
+
+geometry() computes the glint angle and any of the other viewing and
+illumination angles in PRODUCTS from the same ECEF vectors, normals and
+incidence cosines, in one pass.  With a mask, only the selected pixels
+are computed, as a 1-D batch; all products are DARK elsewhere.
+
+daylit() is the inexpensive day-side test used to build such masks:
+the geodetic surface normal is (cos lat cos lon, cos lat sin lon,
+sin lat), so the incidence cosine needs no ECEF vectors.
+
+Usage:
+
+  import glintvec
+  glintAngles = glintvec.glintangles(scAltKms,scLonDegs,scLatDegs
+                                    ,surfLonDegs,surfLatDegs
+                                    ,uvEarth2Suns,re,rp
+                                    )
+  angles = glintvec.geometry(scAltKms,scLonDegs,scLatDegs
+                            ,surfLonDegs,surfLatDegs
+                            ,uvEarth2Suns,re,rp
+                            ,products=('GlintAngle','SolarZenithAngle','ScatteringAngle',)
+                            )
+  lit = glintvec.daylit(surfLonDegs,surfLatDegs,uvEarth2Suns)
+  angles = glintvec.geometry(...,mask=lit)
+
+"""
+
+import numpy
+
+### Glint angle for surface points on the dark side (Sun below horizon)
+DARK = 999.9
+
+### daylit():  pixels with incidence cosines above -DAYMARGIN are kept,
+### so rounding differences from geometry() never drop a lit pixel
+DAYMARGIN = 1e-9
+
+### Products of geometry(), degrees; names as TOMS Geolocation Fields:
+###   GlintAngle            specular reflection to spacecraft; DARK where
+###                         the Sun is at or below the horizon
+###   SolarZenithAngle      surface normal to Sun
+###   ViewingZenithAngle    surface normal to spacecraft
+###   SolarAzimuthAngle     Sun, clockwise from North, [0,360)
+###   ViewingAzimuthAngle   spacecraft, clockwise from North, [0,360)
+###   RelativeAzimuthAngle  |Solar - Viewing azimuth|, [0,180]
+###   ScatteringAngle       incident sunlight to spacecraft direction;
+###                         180 is backscatter
+PRODUCTS = ('GlintAngle'
+           ,'SolarZenithAngle','ViewingZenithAngle'
+           ,'SolarAzimuthAngle','ViewingAzimuthAngle','RelativeAzimuthAngle'
+           ,'ScatteringAngle'
+           )
+
+rpd = numpy.pi / 180.
+dpr = 180. / numpy.pi
+
+
+########################################################################
+def vnorm(v):
+  """Magnitudes of vectors along last axis"""
+  return numpy.sqrt((v*v).sum(axis=-1))
+
+
+########################################################################
+def vhat(v):
+  """Unit vectors along last axis; zero vectors are returned as zero"""
+  v = numpy.asarray(v,dtype=numpy.float64)
+  mag = vnorm(v)[...,numpy.newaxis]
+  return v / numpy.where(mag>0.,mag,1.)
+
+
+########################################################################
+def vsep(u,v):
+  """Angular separation, radians, between vectors along last axis
+
+     Same formulation as SPICE VSEP, which stays accurate near 0 and pi
+  """
+  uu,vv = vhat(u),vhat(v)
+  dot = (uu*vv).sum(axis=-1)
+  return numpy.where(dot > 0.
+                    ,2. * numpy.arcsin(numpy.minimum(.5*vnorm(uu-vv),1.))
+                    ,numpy.pi - 2. * numpy.arcsin(numpy.minimum(.5*vnorm(uu+vv),1.))
+                    )
+
+
+########################################################################
+def georec(lon,lat,alt,re,flattening):
+  """Geodetic (radians, radians, km) to ECEF vectors (km)
+
+     Closed form; same result as spice.georec
+  """
+  lon,lat,alt = numpy.broadcast_arrays(*[numpy.asarray(a,dtype=numpy.float64) for a in (lon,lat,alt,)])
+  e2 = flattening * (2. - flattening)      ### Eccentricity squared
+  slat = numpy.sin(lat)
+  clat = numpy.cos(lat)
+  n = re / numpy.sqrt(1. - e2*slat*slat)   ### Prime vertical radius of curvature
+  rxy = (n + alt) * clat
+  return numpy.stack((rxy*numpy.cos(lon),rxy*numpy.sin(lon),(n*(1.-e2)+alt)*slat,),axis=-1)
+
+
+########################################################################
+def recgeo(points,re,flattening,tolerance=1e-14,maxIterations=20):
+  """ECEF vectors (km) to geodetic (radians, radians, km)
+
+     Returns lon,lat,alt; fixed-point iteration on latitude, to within
+     tolerance radian; same result as spice.recgeo
+  """
+  points = numpy.asarray(points,dtype=numpy.float64)
+  x,y,z = points[...,0],points[...,1],points[...,2]
+  e2 = flattening * (2. - flattening)      ### Eccentricity squared
+  p = numpy.hypot(x,y)
+  lon = numpy.arctan2(y,x)
+  lat = numpy.arctan2(z,p*(1.-e2))
+  for i in range(maxIterations):
+    slat = numpy.sin(lat)
+    n = re / numpy.sqrt(1. - e2*slat*slat) ### Prime vertical radius of curvature
+    latNew = numpy.arctan2(z + e2*n*slat,p)
+    converged = not latNew.size or numpy.abs(latNew-lat).max() <= tolerance
+    lat = latNew
+    if converged: break
+  slat = numpy.sin(lat)
+  alt = p*numpy.cos(lat) + z*slat - re*numpy.sqrt(1. - e2*slat*slat)
+  return lon,lat,alt
+
+
+########################################################################
+def surfnm(re,rp,points):
+  """Outward unit normals at points on ellipsoid with radii (re,re,rp)"""
+  return vhat(numpy.asarray(points,dtype=numpy.float64) / numpy.array([re*re,re*re,rp*rp]))
+
+
+########################################################################
+def _rowshape(a,ndim):
+  """Append length-1 axes to per-row array a to broadcast against ndim"""
+  a = numpy.asarray(a,dtype=numpy.float64)
+  return a.reshape(a.shape + (1,)*(ndim-a.ndim))
+
+
+########################################################################
+def glintangles(scAltKms,scLonDegs,scLatDegs
+               ,surfLonDegs,surfLatDegs
+               ,uvEarth2Suns
+               ,re,rp
+               ,dtype=numpy.float32
+               ):
+  """Glint angles, degrees, for a whole swath
+
+     Inputs:
+       S/C altitudes, Longitudes, Latitudes; one per row e.g. shape (nRows,)
+       Surface point Longitudes, Latitudes; e.g. shape (nRows,nPixels)
+       Earth-Sun unit vectors, ECEF; one per row, shape (nRows,3)
+       Earth equatorial and polar radii, km
+
+     Returns array shaped like surface point inputs; DARK (999.9) where
+     the Sun is at or below the horizon of the surface point
+  """
+  return geometry(scAltKms,scLonDegs,scLatDegs
+                 ,surfLonDegs,surfLatDegs
+                 ,uvEarth2Suns
+                 ,re,rp
+                 ,products=('GlintAngle',)
+                 ,dtype=dtype
+                 )['GlintAngle']
+
+
+########################################################################
+def geometry(scAltKms,scLonDegs,scLatDegs
+            ,surfLonDegs,surfLatDegs
+            ,uvEarth2Suns
+            ,re,rp
+            ,products=PRODUCTS
+            ,dtype=numpy.float32
+            ,mask=None
+            ):
+  """Glint angle and other viewing and illumination angles, degrees, for
+     a whole swath, from one set of ECEF vectors
+
+     Inputs as glintangles(); products is a sequence of PRODUCTS names;
+     mask, if not None, is a boolean array shaped like surface point
+     inputs, of the pixels to compute
+
+     Returns {product: array shaped like surface point inputs}; see
+     PRODUCTS for definitions; DARK where mask is False
+  """
+  if mask is not None:
+    return _maskedgeometry(scAltKms,scLonDegs,scLatDegs
+                          ,surfLonDegs,surfLatDegs
+                          ,uvEarth2Suns
+                          ,re,rp
+                          ,products,dtype,mask
+                          )
+
+  surfLonDegs = numpy.asarray(surfLonDegs,dtype=numpy.float64)
+  surfLatDegs = numpy.asarray(surfLatDegs,dtype=numpy.float64)
+  ndim = surfLonDegs.ndim
+  flattening = (re-rp) / re
+
+  ### Convert TOMS and surface points geodetic positions to ECEF vectors
+  tomsVecs = georec(rpd*_rowshape(scLonDegs,ndim)
+                   ,rpd*_rowshape(scLatDegs,ndim)
+                   ,_rowshape(scAltKms,ndim)
+                   ,re,flattening
+                   )
+  surfPoints = georec(rpd*surfLonDegs,rpd*surfLatDegs,0.,re,flattening)
+
+  ### Normals at surface points, ECEF unit vectors
+  uvSurfNormals = surfnm(re,rp,surfPoints)
+
+  ### Sun vectors, one per row; broadcast across pixels
+  uvSuns = numpy.asarray(uvEarth2Suns,dtype=numpy.float64)
+  uvSuns = uvSuns.reshape(uvSuns.shape[:1] + (1,)*(ndim-1) + (3,))
+
+  ### Cosines of incidence angles; surface-to-spacecraft vectors
+  mus = (uvSuns*uvSurfNormals).sum(axis=-1)
+  views = tomsVecs - surfPoints
+
+  results = {}
+
+  if 'GlintAngle' in products:
+    ### Specular reflection vectors
+    uvReflects = 2. * mus[...,numpy.newaxis] * uvSurfNormals - uvSuns
+    glintAngles = dpr * vsep(uvReflects,views)
+    results['GlintAngle'] = numpy.where(mus > 0.,glintAngles,DARK)
+
+  if 'SolarZenithAngle' in products: results['SolarZenithAngle'] = dpr * vsep(uvSurfNormals,uvSuns)
+  if 'ViewingZenithAngle' in products: results['ViewingZenithAngle'] = dpr * vsep(uvSurfNormals,views)
+  if 'ScatteringAngle' in products: results['ScatteringAngle'] = dpr * vsep(-uvSuns,views)
+
+  if [product for product in products if product.endswith('AzimuthAngle')]:
+
+    ### Local East and North unit vectors at surface points (geodetic)
+    lons,lats = rpd*surfLonDegs,rpd*surfLatDegs
+    slon,clon,slat,clat = numpy.sin(lons),numpy.cos(lons),numpy.sin(lats),numpy.cos(lats)
+    easts = numpy.stack((-slon,clon,0.*lons,),axis=-1)
+    norths = numpy.stack((-slat*clon,-slat*slon,clat,),axis=-1)
+
+    def azimuth(v): return (dpr * numpy.arctan2((v*easts).sum(axis=-1),(v*norths).sum(axis=-1))) % 360.
+
+    solarAzimuths = azimuth(uvSuns)
+    viewingAzimuths = azimuth(views)
+    relativeAzimuths = numpy.abs(solarAzimuths-viewingAzimuths)
+
+    if 'SolarAzimuthAngle' in products: results['SolarAzimuthAngle'] = solarAzimuths
+    if 'ViewingAzimuthAngle' in products: results['ViewingAzimuthAngle'] = viewingAzimuths
+    if 'RelativeAzimuthAngle' in products:
+      results['RelativeAzimuthAngle'] = numpy.where(relativeAzimuths > 180.,360.-relativeAzimuths,relativeAzimuths)
+
+  return dict([(product,result.astype(dtype),) for product,result in results.items()])
+
+
+def _maskedgeometry(scAltKms,scLonDegs,scLatDegs
+                   ,surfLonDegs,surfLatDegs
+                   ,uvEarth2Suns
+                   ,re,rp
+                   ,products,dtype,mask
+                   ):
+  """geometry() of the pixels selected by mask, as one 1-D batch of
+     pixels with per-pixel copies of the per-row inputs; DARK elsewhere
+  """
+  surfLonDegs = numpy.asarray(surfLonDegs)
+  shape,ndim = surfLonDegs.shape,surfLonDegs.ndim
+  mask = numpy.broadcast_to(numpy.asarray(mask,dtype=bool),shape)
+
+  results = dict([(product,numpy.empty(shape,dtype=dtype),) for product in products])
+  for result in results.values(): result.fill(DARK)
+  if not mask.any(): return results
+
+  def pixels(a): return numpy.broadcast_to(_rowshape(a,ndim),shape)[mask]
+
+  uvSuns = numpy.asarray(uvEarth2Suns,dtype=numpy.float64)
+  uvSuns = numpy.broadcast_to(uvSuns.reshape(uvSuns.shape[:1] + (1,)*(ndim-1) + (3,)),shape+(3,))[mask]
+
+  selected = geometry(pixels(scAltKms),pixels(scLonDegs),pixels(scLatDegs)
+                     ,surfLonDegs[mask],numpy.asarray(surfLatDegs)[mask]
+                     ,uvSuns
+                     ,re,rp
+                     ,products=products
+                     ,dtype=dtype
+                     )
+  for product,result in results.items(): result[mask] = selected[product]
+  return results
+
+
+########################################################################
+def daylit(surfLonDegs,surfLatDegs,uvEarth2Suns,margin=DAYMARGIN):
+  """Boolean array, shaped like surface point inputs, of pixels that
+     may be on the day side:  incidence cosine above -margin
+
+     Inputs as glintangles(); the geodetic normal is computed directly
+     from latitude and longitude, so this costs a fraction of geometry()
+  """
+  surfLonDegs = numpy.asarray(surfLonDegs,dtype=numpy.float64)
+  surfLatDegs = numpy.asarray(surfLatDegs,dtype=numpy.float64)
+  ndim = surfLonDegs.ndim
+  uvSuns = numpy.asarray(uvEarth2Suns,dtype=numpy.float64)
+  uvSuns = uvSuns.reshape(uvSuns.shape[:1] + (1,)*(ndim-1) + (3,))
+  lons,lats = rpd*surfLonDegs,rpd*surfLatDegs
+  clat = numpy.cos(lats)
+  mus = uvSuns[...,0]*clat*numpy.cos(lons) + uvSuns[...,1]*clat*numpy.sin(lons) + uvSuns[...,2]*numpy.sin(lats)
+  return mus > -margin
@@ -0,0 +1,197 @@
+"""
+kernelpool.py - Native reader of SPICE text kernel variables, with cache
+
+Reads selected variables from the \\begindata blocks of text kernels
+(PCK, LSK, meta-kernels), without SPICE:  e.g. only BODY399_RADII from
+the 4000-line pck00010.tpc.  Values are cached in a small pickle file
+per kernel, keyed by the SHA-1 checksum of the kernel, so short-lived
+processes and pool workers read them in about a millisecond.
+
+Kernel-pool-free mode:  earthradii() gets the Earth radii this way, so
+a process that needs only Earth constants (e.g. glint.py) need not load
+any kernels into SPICE.
+
+Values are lists:  numbers (with D or E exponents) as floats, quoted
+strings as str, @dates as numpy.datetime64; later assignments replace
+earlier ones, += appends, as in the SPICE kernel pool.
+
+The cache directory is $KERNELPOOL_CACHE, else ~/.cache/kernelpool;
+cache=False disables the cache.  Any cache failure is a cache miss.
+
+Usage:
+
+  import kernelpool
+  re,rp = kernelpool.earthradii()                      ### pck00010.tpc
+  re,rp = kernelpool.earthradii('tag.py')              ### via meta-kernel
+  values = kernelpool.getvalues('naif0011.tls',['DELTET/DELTA_AT'])
+
+"""
+
+import os
+import re
+import sys
+import numpy
+import pickle
+import hashlib
+
+### Default PCK, for earthradii()
+PCK = 'pck00010.tpc'
+
+MONTHS = dict([(m,i+1,) for i,m in enumerate('JAN FEB MAR APR MAY JUN JUL AUG SEP OCT NOV DEC'.split())])
+
+### \begindata and \begintext, alone on a line, delimit the data blocks
+BLOCKRE = re.compile(r'^[ \t]*\\(begindata|begintext)[ \t]*\r?$',re.MULTILINE)
+
+### Assignment:  NAME = value, NAME = ( values ), NAME += ...
+ASSIGNRE = re.compile(r"(\S+?)\s*(\+?=)\s*(\((?:'(?:[^']|'')*'|[^)'])*\)|'(?:[^']|'')*'|[^\s(]+)")
+TOKENRE = re.compile(r"'(?:[^']|'')*'|[^\s,()]+")
+
+### Binary kernels are skipped when expanding meta-kernels:  by their
+### NAIF file name extensions, unopened, else by their first bytes
+BINARYEXTENSIONS = ('.bsp','.bc','.bpc','.bds','.bes',)
+BINARY = (b'DAF/',b'DAS/',b'NAIF/DAF',)
+
+
+########################################################################
+def cachedir():
+  return os.environ.get('KERNELPOOL_CACHE') or os.path.join(os.path.expanduser('~'),'.cache','kernelpool')
+
+
+def _token(token):
+  """Kernel value token as float, str or numpy.datetime64"""
+  if token[:1] == "'":
+    return token[1:-1].replace("''","'")
+  if token[:1] == '@':
+    y,m,d = token[1:].split('-')[:3]
+    if not m.isdigit(): m = MONTHS[m.upper()[:3]]
+    return numpy.datetime64('%04d-%02d-%02d' % (int(y),int(m),int(d),),'ns')
+  return float(token.upper().replace('D','E'))
+
+
+def datablocks(text):
+  """Text of the \\begindata blocks of a text kernel"""
+  blocks = []
+  inData = False
+  position = 0
+  for mo in BLOCKRE.finditer(text):
+    if inData: blocks.append(text[position:mo.start()])
+    inData = mo.group(1) == 'begindata'
+    position = mo.end()
+  if inData: blocks.append(text[position:])
+  return blocks
+
+
+def parse(text,names=None):
+  """Variables of text kernel contents:  {name: [values]}
+
+     names -- if not None, only these variables are parsed and returned
+  """
+  wanted = names is not None and set(names) or None
+  values = {}
+  for block in datablocks(text):
+    for name,op,assignment in ASSIGNRE.findall(block):
+      if wanted is not None and name not in wanted: continue
+      items = [_token(t) for t in TOKENRE.findall(assignment)]
+      if op == '+=' and name in values:
+        values[name] = values[name] + items
+      else:
+        values[name] = items
+  return values
+
+
+########################################################################
+def _readkernel(fn):
+  f = open(fn,'rb')
+  data = f.read()
+  f.close()
+  return data
+
+
+def getvalues(fn,names,cache=None):
+  """Variables names of text kernel fn:  {name: [values]}
+
+     Variables not in the kernel are absent from the result; values are
+     read from, or added to, the cache file of the kernel's checksum
+  """
+  data = _readkernel(fn)
+  names = list(names)
+  if cache is False: return parse(data.decode('latin-1'),names)
+
+  fnCache = os.path.join(cache or cachedir(),hashlib.sha1(data).hexdigest() + '.pkl')
+
+  ### Cache:  {name: [values]} of names read so far; None if absent
+  cached = {}
+  try:
+    f = open(fnCache,'rb')
+    cached = pickle.load(f)
+    f.close()
+  except:
+    cached = {}
+
+  missing = [name for name in names if name not in cached]
+  if missing:
+    values = parse(data.decode('latin-1'),missing)
+    for name in missing: cached[name] = values.get(name)
+    try:
+      if not os.path.isdir(os.path.dirname(fnCache)): os.makedirs(os.path.dirname(fnCache))
+      fnTemp = '%s.%d.tmp' % (fnCache,os.getpid(),)
+      f = open(fnTemp,'wb')
+      pickle.dump(cached,f,2)
+      f.close()
+      os.rename(fnTemp,fnCache)
+    except:
+      pass
+
+  return dict([(name,cached[name],) for name in names if cached.get(name) is not None])
+
+
+########################################################################
+def kernelfiles(fn,cache=None):
+  """Text kernels of fn:  fn, or the KERNELS_TO_LOAD of meta-kernel fn
+
+     Relative kernel names are relative to the current directory, as for
+     spice.furnsh; binary kernels (see BINARYEXTENSIONS) and kernels that
+     do not exist are skipped, so e.g. a missing SPK does not prevent
+     reading the radii of a meta-kernel's PCK
+  """
+  toLoad = getvalues(fn,['PATH_VALUES','PATH_SYMBOLS','KERNELS_TO_LOAD'],cache)
+  if 'KERNELS_TO_LOAD' not in toLoad: return [fn]
+
+  symbols = dict(zip(toLoad.get('PATH_SYMBOLS',[]),toLoad.get('PATH_VALUES',[])))
+  files = []
+  for kernel in toLoad['KERNELS_TO_LOAD']:
+    for symbol,value in symbols.items(): kernel = kernel.replace('$'+symbol,value)
+    if os.path.splitext(kernel)[1].lower() in BINARYEXTENSIONS: continue
+    if not os.path.isfile(kernel): continue
+    f = open(kernel,'rb')
+    head = f.read(8)
+    f.close()
+    if not head.startswith(BINARY): files.append(kernel)
+  return files
+
+
+def earthradii(kernels=None,cache=None):
+  """Earth equatorial and polar radii, km, from BODY399_RADII
+
+     kernels -- text kernel or meta-kernel name, or list of names
+                (default PCK, in the current directory or next to this
+                file); the last assignment wins, as in the kernel pool
+  """
+  if kernels is None:
+    kernels = PCK
+    if not os.path.exists(kernels): kernels = os.path.join(os.path.dirname(os.path.abspath(__file__)),PCK)
+  if isinstance(kernels,str): kernels = [kernels]
+
+  radii = None
+  for kernel in kernels:
+    for fn in kernelfiles(kernel,cache):
+      radii = getvalues(fn,['BODY399_RADII'],cache).get('BODY399_RADII',radii)
+
+  if radii is None: raise KeyError('BODY399_RADII not found in %s' % (kernels,))
+  return radii[0],radii[2]
+
+
+if __name__=="__main__":
+  ### e.g. python kernelpool.py pck00010.tpc BODY399_RADII BODY399_PM
+  for name,values in sorted(getvalues(sys.argv[1],sys.argv[2:]).items()):
+    print('%s = %r' % (name,values,))
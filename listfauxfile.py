@@ -1,7 +1,8 @@
+import numpy
 
 nl='\n'
 class FILE:
-  def __init__(self,ss=''): 
+  def __init__(self,ss=''):
     self.lines = [s for s in ss.split(nl)]
     self.nlines = len(self.lines)
     self.dotell = 0
@@ -13,3 +14,124 @@ class FILE:
 
   def tell(self):
     return self.dotell
+
+
+class BUFFER:
+  """Read-only file over bytes, bytearray, memoryview, mmap or numpy array
+
+     The buffer is not copied:  lines are read from one block (about
+     chunk bytes, ending at a line end) at a time, which is converted to
+     str when first needed; tell() and seek() use byte offsets into the
+     buffer, and lines are found lazily
+
+     Arguments:
+       buf -- object exposing the buffer interface, or contiguous array
+       nul -- if True, the file ends at the first NUL byte, e.g. of a
+              NUL-padded HDF-EOS metadata string
+       text -- if True, return str (latin-1), else bytes; same in Python 2
+       chunk -- approximate block size, bytes
+  """
+
+  def __init__(self,buf,nul=False,text=True,chunk=65536):
+    if isinstance(buf,numpy.ndarray):
+      self.data = buf.reshape(-1).view(numpy.uint8)
+    else:
+      try:
+        self.data = numpy.frombuffer(buf,dtype=numpy.uint8)
+      except (AttributeError,TypeError,):
+        ### e.g. Python 2 memoryview
+        self.data = numpy.asarray(buf).reshape(-1).view(numpy.uint8)
+    self.nul = nul
+    self.decode = text and bytes is not str
+    self.chunk = chunk
+    self.end = self.data.size
+    self.pos = 0
+    self._nulfree = self.end
+    if nul: self._nulfree = 0
+    self._nl = self._text(b'\n')
+    self._block = self._text(b'')
+    self._blockstart = self._blockend = 0
+
+  ######################################################################
+  def _text(self,s):
+    if self.decode: return s.decode('latin-1')
+    return s
+
+  def _scannul(self,offset):
+    """Find any NUL before offset:  set .end to first NUL offset"""
+    while self._nulfree < min(offset,self.end):
+      stop = min(self._nulfree+self.chunk,self.end)
+      nuls = numpy.flatnonzero(self.data[self._nulfree:stop] == 0)
+      if nuls.size:
+        self.end = self._nulfree + int(nuls[0])
+      self._nulfree = min(stop,self.end)
+
+  def _load(self,pos):
+    """Load block starting at pos, ending at a line end or at .end"""
+    stop = pos
+    while stop < self.end:
+      stop = min(stop+self.chunk,self.end)
+      self._scannul(stop)
+      stop = min(stop,self.end)
+      raw = self.data[pos:stop].tobytes()
+      eol = raw.rfind(b'\n')
+      if eol > -1 and stop < self.end:
+        raw = raw[:eol+1]
+        break
+    else:
+      raw = self.data[pos:stop].tobytes()
+    self._block = self._text(raw)
+    self._blockstart = pos
+    self._blockend = pos + len(raw)
+
+  ######################################################################
+  def readline(self):
+    pos = self.pos
+    if not (self._blockstart <= pos < self._blockend):
+      self._scannul(pos+1)
+      if pos >= self.end: return self._text(b'')
+      self._load(pos)
+    i = pos - self._blockstart
+    eol = self._block.find(self._nl,i)
+    line = eol < 0 and self._block[i:] or self._block[i:eol+1]
+    self.pos = pos + len(line)
+    return line
+
+  def read(self,n=-1):
+    if n is None or n < 0:
+      stop = self.data.size
+    else:
+      stop = self.pos + n
+    self._scannul(stop)
+    start = min(self.pos,self.end)
+    stop = max(start,min(stop,self.end))
+    self.pos = max(self.pos,stop)
+    return self._text(self.data[start:stop].tobytes())
+
+  def tell(self):
+    return self.pos
+
+  def seek(self,offset,whence=0):
+    if whence == 1:
+      offset += self.pos
+    elif whence == 2:
+      self._scannul(self.data.size)
+      offset += self.end
+    self.pos = max(0,offset)
+    return self.pos
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    line = self.readline()
+    if not line: raise StopIteration
+    return line
+  next = __next__
+
+  def close(self):
+    """Release the buffer, e.g. so an mmap can be closed"""
+    self.data = numpy.zeros(0,dtype=numpy.uint8)
+    self.end = self.pos = self._nulfree = 0
+    self._block = self._text(b'')
+    self._blockstart = self._blockend = 0
@@ -0,0 +1,201 @@
+"""
+pdscache.py - Persistent cache of parsed PDS labels for PDSImage.py
+
+SQLite database with one row per (label file, seek offset), holding the
+pickled state of a PDSImage after parsing its label:  the attribute
+tree, pointer map, raw label, line count and RECORD_BYTES.
+
+An entry is valid only while the file's size and mtime are those it was
+parsed with; the least recently used entries are evicted beyond a
+maximum number of entries.  Last-used times and new entries are kept in
+memory and written in one short transaction per batch, and at exit, so
+processes sharing a cache rarely wait on each other's locks.
+
+The database is opened on first get() or put().  A cache never fails a
+parse:  any SQLite error (e.g. 'database is locked' beyond TIMEOUT
+seconds) disables the cache for the rest of the process, as misses.
+
+Usage:
+
+  ### Opt-in, per PDSImage or via the environment:
+  p = PDSImage.PDSImage('648405R.IMG',cache='/tmp/pdslabels.sqlite')
+
+  PDSIMAGE_CACHE=/tmp/pdslabels.sqlite python myscan.py
+
+  ### Or directly:
+  import pdscache
+  cache = pdscache.opencache('/tmp/pdslabels.sqlite')
+  state = cache.get(fn,seek)        ### None if absent or stale
+  cache.put(fn,seek,state)
+
+"""
+
+import os
+import time
+import atexit
+import pickle
+import sqlite3
+
+### Default maximum number of entries
+MAXENTRIES = 200000
+
+### Seconds to wait for another process's lock before giving up
+TIMEOUT = 2.
+
+### Open caches, one per path; see opencache()
+_caches = {}
+
+
+########################################################################
+def opencache(path,maxEntries=MAXENTRIES):
+  """Return the LabelCache for path; its database is opened on first use"""
+  key = os.path.abspath(path)
+  if key not in _caches: _caches[key] = LabelCache(path,maxEntries)
+  return _caches[key]
+
+
+class LabelCache:
+  """Parsed-label cache; see module docstring
+
+     Arguments:
+       path -- SQLite database file; created if it does not exist
+       maxEntries -- evict least recently used entries beyond this
+       batch -- number of changes kept in memory between writes
+  """
+
+  def __init__(self,path,maxEntries=MAXENTRIES,batch=100):
+    self.path = path
+    self.maxEntries = maxEntries
+    self.batch = batch
+    self.hits = 0
+    self.misses = 0
+    self.disabled = False
+    self._used = {}
+    self._puts = {}
+    self._db = None
+    atexit.register(self.close)
+
+  ######################################################################
+  def _connect(self):
+    """Open the database on first use; None if the cache is disabled"""
+    if self._db is None and not self.disabled:
+      try:
+        self._db = sqlite3.connect(self.path,timeout=TIMEOUT)
+        self._db.execute('PRAGMA synchronous=OFF')
+        self._db.execute("""CREATE TABLE IF NOT EXISTS labels
+                            ( path TEXT
+                            , seek INTEGER
+                            , size INTEGER
+                            , mtime REAL
+                            , used REAL
+                            , state BLOB
+                            , PRIMARY KEY (path,seek)
+                            )""")
+        self._db.execute('CREATE INDEX IF NOT EXISTS labels_used ON labels (used)')
+        self._db.commit()
+      except sqlite3.Error:
+        self._disable()
+    return self._db
+
+  def _disable(self):
+    """After an SQLite error:  drop pending changes, no more cache"""
+    self.disabled = True
+    self._used = {}
+    self._puts = {}
+    if self._db is not None:
+      try:
+        self._db.close()
+      except sqlite3.Error:
+        pass
+    self._db = None
+
+  ######################################################################
+  def get(self,fn,seek=0):
+    """Return cached state dict for label of fn at seek, or None"""
+
+    path = os.path.abspath(fn)
+    key = (path,seek,)
+    row = None
+    try:
+      st = os.stat(path)
+      if key in self._puts:
+        row = self._puts[key][:2] + self._puts[key][3:]
+      elif self._connect():
+        row = self._db.execute('SELECT size,mtime,state FROM labels WHERE path=? AND seek=?',key).fetchone()
+    except (OSError,sqlite3.Error) as e:
+      if isinstance(e,sqlite3.Error): self._disable()
+      row = None
+
+    if row is None or row[0] != st.st_size or row[1] != st.st_mtime:
+      self.misses += 1
+      return None
+
+    try:
+      state = pickle.loads(bytes(row[2]))
+    except:
+      ### e.g. written by another Python version
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    if key not in self._puts:
+      self._used[key] = time.time()
+      if len(self._used) >= self.batch: self.flush()
+
+    return state
+
+  ######################################################################
+  def put(self,fn,seek,state):
+    """Store state dict for label of fn at seek; written by flush()"""
+
+    if self.disabled: return
+    path = os.path.abspath(fn)
+    try:
+      st = os.stat(path)
+    except OSError:
+      return
+    self._puts[(path,seek,)] = (st.st_size,st.st_mtime,time.time()
+                               ,sqlite3.Binary(pickle.dumps(state,pickle.HIGHEST_PROTOCOL))
+                               ,)
+    if len(self._puts) >= self.batch: self.flush()
+
+  ######################################################################
+  def flush(self):
+    """Write new entries and last-used times, evict LRU entries, commit;
+       one short transaction
+    """
+
+    if not (self._used or self._puts) or not self._connect(): return
+
+    try:
+      if self._puts:
+        self._db.executemany('INSERT OR REPLACE INTO labels VALUES (?,?,?,?,?,?)'
+                            ,[key + value for key,value in self._puts.items()]
+                            )
+      if self._used:
+        self._db.executemany('UPDATE labels SET used=? WHERE path=? AND seek=?'
+                            ,[(used,path,seek,) for (path,seek),used in self._used.items()]
+                            )
+      if self._puts:
+        excess = self._db.execute('SELECT COUNT(*) FROM labels').fetchone()[0] - self.maxEntries
+        if excess > 0:
+          self._db.execute('DELETE FROM labels WHERE rowid IN (SELECT rowid FROM labels ORDER BY used LIMIT ?)'
+                          ,(excess,))
+      self._db.commit()
+    except sqlite3.Error:
+      self._disable()
+      return
+
+    self._used = {}
+    self._puts = {}
+
+  ######################################################################
+  def close(self):
+    self.flush()
+    if self._db is not None:
+      try:
+        self._db.close()
+      except sqlite3.Error:
+        pass
+    self._db = None
+    for key in [k for k,v in _caches.items() if v is self]: del _caches[key]
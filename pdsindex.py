@@ -0,0 +1,341 @@
+"""
+pdsindex.py - Parallel PDS archive indexer and attribute index queries
+
+build:  walk directory trees for PDS labels (attached or detached), parse
+them with a pool of worker processes (PDSImage.getPDSFile), and load
+selected keywords into an SQLite index:  pointers, dimensions and
+sample type of one OBJECT (default IMAGE), start and stop times, and any
+user-selected getAttribs() paths.  Files whose size and mtime are those
+already in the index are not re-parsed.  Files matching the patterns
+but without a PDS label signature, e.g. the binary .IMG of a detached
+label, are recorded as 'skipped', without parsing.
+
+query:  select indexed files with conditions NAME OP VALUE, combined
+with AND; NAME is a column (lines, line_samples, bands, sample_type,
+sample_bits, record_bytes, start_time, stop_time, path, ...) or a
+user-selected path; OP is one of = != < <= > >= ~ (~ is SQL LIKE);
+numeric VALUEs compare numerically, others as text (ISO times compare
+correctly as text).  Only files with status done are selected, unless a
+condition names status, e.g. 'status=skipped' or 'status!=done'.
+
+Usage:
+
+  python pdsindex.py build INDEX.sqlite DIR [DIR ...] [--workers=N]
+                     [--pattern='*.LBL' ...] [--object=IMAGE]
+                     [--path=IMAGE/SAMPLE_BIT_MASK ...]
+
+  python pdsindex.py query INDEX.sqlite 'lines>1024' 'start_time>=2004-01-01' 'start_time<2004-02-01'
+                     [--columns=path,lines,start_time] [--count]
+
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import fnmatch
+import sqlite3
+import argparse
+import traceback
+import multiprocessing
+import PDSImage
+
+### Default label file name patterns (case-insensitive)
+PATTERNS = ['*.lbl','*.img']
+
+### A PDS label has one of these keywords within its first LABELHEAD
+### bytes (after any SFDU header); other files, e.g. the binary .IMG of
+### a detached label, are recorded as 'skipped', not parsed
+SIGNATURES = (b'PDS_VERSION_ID',b'ODL_VERSION_ID',)
+LABELHEAD = 1024
+
+### Fixed columns of the labels table, and their types
+COLUMNS = [('path','TEXT PRIMARY KEY')
+          ,('size','INTEGER')
+          ,('mtime','REAL')
+          ,('status','TEXT')
+          ,('message','TEXT')
+          ,('indexed','REAL')
+          ,('object','TEXT')
+          ,('pointers','TEXT')
+          ,('lines','INTEGER')
+          ,('line_samples','INTEGER')
+          ,('bands','INTEGER')
+          ,('sample_type','TEXT')
+          ,('sample_bits','INTEGER')
+          ,('record_bytes','INTEGER')
+          ,('start_time','TEXT')
+          ,('stop_time','TEXT')
+          ]
+COLUMNNAMES = [name for name,sqlType in COLUMNS]
+
+### Query condition:  NAME OP VALUE
+CONDITION = re.compile(r'^\s*([^<>=!~\s]+)\s*(<=|>=|!=|=|<|>|~)\s*(.*?)\s*$')
+
+### Options of the build command, for pool workers; set by workersetup()
+options = None
+
+
+########################################################################
+def opendb(path):
+  """Open or create index database"""
+  db = sqlite3.connect(path)
+  db.execute('CREATE TABLE IF NOT EXISTS labels (%s)' % (', '.join(['%s %s' % c for c in COLUMNS]),))
+  db.execute("""CREATE TABLE IF NOT EXISTS attribs
+                ( path TEXT
+                , name TEXT
+                , value TEXT
+                , num REAL
+                , PRIMARY KEY (path,name)
+                )""")
+  for column in ('lines','line_samples','bands','sample_type','start_time','stop_time',):
+    db.execute('CREATE INDEX IF NOT EXISTS labels_%s ON labels (%s)' % (column,column,))
+  db.execute('CREATE INDEX IF NOT EXISTS attribs_name_num ON attribs (name,num)')
+  db.execute('CREATE INDEX IF NOT EXISTS attribs_name_value ON attribs (name,value)')
+  db.commit()
+  return db
+
+
+########################################################################
+def walk(roots,patterns):
+  """Yield label file names under roots matching patterns, sorted"""
+  patterns = [p.lower() for p in patterns]
+  for root in roots:
+    for dirpath,dirnames,filenames in os.walk(root):
+      dirnames.sort()
+      for filename in sorted(filenames):
+        lower = filename.lower()
+        for pattern in patterns:
+          if fnmatch.fnmatchcase(lower,pattern):
+            yield os.path.join(dirpath,filename)
+            break
+
+
+########################################################################
+def timevalue(value):
+  """PDS time as ISO text without trailing Z, or None"""
+  if value is None: return None
+  return str(value).strip().rstrip('Z')
+
+
+########################################################################
+def workersetup(optionsArg):
+  """Pool initializer:  save build options"""
+  global options
+  options = optionsArg
+
+
+def haslabel(fn):
+  """True if fn starts with a PDS label; see SIGNATURES"""
+  f = open(fn,'rb')
+  head = f.read(LABELHEAD).upper()
+  f.close()
+  for signature in SIGNATURES:
+    if signature in head: return True
+  return False
+
+
+def indexfile(job):
+  """Parse one label; return (row dict, {user path: value}) or error
+
+     job is (fn, size, mtime,)
+  """
+  fn,size,mtime = job
+  row = dict(path=os.path.abspath(fn),size=size,mtime=mtime,indexed=time.time(),object=options.object)
+  user = {}
+
+  try:
+    if not haslabel(fn):
+      row.update(status='skipped',message='No PDS_VERSION_ID or ODL_VERSION_ID in first %d bytes' % (LABELHEAD,))
+      return row,user
+
+    pdsi = PDSImage.PDSImage(fn,cache=False)
+    get = pdsi.getAttribs
+
+    ### Keys starting with ** (e.g. **foundEND) are parser bookkeeping
+    if not [key for key in pdsi.getAttribs() if str(key)[:2] != '**']:
+      row.update(status='empty',message='No PDS label')
+      return row,user
+
+    obj = options.object + '/'
+    row.update(status='done'
+              ,message=''
+              ,pointers=json.dumps(pdsi._pointers,sort_keys=True)
+              ,lines=get(obj+'lines')
+              ,line_samples=get(obj+'line_samples')
+              ,bands=get(obj+'bands')
+              ,sample_type=get(obj+'sample_type') or get(obj+'data_type')
+              ,sample_bits=get(obj+'sample_bits')
+              ,record_bytes=get('record_bytes')
+              ,start_time=timevalue(get('start_time') or get(obj+'start_time') or get('image_time'))
+              ,stop_time=timevalue(get('stop_time') or get(obj+'stop_time'))
+              )
+    for path in options.path:
+      value = get(path)
+      if value is not None and not isinstance(value,(dict,list,)): user[path.upper().lstrip('/')] = value
+
+  except:
+    row.update(status='failed',message=traceback.format_exc())
+
+  ### Only numbers and strings go in the index
+  for name in ('lines','line_samples','bands','sample_bits','record_bytes',):
+    if not isinstance(row.get(name),(int,float,)): row[name] = None
+  for name in ('sample_type',):
+    if row.get(name) is not None: row[name] = str(row[name])
+
+  return row,user
+
+
+########################################################################
+def build(argv):
+
+  parser = argparse.ArgumentParser(prog='pdsindex.py build',description='Index PDS labels under directories')
+  parser.add_argument('index',help='SQLite index file')
+  parser.add_argument('dirs',nargs='+',help='Directories to walk')
+  parser.add_argument('--workers',type=int,default=0,help='Worker processes (default 0 => one per CPU)')
+  parser.add_argument('--pattern',action='append',default=None,help='Label file name pattern (default *.lbl, *.img)')
+  parser.add_argument('--object',default='IMAGE',help='OBJECT of dimensions and sample type (default IMAGE)')
+  parser.add_argument('--path',action='append',default=[],help='Extra getAttribs() path to index, e.g. IMAGE/SAMPLE_BIT_MASK')
+  parser.add_argument('--force',action='store_true',default=False,help='Re-parse unchanged files')
+  options = parser.parse_args(argv)
+
+  db = opendb(options.index)
+  known = dict([(path,(size,mtime,)) for path,size,mtime in db.execute('SELECT path,size,mtime FROM labels')])
+
+  jobs = []
+  nUnchanged = 0
+  for fn in walk(options.dirs,options.pattern or PATTERNS):
+    st = os.stat(fn)
+    if not options.force and known.get(os.path.abspath(fn)) == (st.st_size,st.st_mtime,):
+      nUnchanged += 1
+      continue
+    jobs.append((fn,st.st_size,st.st_mtime,))
+
+  t0 = time.time()
+  counts = {}
+
+  def record(result):
+    row,user = result
+    counts[row['status']] = counts.get(row['status'],0) + 1
+    db.execute('INSERT OR REPLACE INTO labels (%s) VALUES (%s)' % (', '.join(COLUMNNAMES),', '.join(['?']*len(COLUMNNAMES)),)
+              ,[row.get(name) for name in COLUMNNAMES])
+    db.execute('DELETE FROM attribs WHERE path=?',(row['path'],))
+    rows = []
+    for name,value in user.items():
+      num = None
+      if isinstance(value,(int,float,)): num = value
+      rows.append((row['path'],name,str(value),num,))
+    db.executemany('INSERT INTO attribs VALUES (?,?,?,?)',rows)
+
+  workers = options.workers or multiprocessing.cpu_count()
+
+  if workers > 1 and len(jobs) > 1:
+    pool = multiprocessing.Pool(min(workers,len(jobs)),initializer=workersetup,initargs=(options,))
+    try:
+      for result in pool.imap_unordered(indexfile,jobs,chunksize=16): record(result)
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+  else:
+    workersetup(options)
+    for job in jobs: record(indexfile(job))
+
+  db.commit()
+  db.close()
+
+  sys.stderr.write('### Indexed %d file(s) in %.2fs; %d unchanged; %s\n'
+                  % (len(jobs),time.time()-t0,nUnchanged,', '.join(['%d %s' % (counts[k],k,) for k in sorted(counts)]) or 'none',))
+
+
+########################################################################
+def number(value):
+  """value as int or float, or None"""
+  try:
+    return int(value)
+  except ValueError:
+    try:
+      return float(value)
+    except ValueError:
+      return None
+
+
+def condition(text):
+  """Convert NAME OP VALUE to (SQL, parameters,)"""
+
+  mo = CONDITION.match(text)
+  if not mo: raise ValueError("Bad condition '%s'; expected NAME OP VALUE" % (text,))
+
+  name,op,value = mo.groups()
+  if op == '~': op = 'LIKE'
+  if name.lower() in ('start_time','stop_time',): value = timevalue(value)
+
+  ### Compare numerically if VALUE is a number
+  column = 'value'
+  num = number(value)
+  if num is not None:
+    column = 'num'
+    value = num
+
+  if name.lower() in COLUMNNAMES:
+    return 'labels.%s %s ?' % (name.lower(),op,), [value]
+
+  return ('EXISTS (SELECT 1 FROM attribs WHERE attribs.path=labels.path AND attribs.name=? AND attribs.%s %s ?)' % (column,op,)
+         ,[name.upper().lstrip('/'),value]
+         )
+
+
+def query(argv):
+
+  parser = argparse.ArgumentParser(prog='pdsindex.py query',description='Query PDS label index')
+  parser.add_argument('index',help='SQLite index file')
+  parser.add_argument('conditions',nargs='*',help="NAME OP VALUE, e.g. 'lines>1024'")
+  parser.add_argument('--columns',default='path',help='Comma-separated columns to print (default path)')
+  parser.add_argument('--count',action='store_true',default=False,help='Print number of matches only')
+  options = parser.parse_args(argv)
+
+  columns = [c.strip().lower() for c in options.columns.split(',')]
+  for column in columns:
+    if column not in COLUMNNAMES: raise ValueError("Unknown column '%s'" % (column,))
+
+  where = []
+  parameters = []
+  for text in options.conditions:
+    sql,values = condition(text)
+    where.append(sql)
+    parameters += values
+
+  ### Default:  only labels parsed successfully
+  if 'status' not in [CONDITION.match(text).group(1).lower() for text in options.conditions]:
+    where.insert(0,"labels.status='done'")
+
+  db = sqlite3.connect(options.index)
+  t0 = time.time()
+  rows = db.execute('SELECT %s FROM labels WHERE %s ORDER BY labels.path'
+                   % (', '.join(['labels.'+c for c in columns]),' AND '.join(where),)
+                   ,parameters).fetchall()
+  seconds = time.time() - t0
+  db.close()
+
+  if options.count:
+    sys.stdout.write('%d\n' % (len(rows),))
+  else:
+    for row in rows: sys.stdout.write('\t'.join([str(v) for v in row]) + '\n')
+
+  sys.stderr.write('### %d match(es) in %.1fms\n' % (len(rows),seconds*1e3,))
+
+
+########################################################################
+def main(argv):
+  commands = dict(build=build,query=query)
+  if not argv or argv[0] not in commands:
+    sys.stderr.write(__doc__)
+    return 1
+  return commands[argv[0]](argv[1:])
+
+
+if __name__=="__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""
+sunephem.py - Cached, interpolated Earth-Sun direction ephemeris
+
+Replaces one spice.spkezr('SUN',et,'IAU_EARTH','LT+S','EARTH') call per
+TOMS scan row with a few calls per fixed time window:  spkezr is sampled
+at Chebyshev nodes across each window, a Chebyshev polynomial is fitted
+to each vector component, and whole arrays of epochs are evaluated with
+NumPy.  Windows are aligned to multiples of the window length (seconds
+past J2000), so all rows of one granule, and neighbouring granules
+processed by the same process, reuse the same fits.
+
+The default window (3600s) and degree (10) give angular errors of order
+1e-12 radian against direct spkezr calls; with check=True the error at
+the midpoints between the nodes of each window is measured against
+direct spkezr calls, and the maximum is available as .maxerror
+
+With standin=True, spkezr is replaced by a low-precision analytic Sun
+position (approxsun(), ~0.01 degree), rotated from J2000 to the frame
+with spice.pxform, so only the leapseconds and PCK kernels are needed,
+e.g. for benchmarks when de432s.bsp is not available.
+
+Usage:
+
+  import sunephem
+  sunEphemeris = sunephem.SunEphemeris()
+  uvEarth2Suns = sunEphemeris.unitvectors(ets)    ### shape (len(ets),3)
+
+"""
+
+import spice
+import numpy
+from numpy.polynomial import chebyshev
+
+### Astronomical Unit, km
+AU = 149597870.7
+
+
+########################################################################
+def approxsun(ets):
+  """Low-precision geocentric Sun positions, J2000 frame, km
+
+     Astronomical Almanac formula, good to ~0.01 degree 1950-2050;
+     ets are seconds past J2000 epoch, treated as UT
+  """
+  days = numpy.asarray(ets,dtype=numpy.float64) / 86400.
+  rpd = numpy.pi / 180.
+  meanLon = rpd * (280.460 + 0.9856474*days)
+  meanAnom = rpd * (357.528 + 0.9856003*days)
+  eclLon = meanLon + rpd * (1.915*numpy.sin(meanAnom) + 0.020*numpy.sin(2.*meanAnom))
+  obliquity = rpd * (23.439 - 0.0000004*days)
+  dist = AU * (1.00014 - 0.01671*numpy.cos(meanAnom) - 0.00014*numpy.cos(2.*meanAnom))
+  return numpy.stack((dist*numpy.cos(eclLon)
+                     ,dist*numpy.cos(obliquity)*numpy.sin(eclLon)
+                     ,dist*numpy.sin(obliquity)*numpy.sin(eclLon)
+                     ,),axis=-1)
+
+
+class SunEphemeris:
+  """Interpolated target direction, cached by time window
+
+     Keyword arguments:
+       window -- length of time windows, s (default 3600)
+       degree -- degree of Chebyshev fit per window (default 10)
+       maxwindows -- maximum number of cached windows (default 240)
+       check -- measure angular errors of each fit (default False)
+       target, frame, abcorr, observer -- arguments to spice.spkezr
+       standin -- use approxsun() instead of spkezr (default False)
+  """
+
+  def __init__(self,window=3600.,degree=10,maxwindows=240,check=False
+              ,target='SUN',frame='IAU_EARTH',abcorr='LT+S',observer='EARTH'
+              ,standin=False
+              ):
+    self.window = float(window)
+    self.degree = degree
+    self.maxwindows = maxwindows
+    self.check = check
+    self.target,self.frame,self.abcorr,self.observer = target,frame,abcorr,observer
+    self.standin = standin
+
+    ### Chebyshev nodes of the first kind on [-1,+1]
+    self._nodes = numpy.cos(numpy.pi * (numpy.arange(degree+1)+.5) / (degree+1))
+
+    ### Midpoints between nodes, for error checks
+    self._midpoints = .5 * (self._nodes[1:] + self._nodes[:-1])
+
+    ### Cached fits:  window index => (degree+1,3) coefficients
+    self._fits = {}
+    self._order = []
+
+    ### Counters
+    self.spkezrCalls = 0
+    self.maxerror = 0.
+
+  ######################################################################
+  def _spkezr(self,ets):
+    """Direct spkezr positions, shape (len(ets),3)"""
+    self.spkezrCalls += len(ets)
+    if self.standin:
+      return numpy.array([numpy.dot(numpy.array(spice.pxform('J2000',self.frame,et)),v)
+                          for et,v in zip(ets,approxsun(ets))
+                         ])
+    return numpy.array([spice.spkezr(self.target,et,self.frame,self.abcorr,self.observer)[0][:3] for et in ets])
+
+  ######################################################################
+  def _fit(self,iWindow):
+    """Return Chebyshev coefficients for window iWindow; fit if needed"""
+
+    if iWindow in self._fits: return self._fits[iWindow]
+
+    halfWindow = .5 * self.window
+    etMid = (iWindow * self.window) + halfWindow
+
+    coeffs = chebyshev.chebfit(self._nodes,self._spkezr(etMid + halfWindow*self._nodes),self.degree)
+
+    if self.check:
+      errors = self._vsep(chebyshev.chebval(self._midpoints,coeffs).T
+                         ,self._spkezr(etMid + halfWindow*self._midpoints)
+                         )
+      self.maxerror = max(self.maxerror,errors.max())
+
+    ### Drop oldest window(s) if cache is full
+    while len(self._order) >= self.maxwindows:
+      del self._fits[self._order.pop(0)]
+
+    self._fits[iWindow] = coeffs
+    self._order.append(iWindow)
+
+    return coeffs
+
+  ######################################################################
+  def _vsep(self,u,v):
+    """Angles between vectors along last axis, radians"""
+    u = u / numpy.sqrt((u*u).sum(axis=-1))[...,numpy.newaxis]
+    v = v / numpy.sqrt((v*v).sum(axis=-1))[...,numpy.newaxis]
+    return 2. * numpy.arcsin(.5*numpy.sqrt(((u-v)**2).sum(axis=-1)))
+
+  ######################################################################
+  def vectors(self,ets):
+    """Interpolated target positions at ets, shape ets.shape+(3,)"""
+
+    ets = numpy.asarray(ets,dtype=numpy.float64)
+    flatEts = ets.ravel()
+    rtn = numpy.empty(flatEts.shape+(3,),dtype=numpy.float64)
+
+    iWindows = numpy.floor(flatEts / self.window).astype(numpy.int64)
+
+    for iWindow in numpy.unique(iWindows):
+      which = iWindows == iWindow
+      x = (flatEts[which] - ((iWindow+.5) * self.window)) / (.5*self.window)
+      rtn[which] = chebyshev.chebval(x,self._fit(int(iWindow))).T
+
+    return rtn.reshape(ets.shape+(3,))
+
+  ######################################################################
+  def unitvectors(self,ets):
+    """Interpolated target unit vectors at ets, shape ets.shape+(3,)"""
+    v = self.vectors(ets)
+    return v / numpy.sqrt((v*v).sum(axis=-1))[...,numpy.newaxis]
@@ -0,0 +1,392 @@
+"""
+synthtoms.py - Write synthetic TOMS/EP Level 2 HDF-EOS5 (.he5) files
+
+Same layout as TOMSEPL2 granules ('HDFEOS/SWATHS/EP TOMS Column Amount
+O3/...', 'HDFEOS INFORMATION/CoreMetadata' etc.), with configurable row
+and pixel counts, for testing and benchmarking tag.py without the real
+archive.  No SPICE kernels are needed.
+
+Geometry:  circular, Sun-synchronous orbit over a spherical Earth; each
+row is one cross-track scan; the Sun position is from
+sunephem.approxsun().  Geolocation and angle fields are consistent with
+that simple model, but only approximately with SPICE.  Data fields hold
+random values of the right shape and type.
+
+Usage:
+
+  python synthtoms.py [--rows=750] [--pixels=35] [--count=1]
+                      [--start=1996-07-25T00:36:27] [--orbit=10000]
+                      [--metadata-attributes=0] [--seed=0]
+                      OUTPUT_DIRECTORY
+
+  import synthtoms
+  synthtoms.writegranule('x.he5',nRows=750,nPixels=35)
+
+"""
+
+import os
+import sys
+import numpy
+import argparse
+import datetime
+import h5py
+import sunephem
+
+### HDF-EOS paths
+SWATH = 'HDFEOS/SWATHS/EP TOMS Column Amount O3'
+GEOLOCATION = SWATH + '/Geolocation Fields'
+DATAFIELDS = SWATH + '/Data Fields'
+
+### Defaults:  rows (scans) per orbit, pixels per scan, s per scan
+NROWS = 750
+NPIXELS = 35
+SCANSECONDS = 8.
+
+### Orbit:  altitude, km; inclination, degrees; Earth radius and GM
+ALTITUDE = 500.
+INCLINATION = 98.4
+EARTHRADIUS = 6378.137
+GM = 398600.4418
+
+### Half-width of swath, degrees of arc from nadir
+HALFSWATH = 15.
+
+### Leap seconds after the TOMS epoch, 1993-01-01T00:00:00 UTC
+LEAPSECONDS = ['1993-07-01','1994-07-01','1996-01-01','1997-07-01','1999-01-01'
+              ,'2006-01-01','2009-01-01','2012-07-01','2015-07-01','2017-01-01'
+              ]
+
+TOMSEPOCH = datetime.datetime(1993,1,1)
+J2000 = datetime.datetime(2000,1,1,12)
+
+### Data Fields:  name => (dtype, trailing dimensions)
+DATAFIELDSPEC = [('APrioriLayerO3','f4',(11,))
+                ,('AlgorithmFlags','u1',())
+                ,('CloudFraction','f4',())
+                ,('CloudTopPressure','f4',())
+                ,('ColumnAmountO3','f4',())
+                ,('LayerEfficiency','f4',(11,))
+                ,('NValue','f4',(6,))
+                ,('O3BelowCloud','f4',())
+                ,('QualityFlags','u2',())
+                ,('Reflectivity331','f4',())
+                ,('Reflectivity360','f4',())
+                ,('Residual','f4',(6,))
+                ,('ResidualStep1','f4',(6,))
+                ,('ResidualStep2','f4',(6,))
+                ,('SO2index','f4',())
+                ,('Sensitivity','f4',(6,))
+                ,('StepOneO3','f4',())
+                ,('StepTwoO3','f4',())
+                ,('TerrainPressure','f4',())
+                ,('UVAerosolIndex','f4',())
+                ,('dN_dR','f4',(6,))
+                ]
+
+
+########################################################################
+def parseutc(utc):
+  """ISO UTC string to datetime.datetime"""
+  for fmt in ('%Y-%m-%dT%H:%M:%S.%f','%Y-%m-%dT%H:%M:%S',):
+    try: return datetime.datetime.strptime(utc,fmt)
+    except ValueError: pass
+  raise ValueError('Cannot parse UTC %s' % (utc,))
+
+
+########################################################################
+def seconds(delta):
+  """datetime.timedelta to float seconds"""
+  return delta.days*86400. + delta.seconds + delta.microseconds*1e-6
+
+
+########################################################################
+def tomstime(dt):
+  """datetime.datetime (UTC) to TOMS Time:  s past 1993-01-01, with leap seconds"""
+  leaps = len([s for s in LEAPSECONDS if parseutc(s+'T00:00:00') <= dt])
+  return seconds(dt-TOMSEPOCH) + leaps
+
+
+########################################################################
+def rotz(vectors,angles):
+  """Rotate vectors (...,3) about Z by angles (...), radians"""
+  c,s = numpy.cos(angles),numpy.sin(angles)
+  x,y,z = vectors[...,0],vectors[...,1],vectors[...,2]
+  return numpy.stack((c*x-s*y,s*x+c*y,z,),axis=-1)
+
+
+########################################################################
+def geometry(startUTC,nRows,nPixels):
+  """Synthetic scan geometry
+
+     Returns dict of Geolocation Fields (float64) and times
+  """
+  rpd = numpy.pi / 180.
+  dpr = 180. / numpy.pi
+
+  start = parseutc(startUTC)
+  rowSeconds = SCANSECONDS * numpy.arange(nRows)
+
+  ### Seconds past J2000 (UTC, no leap seconds; good enough here)
+  ets = seconds(start-J2000) + rowSeconds
+
+  ### Greenwich sidereal angle, radians
+  gmst = rpd * (280.46061837 + 360.98564736629*ets/86400.)
+
+  ### Sun-synchronous orbit:  ascending node at ~10:30 local time at start
+  uvSunJ2000 = sunephem.approxsun(ets)
+  uvSunJ2000 /= numpy.sqrt((uvSunJ2000**2).sum(axis=-1))[:,numpy.newaxis]
+  node = numpy.arctan2(uvSunJ2000[0,1],uvSunJ2000[0,0]) - rpd*22.5
+  incl = rpd * INCLINATION
+  radius = EARTHRADIUS + ALTITUDE
+  argLat = -.5*numpy.pi + numpy.sqrt(GM/radius**3) * rowSeconds
+
+  cn,sn,ci,si = numpy.cos(node),numpy.sin(node),numpy.cos(incl),numpy.sin(incl)
+  cu,su = numpy.cos(argLat),numpy.sin(argLat)
+
+  ### Nadir and along-track unit vectors, inertial; cross-track = nadir x along
+  nadir = numpy.stack((cn*cu-sn*su*ci,sn*cu+cn*su*ci,su*si,),axis=-1)
+  along = numpy.stack((-cn*su-sn*cu*ci,-sn*su+cn*cu*ci,cu*si,),axis=-1)
+  cross = numpy.cross(nadir,along)
+
+  ### Pixel unit vectors, rotated to Earth-fixed
+  offsets = rpd * numpy.linspace(-HALFSWATH,HALFSWATH,nPixels)
+  pixels = (numpy.cos(offsets)[numpy.newaxis,:,numpy.newaxis]*nadir[:,numpy.newaxis,:]
+           +numpy.sin(offsets)[numpy.newaxis,:,numpy.newaxis]*cross[:,numpy.newaxis,:]
+           )
+  pixels = rotz(pixels,-gmst[:,numpy.newaxis])
+  nadir = rotz(nadir,-gmst)
+  uvSuns = rotz(uvSunJ2000,-gmst)[:,numpy.newaxis,:]
+
+  ### Local North and East unit vectors at pixels
+  lats = numpy.arcsin(pixels[...,2])
+  lons = numpy.arctan2(pixels[...,1],pixels[...,0])
+  east = numpy.stack((-numpy.sin(lons),numpy.cos(lons),0.*lons,),axis=-1)
+  north = numpy.stack((-numpy.sin(lats)*numpy.cos(lons),-numpy.sin(lats)*numpy.sin(lons),numpy.cos(lats),),axis=-1)
+
+  ### Surface-to-spacecraft unit vectors
+  views = radius*nadir[:,numpy.newaxis,:] - EARTHRADIUS*pixels
+  views /= numpy.sqrt((views**2).sum(axis=-1))[...,numpy.newaxis]
+
+  def zenith(v): return dpr * numpy.arccos(numpy.clip((v*pixels).sum(axis=-1),-1.,1.))
+  def azimuth(v): return (dpr * numpy.arctan2((v*east).sum(axis=-1),(v*north).sum(axis=-1))) % 360.
+
+  solarAzimuths = azimuth(uvSuns)
+  viewingAzimuths = azimuth(views)
+  relativeAzimuths = numpy.abs(solarAzimuths-viewingAzimuths)
+  relativeAzimuths = numpy.where(relativeAzimuths>180.,360.-relativeAzimuths,relativeAzimuths)
+
+  return dict(Time=numpy.array([tomstime(start+datetime.timedelta(seconds=s)) for s in rowSeconds])
+             ,SecondsInDay=seconds(start-start.replace(hour=0,minute=0,second=0,microsecond=0)) + rowSeconds
+             ,Latitude=dpr*lats
+             ,Longitude=dpr*lons
+             ,SpacecraftAltitude=ALTITUDE + 0.*rowSeconds
+             ,SpacecraftLatitude=dpr*numpy.arcsin(nadir[:,2])
+             ,SpacecraftLongitude=dpr*numpy.arctan2(nadir[:,1],nadir[:,0])
+             ,SolarZenithAngle=zenith(uvSuns)
+             ,SolarAzimuthAngle=solarAzimuths
+             ,ViewingZenithAngle=zenith(views)
+             ,ViewingAzimuthAngle=viewingAzimuths
+             ,RelativeAzimuthAngle=relativeAzimuths
+             ,endUTC=(start+datetime.timedelta(seconds=rowSeconds[-1])).strftime('%Y-%m-%dT%H:%M:%S.%f')
+             ,eqLon=dpr*numpy.arctan2(nadir[nRows//4,1],nadir[nRows//4,0])
+             )
+
+
+########################################################################
+def odlobject(name,value,indent,numVal=1,cls=None):
+  """ODL OBJECT stanza, ECS style"""
+  pad = ' '*indent
+  lines = ['%sOBJECT                 = %s' % (pad,name,)]
+  if cls is not None: lines.append('%s  CLASS                = "%s"' % (pad,cls,))
+  lines.append('%s  NUM_VAL              = %d' % (pad,numVal,))
+  lines.append('%s  VALUE                = %s' % (pad,value,))
+  lines.append('%sEND_OBJECT             = %s' % (pad,name,))
+  lines.append('')
+  return lines
+
+
+########################################################################
+def coremetadata(fnLocal,startUTC,endUTC,orbit,eqLon,extra=0):
+  """ECS-style ODL CoreMetadata text
+
+     extra adds that many ADDITIONALATTRIBUTES containers, to make large
+     labels for parser benchmarks
+  """
+  startDate,startTime = startUTC.split('T')
+  endDate,endTime = endUTC.split('T')
+
+  L = ['','GROUP                  = INVENTORYMETADATA','  GROUPTYPE            = MASTERGROUP','']
+
+  L += ['  GROUP                  = ECSDATAGRANULE','']
+  L += odlobject('LOCALGRANULEID','"%s"' % (fnLocal,),4)
+  L += odlobject('PRODUCTIONDATETIME','"2006-04-02T12:34:56.000Z"',4)
+  L += odlobject('DAYNIGHTFLAG','"Both"',4)
+  L += odlobject('REPROCESSINGACTUAL','"processed once"',4)
+  L += ['  END_GROUP              = ECSDATAGRANULE','']
+
+  L += ['  GROUP                  = MEASUREDPARAMETER','']
+  for i,name in enumerate(['ColumnAmountO3','UVAerosolIndex','Reflectivity331','SO2index',]):
+    cls = str(i+1)
+    L += ['    OBJECT                 = MEASUREDPARAMETERCONTAINER','      CLASS                = "%s"' % (cls,),'']
+    L += odlobject('PARAMETERNAME','"%s"' % (name,),6,cls=cls)
+    L += ['      GROUP                  = QAFLAGS','        CLASS                = "%s"' % (cls,),'']
+    L += odlobject('AUTOMATICQUALITYFLAG','"Passed"',8,cls=cls)
+    L += odlobject('AUTOMATICQUALITYFLAGEXPLANATION','"Passed if at least one good scan"',8,cls=cls)
+    L += ['      END_GROUP              = QAFLAGS','']
+    L += ['      GROUP                  = QASTATS','        CLASS                = "%s"' % (cls,),'']
+    L += odlobject('QAPERCENTMISSINGDATA','0',8,cls=cls)
+    L += odlobject('QAPERCENTOUTOFBOUNDSDATA','0',8,cls=cls)
+    L += ['      END_GROUP              = QASTATS','']
+    L += ['    END_OBJECT             = MEASUREDPARAMETERCONTAINER','']
+  L += ['  END_GROUP              = MEASUREDPARAMETER','']
+
+  L += ['  GROUP                  = ORBITCALCULATEDSPATIALDOMAIN','']
+  L += ['    OBJECT                 = ORBITCALCULATEDSPATIALDOMAINCONTAINER','      CLASS                = "1"','']
+  L += odlobject('ORBITNUMBER','%d' % (orbit,),6,cls='1')
+  L += odlobject('EQUATORCROSSINGLONGITUDE','%.6f' % (eqLon,),6,cls='1')
+  L += odlobject('EQUATORCROSSINGDATE','"%s"' % (startDate,),6,cls='1')
+  L += odlobject('EQUATORCROSSINGTIME','"%s"' % (startTime,),6,cls='1')
+  L += ['    END_OBJECT             = ORBITCALCULATEDSPATIALDOMAINCONTAINER','']
+  L += ['  END_GROUP              = ORBITCALCULATEDSPATIALDOMAIN','']
+
+  L += ['  GROUP                  = COLLECTIONDESCRIPTIONCLASS','']
+  L += odlobject('SHORTNAME','"TOMSEPL2"',4)
+  L += odlobject('VERSIONID','8',4)
+  L += ['  END_GROUP              = COLLECTIONDESCRIPTIONCLASS','']
+
+  L += ['  GROUP                  = INPUTGRANULE','']
+  L += odlobject('INPUTPOINTER','("TOMS-EP_L1-%05d.hdf", "TOMS-EP_ANC-%05d.hdf",\n        "TOMS-EP_CLIM-O3.dat")' % (orbit,orbit,),4,numVal=3)
+  L += ['  END_GROUP              = INPUTGRANULE','']
+
+  L += ['  GROUP                  = RANGEDATETIME','']
+  L += odlobject('RANGEENDINGDATE','"%s"' % (endDate,),4)
+  L += odlobject('RANGEENDINGTIME','"%s"' % (endTime,),4)
+  L += odlobject('RANGEBEGINNINGDATE','"%s"' % (startDate,),4)
+  L += odlobject('RANGEBEGINNINGTIME','"%s"' % (startTime,),4)
+  L += ['  END_GROUP              = RANGEDATETIME','']
+
+  L += ['  GROUP                  = PGEVERSIONCLASS','']
+  L += odlobject('PGEVERSION','"8.0.1"',4)
+  L += ['  END_GROUP              = PGEVERSIONCLASS','']
+
+  L += ['  GROUP                  = ADDITIONALATTRIBUTES','']
+  for i in range(extra):
+    cls = str(i+1)
+    L += ['    OBJECT                 = ADDITIONALATTRIBUTESCONTAINER','      CLASS                = "%s"' % (cls,),'']
+    L += odlobject('ADDITIONALATTRIBUTENAME','"SyntheticAttribute%d"' % (i,),6,cls=cls)
+    L += ['      GROUP                  = INFORMATIONCONTENT','        CLASS                = "%s"' % (cls,),'']
+    L += odlobject('PARAMETERVALUE','%d' % (i,),8,cls=cls)
+    L += odlobject('PARAMETERSCALE','%.4e' % (1.5*i,),8,cls=cls)
+    L += ['      END_GROUP              = INFORMATIONCONTENT','']
+    L += ['    END_OBJECT             = ADDITIONALATTRIBUTESCONTAINER','']
+  L += ['  END_GROUP              = ADDITIONALATTRIBUTES','']
+
+  L += ['END_GROUP              = INVENTORYMETADATA','','END','']
+
+  return '\n'.join(L)
+
+
+########################################################################
+def metadataarray(text,blockSize=4096):
+  """ODL text as NUL-padded fixed-length string, like HDF-EOS5"""
+  text = text.encode('ascii')
+  return numpy.array(text + b'\0'*(blockSize-(len(text)%blockSize)))
+
+
+########################################################################
+def writegranule(fn,nRows=NROWS,nPixels=NPIXELS,startUTC='1996-07-25T00:36:27.000000'
+                ,orbit=10000,extraMetadata=0,seed=0
+                ):
+  """Write one synthetic TOMS/EP .he5 file; return its name"""
+
+  rng = numpy.random.RandomState(seed)
+
+  if len(startUTC) == 19: startUTC += '.000000'
+
+  geo = geometry(startUTC,nRows,nPixels)
+
+  f = h5py.File(fn,'w')
+
+  ### Geolocation Fields
+  for name in ('Latitude','Longitude','SolarZenithAngle','SolarAzimuthAngle'
+              ,'ViewingZenithAngle','ViewingAzimuthAngle','RelativeAzimuthAngle'
+              ,'SecondsInDay','SpacecraftAltitude','SpacecraftLatitude','SpacecraftLongitude'
+              ,):
+    f.create_dataset(GEOLOCATION+'/'+name,data=geo[name].astype(numpy.float32))
+
+  f.create_dataset(GEOLOCATION+'/Time',data=geo['Time'])
+  f.create_dataset(GEOLOCATION+'/TerrainHeight',data=rng.randint(0,3000,(nRows,nPixels,)).astype(numpy.int16))
+  f.create_dataset(GEOLOCATION+'/GroundPixelQualityFlags'
+                  ,data=(rng.uniform(size=(nRows,nPixels,))<.02).astype(numpy.uint16)
+                  )
+
+  for name in ('Latitude','SolarZenithAngle',):
+    f[GEOLOCATION+'/'+name].attrs['Units'] = numpy.bytes_(b'deg')
+    f[GEOLOCATION+'/'+name].attrs['_FillValue'] = numpy.float32(-1.2676506e30)
+
+  ### Data Fields
+  for name,dtype,dims in DATAFIELDSPEC:
+    shape = (nRows,nPixels,) + dims
+    if dtype[0] == 'f':
+      data = rng.uniform(0.,500.,shape).astype(dtype)
+    else:
+      data = (rng.uniform(size=shape)<.01).astype(dtype)
+    f.create_dataset(DATAFIELDS+'/'+name,data=data)
+
+  f.create_dataset(DATAFIELDS+'/MeasurementQualityFlags',data=(rng.uniform(size=(nRows,))<.01).astype(numpy.uint8))
+  f.create_dataset(DATAFIELDS+'/Wavelength',data=numpy.array([308.6,312.5,317.5,322.3,331.2,360.4],dtype=numpy.float32))
+
+  ### Metadata
+  fnLocal = os.path.basename(fn)
+  f.create_dataset('HDFEOS INFORMATION/CoreMetadata'
+                  ,data=metadataarray(coremetadata(fnLocal,startUTC,geo['endUTC'],orbit,geo['eqLon'],extraMetadata))
+                  )
+  f.create_dataset('HDFEOS INFORMATION/ArchivedMetadata'
+                  ,data=metadataarray('\nGROUP                  = ARCHIVEDMETADATA\n  GROUPTYPE            = MASTERGROUP\n\nEND_GROUP              = ARCHIVEDMETADATA\n\nEND\n')
+                  )
+  f.create_dataset('HDFEOS INFORMATION/StructMetadata.0'
+                  ,data=metadataarray('GROUP=SwathStructure\n\tGROUP=SWATH_1\n\t\tSwathName="EP TOMS Column Amount O3"\n'
+                                      '\t\tGROUP=Dimension\n\t\t\tOBJECT=Dimension_1\n\t\t\t\tDimensionName="nTimes"\n'
+                                      '\t\t\t\tSize=%d\n\t\t\tEND_OBJECT=Dimension_1\n\t\t\tOBJECT=Dimension_2\n'
+                                      '\t\t\t\tDimensionName="nXtrack"\n\t\t\t\tSize=%d\n\t\t\tEND_OBJECT=Dimension_2\n'
+                                      '\t\tEND_GROUP=Dimension\n\tEND_GROUP=SWATH_1\nEND_GROUP=SwathStructure\nEND\n'
+                                      % (nRows,nPixels,)
+                                     )
+                  )
+  f.create_group('HDFEOS/ADDITIONAL/FILE_ATTRIBUTES').attrs['OrbitNumber'] = numpy.int32(orbit)
+
+  f.close()
+
+  return fn
+
+
+########################################################################
+def main(argv):
+
+  parser = argparse.ArgumentParser(description='Write synthetic TOMS/EP .he5 files')
+  parser.add_argument('--rows',type=int,default=NROWS,help='Rows (scans) per file')
+  parser.add_argument('--pixels',type=int,default=NPIXELS,help='Pixels per row')
+  parser.add_argument('--count',type=int,default=1,help='Number of consecutive files (orbits)')
+  parser.add_argument('--start',default='1996-07-25T00:36:27',help='UTC start of first file')
+  parser.add_argument('--orbit',type=int,default=10000,help='Orbit number of first file')
+  parser.add_argument('--metadata-attributes',type=int,default=0,help='Extra CoreMetadata containers')
+  parser.add_argument('--seed',type=int,default=0,help='Random seed')
+  parser.add_argument('directory',help='Output directory')
+  options = parser.parse_args(argv)
+
+  if not os.path.isdir(options.directory): os.makedirs(options.directory)
+
+  start = parseutc(options.start)
+  orbitSeconds = 2. * numpy.pi * numpy.sqrt((EARTHRADIUS+ALTITUDE)**3/GM)
+
+  for i in range(options.count):
+    startUTC = (start + datetime.timedelta(seconds=i*orbitSeconds)).strftime('%Y-%m-%dT%H:%M:%S.%f')
+    fn = os.path.join(options.directory,'TOMS-EP_L2-TOMSEPL2_%sm%st%s-o%05d_synthetic.he5'
+                     % (startUTC[:4],startUTC[5:7]+startUTC[8:10],startUTC[11:13]+startUTC[14:16],options.orbit+i,)
+                     )
+    writegranule(fn,options.rows,options.pixels,startUTC,options.orbit+i,options.metadata_attributes,options.seed+i)
+    print(fn)
+
+
+if __name__=="__main__":
+  main(sys.argv[1:])
@@ -7,31 +7,175 @@ Usage:
 
   find TOMSEPL2/1996/07/ -name '*.he5' | grep -v '_glint\.he5$' | sort | xargs python tag.py
 
+  find TOMSEPL2/1996/ -name '*.he5' | sort | xargs python tag.py --workers=8
+
+Options:
+
+  --workers=N  Number of worker processes (default 1; 0 => one per CPU)
+               - each worker loads the meta-kernel once, then processes
+                 many files; status messages are written by the parent
+                 process, one file at a time, followed by a summary
+
+  --output-mode=copy|append|sidecar
+               Output files are written as ..._glint.he5.tmp, and renamed
+               to ..._glint.he5 when complete
+               copy:  copy all groups of input to ..._glint.he5 (default)
+               append:  add GlintAngle to input file, opened 'r+'; new
+                 products are written as <name>.new, and replace any
+                 existing products only when all are written, so a
+                 failure leaves existing products as they were.  N.B.
+                 HDF5 has no rollback:  a crash while the file is being
+                 written can still leave it damaged
+               sidecar:  write only GlintAngle to ..._glint.he5, with
+                 HDF5 external links to all other input file contents
+
+  --manifest=SQLITE
+               Record each input file's size, mtime, status and timing in
+               an SQLite manifest; on re-runs, skip files already done and
+               redo files that failed, were interrupted or have changed
+
+  --manifest-hash
+               Also record SHA-1 of inputs; an input whose size or mtime
+               changed, but whose hash did not, is not redone
+
+  --memory-budget=MiB
+               Read, compute and write GlintAngle in blocks of rows that
+               fit in MiB of memory per process, via h5py slicing and a
+               chunked GlintAngle dataset, instead of whole swaths
+
+  --sun-direct Call spkezr for the Sun vector of every scan row, instead
+               of using the cached, interpolated ephemeris in sunephem.py
+
+  --sun-check  Measure the angular error of the interpolated Sun vectors
+               against direct spkezr calls, and report the maximum
+
+  --metrics=FILE
+               Record per-file and per-stage wall and CPU times, pixels
+               per second, bytes read and written, and SPICE call counts;
+               see taginstrument.py
+
+  --metrics-format=jsonl|prometheus
+               jsonl:  append one JSON record per file to FILE (default)
+               prometheus:  rewrite FILE with run totals after each file,
+                 in Prometheus text format
+
+  --profile-dir=DIR
+               Write a cProfile dump, DIR/<input basename>.prof, for the
+               first of every --profile-every=N files (default 100)
+
+  --tle=FILE   Earth Probe two-line elements; spacecraft altitude,
+               latitude and longitude are propagated from them (see
+               tleprop.py) where the Spacecraft* fields are missing
+
+  --tle-check  Compare the Spacecraft* fields against the TLE positions,
+               and report the maximum differences
+
+  --chunks=ROWS,PIXELS|auto
+               GlintAngle chunk shape (default:  contiguous, or blocks of
+               rows with --memory-budget)
+
+  --compression=none|gzip|lzf
+               GlintAngle compression filter (default none); lzf is
+               fast, but readable only with h5py or the lzf plugin
+
+  --compression-level=N
+               gzip level, 0-9 (default 4)
+
+  --shuffle    Byte shuffle filter, before compression
+
+  --encoding=float32|float16|int16
+               GlintAngle storage type (default float32); all have a
+               _FillValue attribute, the stored value of dark pixels:
+               float32:  999.9
+               float16:  1000.0 (999.9 rounded; 0.125deg resolution at
+                 128-180deg)
+               int16:  -32767; angle = value*scale_factor + add_offset,
+                 attributes as CF packed data
+
+  --scale-factor=DEG
+               int16 encoding resolution (default 0.01); at least
+               180/32766 (about 0.0055), so that the 0-180deg and, after
+               add_offset, +/-180deg product ranges fit in int16
+
+  --repack     copy mode:  rewrite copied numeric datasets of 1024 or
+               more elements, auto-chunked, with --compression and
+               --shuffle, instead of copying their input layout
+
+  --geometry=PRODUCT,...|all
+               Also write other viewing and illumination angles computed
+               in the same pass as GlintAngle, from the same vectors:
+               SolarZenithAngle, ViewingZenithAngle, SolarAzimuthAngle,
+               ViewingAzimuthAngle, RelativeAzimuthAngle, ScatteringAngle
+               (see glintvec.PRODUCTS); written to Geolocation Fields as
+               <product>Computed, with the output options of GlintAngle
+
+  --geometry-check
+               Compare --geometry products against the input fields of
+               the same names, and report the maximum differences
+
+  --pipeline   With --workers=1, overlap reading the next file, computing
+               the current file and writing the previous file, in three
+               processes linked by bounded queues; whole swaths are read
+               (--memory-budget and --profile-dir do not apply)
+
+  --pipeline-depth=N
+               Files queued between --pipeline stages (default 1); at
+               most 2*N+3 files' arrays are in memory at once
+
+  --select=EXPR
+               Compute only the pixels where EXPR, over Geolocation or
+               Data Fields, is true, e.g.
+                 --select='(GroundPixelQualityFlags & 15) == 0 and MeasurementQualityFlags == 0'
+               see tagselect.py for the allowed syntax; per-row fields
+               apply to every pixel of the row.  Skipped pixels are
+               written as fill values (999.9, see --encoding), in
+               GlintAngle and all --geometry products
+
+  --cull-dark  Compute only pixels on the day side, by an inexpensive
+               incidence-cosine test of every pixel made before any
+               other calculation (glintvec.daylit()); rows with no lit
+               (or --select) pixel get no TLE propagation or glint
+               calculation, and a swath with none is not computed at
+               all.  GlintAngle is unchanged (dark pixels are 999.9);
+               --geometry products are fill values on the night side
+
 Dependencies:
 
-  h5py; numpy; PySPICE; PDSImage; listfauxfile
+  h5py; numpy; PySPICE; PDSImage; listfauxfile; glintvec; kernelpool; sunephem;
+  tagmanifest; taginstrument; tagselect; tleprop; utcet
 
-  - the latter two are provided in this repository
+  - the latter ten are provided in this repository
 
 """
 
+import os
 import sys
+import time
 import h5py
 import spice
 import numpy
+import cProfile
+import argparse
+import traceback
+import multiprocessing
 import PDSImage
+import glintvec
+import kernelpool
+import sunephem
+import tagmanifest
+import taginstrument
+import tagselect
 import listfauxfile
+import tleprop
+import utcet
 
+try:
+  import queue
+except ImportError:
+  import Queue as queue
 
-if __name__=="__main__" and sys.argv[1:]:
-
-  ### Conversion from radans to degrees and back
-  rpd,dpr = spice.rpd(),spice.dpr()
-
-  ### Load this python script as a SPICE kernel
-  spice.furnsh(__file__)
 
-  """
+"""
 Meta-kernel:
 
   The files lister here must exist at the location specified
@@ -45,146 +189,1313 @@ KERNELS_TO_LOAD = (
 \begintext
 """
 
-  ### Earth equatorial and polar radii; calculate flattening
-  re = spice.gdpool('BODY399_RADII',0,1)[1]
-  rp = spice.gdpool('BODY399_RADII',2,1)[1]
-  flattening = (re-rp) / re
+### HDF-EOS paths
+SWATH = 'HDFEOS/SWATHS/EP TOMS Column Amount O3'
+GEOLOCATION = SWATH + '/Geolocation Fields'
+DATAFIELDS = SWATH + '/Data Fields'
+GLINTANGLE = GEOLOCATION + '/GlintAngle'
+COREMETADATA = 'HDFEOS INFORMATION/CoreMetadata'
+RANGEDATETIME = 'INVENTORYMETADATA/RANGEDATETIME'
 
-  ######################################################################
-  def glintangle(scAltKm,scLonDeg,scLatDeg,surfLonDeg,surfLatDeg,uvEarth2Sun):
-    """Function to calculate glint angle
+### Earth equatorial and polar radii; set by loadkernels()
+re,rp = None,None
 
-       Inputs:
-         S/C altitude, Longitude, Latitude
-         Surface point Longitude, Latitude (altitude is zero by definition)
-         Ephemeris time, s past J2000 EPOCH
-    """
+### Approximate peak memory per pixel and per row, bytes, of glintblock()
+PIXELBYTES = 256
+ROWBYTES = 64
 
-    toms_alt_km = scAltKm
-    toms_lon_rad = rpd * scLonDeg           ### Scale degrees to radians
-    toms_lat_rad = rpd * scLatDeg           ### Scale degrees to radians
+### Additional memory per pixel, bytes, of each --geometry product
+PRODUCTBYTES = 96
 
-    surf_lon_rad = rpd * surfLonDeg
-    surf_lat_rad = rpd * surfLatDeg
+### GlintAngle storage (--encoding):  HDF5 type and fill value of dark
+### pixels (glintvec.DARK, 999.9); int16 values are angles less
+### add_offset divided by --scale-factor, rounded
+ENCODINGS = dict(float32=(numpy.float32,numpy.float32(glintvec.DARK),)
+                ,float16=(numpy.float16,numpy.float16(glintvec.DARK),)
+                ,int16=(numpy.int16,numpy.int16(-32767),)
+                )
 
-    ### Convert TOMS and surface points geodetic positions to ECEF vectors
-    toms_vec = spice.georec(toms_lon_rad,toms_lat_rad,toms_alt_km,re,flattening)
-    surfPoint = spice.georec(surf_lon_rad,surf_lat_rad,0.,re,flattening)
+### int16 add_offset per product; azimuths, [0,360), are offset so that
+### they fit at the default --scale-factor
+ADDOFFSETS = dict(SolarAzimuthAngle=180.,ViewingAzimuthAngle=180.)
 
-    ### Get normal at surface point, ECEF unit vector
-    uvSurfNormal = spice.surfnm(re,re,rp,surfPoint)
+### Largest magnitude of any product less its add_offset, degrees, and
+### of int16 values other than the fill value; --scale-factor must be at
+### least their ratio, so that no value saturates
+INT16ANGLE = 180.
+INT16LIMIT = 32766
 
-    ### Get cosine of incidence angle (angle between Sun & surface normal vector)
-    mu = spice.vdot(uvEarth2Sun,uvSurfNormal)
+### --geometry products are written as GEOLOCATION/<product>Computed,
+### beside any input field of the same name
+GEOMETRYSUFFIX = 'Computed'
 
-    if mu <= 0.: return 999.9
+### --output-mode=append:  products are written as <path>NEWSUFFIX, then
+### replace any existing products once all are written; see writepath()
+NEWSUFFIX = '.new'
 
-    uvReflect = spice.vsub(spice.vscl(2.*mu,uvSurfNormal),uvEarth2Sun)  ### Get specular reflection vector
+### --repack:  smaller numeric datasets are copied as-is
+REPACKMINIMUM = 1024
 
-    ### Return glint angle
-    return dpr * spice.vsep(uvReflect,spice.vsub(toms_vec,surfPoint))
+### Command-line options, Sun ephemeris and TLE; set by setup()
+options = None
+sunEphemeris = None
+tle = None
 
-  ### End of glint angle calculation
-  ######################################################################
+### Parsed --select expression; see selection()
+selector = None
 
+### Maximum Spacecraft* field differences from TLE, this process; --tle-check
+tleErrors = dict(altitude=0.,latitude=0.,longitude=0.)
 
-  ######################################################################
-  for fnInput in (__name__=="__main__" and sys.argv[1:] or []):
+### Maximum --geometry product differences from input fields, degrees,
+### this process; --geometry-check
+geometryErrors = {}
 
-    if fnInput[-4:] != '.he5':
-      sys.stderr.write("### Skipping file '%s'; does not end in '.he5'\n" % (fnInput,))
-      continue
+### --geometry-check:  azimuths are not compared within NEARZENITH
+### degrees of the zenith, where they are ill-defined
+AZIMUTHZENITHS = dict(SolarAzimuthAngle=('SolarZenithAngle',)
+                     ,ViewingAzimuthAngle=('ViewingZenithAngle',)
+                     ,RelativeAzimuthAngle=('SolarZenithAngle','ViewingZenithAngle',)
+                     )
+NEARZENITH = .5
 
-    if fnInput[-10:] == '_glint.he5':
-      sys.stderr.write("### Skipping file '%s'; ends in '_glint.he5'\n" % (fnInput,))
-      continue
 
-    ### Build output filename
+########################################################################
+def loadkernels():
+  """Load this python script as a SPICE meta-kernel; get Earth radii
 
-    fnToks = fnInput.split('.')
-    fnToks[-2] += '_glint'
-    fnOutput = '.'.join(fnToks)
+     Called once per process, including once in each pool worker; the
+     radii and leapseconds are read via the kernelpool.py cache
+  """
+  global re,rp
 
-    try:
-      fOutput = h5py.File(fnOutput,'w-')
-    except:
-      sys.stderr.write("### Skipping creation of glint file '%s'; it already exists or is otherwise un-writeable\n" % (fnOutput,))
-      continue
+  spice.furnsh(__file__)
+  utcet.load()
 
-    ### Read HDF5 file
-    fInput=h5py.File(fnInput,'r')
+  re,rp = kernelpool.earthradii(__file__)
 
-    ### Get the inputs from the input HDF5 file
-    getThem = lambda s: numpy.array(fInput[s])
 
-    tomsOffsetTimes,surfLatDegs,surfLonDegs,scAltKms,scLatDegs,scLonDegs = map(getThem
-, [s.strip() for s in """
-HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/Time
-HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/Latitude
-HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/Longitude
-HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/SpacecraftAltitude
-HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/SpacecraftLatitude
-HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/SpacecraftLongitude
-""".strip().split('\n')]
-)
+########################################################################
+def setup(optionsArg):
+  """Per-process setup:  save options, load kernels, create ephemeris
+
+     Called once in the main process, or once in each pool worker
+  """
+  global options,sunEphemeris,tle
+
+  options = optionsArg
+
+  if options.metrics: taginstrument.countspice(spice)
+
+  loadkernels()
+
+  sunEphemeris = sunephem.SunEphemeris(check=options.sun_check)
+
+  if options.tle: tle = tleprop.readtle(options.tle)
+
+
+########################################################################
+def outputname(fnInput):
+  """Build output filename:  .../X.he5 => .../X_glint.he5"""
+  fnToks = fnInput.split('.')
+  fnToks[-2] += '_glint'
+  return '.'.join(fnToks)
+
+
+########################################################################
+def skipreason(fnInput):
+  """Return reason to skip input file by name, or None"""
+
+  if fnInput[-4:] != '.he5':
+    return "does not end in '.he5'"
+
+  if fnInput[-10:] == '_glint.he5':
+    return "ends in '_glint.he5'"
+
+  return None
+
+
+########################################################################
+def blockrows(nRows,nPixels,memoryBudget):
+  """Number of rows per block to keep memory use under memoryBudget, MiB
+
+     A memoryBudget of None or zero means the whole swath in one block
+  """
+  if not memoryBudget: return nRows
+
+  pixelBytes = PIXELBYTES + PRODUCTBYTES*(len(products())-1)
+
+  return max(1,min(nRows,int(memoryBudget*2**20) // (nPixels*pixelBytes+ROWBYTES)))
+
+
+########################################################################
+def readgeolocation(fInput,rows=slice(None)):
+  """Get the inputs from the input HDF5 file, for a slice of rows
+
+     Returns tomsOffsetTimes,surfLatDegs,surfLonDegs,scAltKms,scLatDegs,scLonDegs;
+     Spacecraft* fields missing from the input are returned as None
+  """
+  geolocation = fInput[GEOLOCATION]
+  values = []
+  for s in """
+Time
+Latitude
+Longitude
+SpacecraftAltitude
+SpacecraftLatitude
+SpacecraftLongitude
+""".strip().split('\n'):
+    if s.startswith('Spacecraft') and s not in geolocation:
+      values.append(None)
+    else:
+      values.append(geolocation[s][rows])
+  return values
+
+
+########################################################################
+def spacecraftpositions(tomsZeroEpoch,tomsOffsetTimes,scAltKms,scLatDegs,scLonDegs):
+  """Spacecraft altitudes (km), latitudes, longitudes (deg), one per row
+
+     Propagated from the TLE (--tle) where the Spacecraft* fields are
+     missing; with --tle-check, their differences from the TLE positions
+     are accumulated in tleErrors
+  """
+  missing = scAltKms is None or scLatDegs is None or scLonDegs is None
+
+  if tle is None:
+    if missing: raise KeyError('Spacecraft* fields missing from %s; use --tle=FILE' % (GEOLOCATION,))
+    return scAltKms,scLatDegs,scLonDegs
+
+  if not (missing or options.tle_check): return scAltKms,scLatDegs,scLonDegs
+
+  tleAltKms,tleLatDegs,tleLonDegs = tle.geodetic(tomsZeroEpoch+numpy.asarray(tomsOffsetTimes,dtype=numpy.float64),re,rp)
+
+  if missing: return tleAltKms,tleLatDegs,tleLonDegs
+
+  if len(tleAltKms):
+    for name,errors in (('altitude',tleAltKms-scAltKms,)
+                       ,('latitude',tleLatDegs-scLatDegs,)
+                       ,('longitude',(tleLonDegs-scLonDegs+180.) % 360. - 180.,)
+                       ):
+      tleErrors[name] = max(tleErrors[name],float(numpy.abs(errors).max()))
+
+  return scAltKms,scLatDegs,scLonDegs
+
+
+########################################################################
+def metadatafile(fInput,name=COREMETADATA):
+  """HDF-EOS metadata dataset (e.g. CoreMetadata) as file-like object
+
+     A NUL-padded fixed-length string is read once into an array, and
+     lines are read from that array up to the first NUL, without copying
+     the whole string again; see listfauxfile.BUFFER
+  """
+  dataset = fInput[name]
+
+  if dataset.dtype.kind == 'S' and dataset.size == 1:
+    data = numpy.empty(dataset.shape,dtype=dataset.dtype)
+    dataset.read_direct(data)
+    return listfauxfile.BUFFER(data,nul=True)
+
+  ### Otherwise, e.g. array of strings:  join them, less their padding
+  data = dataset[()]
+  if isinstance(data,numpy.ndarray): data = b''.join(data.ravel().tolist())
+  if not isinstance(data,bytes): data = data.encode('latin-1')
+
+  return listfauxfile.BUFFER(bytes(data).replace(b'\0',b''))
+
 
-    ### Convert .../CoreMetadata to string, parse as ODL using PDSImage.py
-    faux=listfauxfile.FILE(numpy.array(fInput['HDFEOS INFORMATION/CoreMetadata']).tostring().replace('\0',''))
-    pdsi=PDSImage.PDSImage()
+########################################################################
+def starttime(fInput):
+  """Extract start time from CoreMetadata as ISO UTC string"""
 
-    ### dcmd ocontains recursive dictionaries
-    dcmd=pdsi._downone(faux)
+  ### Query only the two values needed, stopping when they are found;
+  ### falls back to a full ODL parse; see PDSImage.extractAttribs()
+  beginDate,beginTime = PDSImage.PDSImage().extractAttribs(metadatafile(fInput)
+                                                          ,[RANGEDATETIME+'/RANGEBEGINNINGDATE/VALUE'
+                                                           ,RANGEDATETIME+'/RANGEBEGINNINGTIME/VALUE'
+                                                           ])
 
-    ### Extract start time from dcmd (CoreMetadata) as ISO UTC string
-    firstTomsUTC = '%sT%s' % (dcmd['INVENTORYMETADATA']['RANGEDATETIME']['RANGEBEGINNINGDATE']['VALUE']
-                             ,dcmd['INVENTORYMETADATA']['RANGEDATETIME']['RANGEBEGINNINGTIME']['VALUE']
-                             ,)
+  return '%sT%s' % (beginDate,beginTime,)
+
+
+########################################################################
+def sunvectors(tomsZeroEpoch,tomsOffsetTimes):
+  """Earth-Sun vectors, one per row, converted to unit vectors"""
+
+  if not options.sun_direct:
+    return sunEphemeris.unitvectors(tomsZeroEpoch+tomsOffsetTimes)
+
+  return numpy.array([spice.vhat(spice.spkezr('SUN',tomsZeroEpoch+tomsOffsetTime,'IAU_EARTH','LT+S','EARTH')[0][:3])
+                      for tomsOffsetTime in tomsOffsetTimes
+                     ])
+
+
+########################################################################
+def zeroepoch(fInput,instrument):
+  """Start time, ISO UTC, and TOMS data zero epoch, ET, of input file"""
+
+  with instrument.stage('metadata'):
+    firstTomsUTC = starttime(fInput)
+    instrument.add('bytesread',fInput[COREMETADATA].size*fInput[COREMETADATA].dtype.itemsize)
 
     ### Combine start time and /Time offset to get the TOMS data zero epoch as seconds past J2000 epoch
     ### N.B. is typically (always?) equivalent to 1993-01-01T00:00:00 UTC
-    tomsZeroEpoch = spice.utc2et(firstTomsUTC) - tomsOffsetTimes[0]
+    tomsZeroEpoch = utcet.utc2et(firstTomsUTC) - fInput[GEOLOCATION+'/Time'][0]
+
+  return firstTomsUTC,tomsZeroEpoch
+
+
+########################################################################
+def glintblock(fInput,tomsZeroEpoch,rows,instrument):
+  """Read geolocation for a slice of rows, return their glint angles,
+     and --geometry products:  {product: array}
+  """
+
+  with instrument.stage('read'):
+    geolocation = readgeolocation(fInput,rows)
+    fields = readfields(fInput,rows)
+    instrument.add('bytesread',sum([a.nbytes for a in geolocation + list(fields.values()) if a is not None]))
+    if options.geometry_check: inputs = inputgeometry(fInput,rows)
+
+  results = glintproducts(tomsZeroEpoch,geolocation,instrument,fields)
+
+  if options.geometry_check: geometrycheck(results,inputs)
+
+  return results
+
+
+def glintproducts(tomsZeroEpoch,geolocation,instrument,fields=None):
+  """Glint angles, and --geometry products, of geolocation arrays from
+     readgeolocation():  {product: array}
+
+     With --select or --cull-dark, only the selected pixels are computed,
+     only rows that have any get TLE positions, and products are fill
+     values elsewhere; fields are from readfields()
+  """
+
+  tomsOffsetTimes,surfLatDegs,surfLonDegs,scAltKms,scLatDegs,scLonDegs = geolocation
+
+  with instrument.stage('sun'):
+    uvEarth2Suns = sunvectors(tomsZeroEpoch,tomsOffsetTimes)
+
+  if not (options.select or options.cull_dark):
+    return glintrows(tomsZeroEpoch,geolocation,uvEarth2Suns,None,instrument)
+
+  with instrument.stage('select'):
+    mask = selectmask(surfLonDegs,surfLatDegs,uvEarth2Suns,fields)
+    rowsUsed = mask.reshape((mask.shape[0],-1)).any(axis=1)
+  instrument.add('pixelscomputed',int(mask.sum()))
 
-    print('%s(Epoch)  %s(Start)  %s' % (spice.et2utc(tomsZeroEpoch,'ISOC',1),firstTomsUTC,fnInput,))
+  if rowsUsed.all():
+    return glintrows(tomsZeroEpoch,geolocation,uvEarth2Suns,mask,instrument)
 
-    ### Iterators
-    twoDshape = surfLonDegs.shape
-    rowIter,pixelIter = map(xrange,twoDshape)
+  ### Whole rows, or the whole swath, with no pixel to compute are fill
+  results = dict([(product,numpy.empty(surfLatDegs.shape,dtype=numpy.float32),) for product in products()])
+  for result in results.values(): result.fill(glintvec.DARK)
+  if not rowsUsed.any(): return results
 
-    glintAngles = numpy.zeros(twoDshape,dtype=numpy.float32)
+  def used(a):
+    if a is None: return None
+    return a[rowsUsed]
 
-    for row in rowIter:
+  usedResults = glintrows(tomsZeroEpoch
+                         ,[used(a) for a in geolocation]
+                         ,uvEarth2Suns[rowsUsed],mask[rowsUsed]
+                         ,instrument
+                         )
+  for product,result in usedResults.items(): results[product][rowsUsed] = result
+  return results
 
-      ### Earth-Sun vector, convert to unit vector
-      earth2Sun = spice.spkezr('SUN',tomsZeroEpoch+tomsOffsetTimes[row],'IAU_EARTH','LT+S','EARTH')[0][:3]
-      uvEarth2Sun = spice.vhat(earth2Sun)
 
-      scAltKm = scAltKms[row]
-      scLonDeg = scLonDegs[row]
-      scLatDeg = scLatDegs[row]
+def glintrows(tomsZeroEpoch,geolocation,uvEarth2Suns,mask,instrument):
+  """Spacecraft positions, then glint angles and --geometry products, of
+     rows of geolocation arrays; pixels outside mask (if not None) are
+     not computed:  {product: array}
+  """
+
+  tomsOffsetTimes,surfLatDegs,surfLonDegs,scAltKms,scLatDegs,scLonDegs = geolocation
+
+  if tle is not None or scAltKms is None or scLatDegs is None or scLonDegs is None:
+    with instrument.stage('tle'):
+      scAltKms,scLatDegs,scLonDegs = spacecraftpositions(tomsZeroEpoch,tomsOffsetTimes,scAltKms,scLatDegs,scLonDegs)
+
+  ### Glint angles, and any other products, for all rows in one call;
+  ### see glintvec.py
+  with instrument.stage('glint'):
+    return glintvec.geometry(scAltKms,scLonDegs,scLatDegs
+                            ,surfLonDegs,surfLatDegs
+                            ,uvEarth2Suns
+                            ,re,rp
+                            ,products=products()
+                            ,mask=mask
+                            )
+
+
+def selection():
+  """Parsed --select expression, tagselect.Selection; parsed once per
+     process
+  """
+  global selector
+  if selector is None: selector = tagselect.Selection(options.select)
+  return selector
+
+
+def readfields(fInput,rows=slice(None)):
+  """--select fields, for a slice of rows:  {name: array}; each from
+     Geolocation Fields, else Data Fields
+  """
+  fields = {}
+  if not options.select: return fields
+  for name in selection().names:
+    for group in (GEOLOCATION,DATAFIELDS,):
+      if group in fInput and name in fInput[group]:
+        fields[name] = fInput[group][name][rows]
+        break
+    else:
+      raise KeyError('--select field %s not found in %s or %s' % (name,GEOLOCATION,DATAFIELDS,))
+  return fields
+
+
+def selectmask(surfLonDegs,surfLatDegs,uvEarth2Suns,fields):
+  """Boolean array of pixels to compute, per --select and --cull-dark"""
+  mask = numpy.ones(numpy.shape(surfLatDegs),dtype=bool)
+  if options.select: mask &= selection().evaluate(fields,mask.shape)
+  if options.cull_dark: mask &= glintvec.daylit(surfLonDegs,surfLatDegs,uvEarth2Suns)
+  return mask
 
-      for pixel in pixelIter:
-        glintAngles[row,pixel] = glintangle(scAltKm
-                                           ,scLonDeg
-                                           ,scLatDeg
-                                           ,surfLonDegs[row,pixel]
-                                           ,surfLatDegs[row,pixel]
-                                           ,uvEarth2Sun
-                                           )
 
-    ### Get top level groups for copying
-    topGroups = []
-    def addtopgroup(name):
-      if name.find('/')==-1: topGroups.append(name)
+def products():
+  """Names of products to compute:  GlintAngle, then --geometry"""
+  return ['GlintAngle'] + [product for product in options.geometry if product != 'GlintAngle']
 
-    fInput.visit(addtopgroup)
 
-    for topGroup in topGroups: fOutput.copy( fInput[topGroup], topGroup)
+def productpath(product):
+  """HDF5 path of product in output file"""
+  if product == 'GlintAngle': return GLINTANGLE
+  return '%s/%s%s' % (GEOLOCATION,product,GEOMETRYSUFFIX,)
+
+
+def inputgeometry(fInput,rows):
+  """Input fields, for a slice of rows, of the same names as --geometry
+     products, and the zenith angles of azimuth products:  {name: array}
+  """
+  names = set()
+  for product in products()[1:]: names.update((product,)+AZIMUTHZENITHS.get(product,()))
+  geolocation = fInput[GEOLOCATION]
+  return dict([(name,geolocation[name][rows],) for name in names if name in geolocation])
+
+
+def geometrycheck(results,inputs):
+  """Accumulate maximum differences of products from input fields,
+     degrees, in geometryErrors; azimuth differences are wrapped to
+     [-180,180), and input fill values, azimuths near the zenith and
+     pixels not computed (--select, --cull-dark) are ignored
+  """
+  for product in products()[1:]:
+    if product not in inputs: continue
+    inputValues = inputs[product]
+    differences = results[product].astype(numpy.float64) - inputValues
+    valid = (numpy.abs(inputValues) <= 360.) & (results[product] < glintvec.DARK)
+    if product in AZIMUTHZENITHS:
+      differences = (differences+180.) % 360. - 180.
+      for zenith in AZIMUTHZENITHS[product]:
+        if zenith in inputs: valid &= numpy.abs(inputs[zenith]) >= NEARZENITH
+    differences = numpy.abs(differences[valid])
+    if differences.size: geometryErrors[product] = max(geometryErrors.get(product,0.),float(differences.max()))
+
+
+########################################################################
+def copygroups(fInput,fOutput):
+  """Copy top level groups of input HDF5 file to output HDF5 file
+
+     With --repack, numeric datasets are rewritten per --compression and
+     --shuffle instead of copied with their input layout; see repack()
+  """
+  if options.repack: return repack(fInput,fOutput)
+
+  topGroups = []
+  def addtopgroup(name):
+    if name.find('/')==-1: topGroups.append(name)
+
+  fInput.visit(addtopgroup)
+
+  for topGroup in topGroups: fOutput.copy( fInput[topGroup], topGroup)
+
+
+def copyattrs(inObject,outObject):
+  """Copy attributes, keeping their HDF5 types"""
+  for key in inObject.attrs:
+    outObject.attrs.create(key,inObject.attrs[key],dtype=inObject.attrs.get_id(key).dtype)
+
+
+def repack(fInput,fOutput):
+  """Copy all groups of input HDF5 file to output HDF5 file, rewriting
+     numeric datasets of REPACKMINIMUM or more elements, chunked (auto),
+     per --compression and --shuffle; other datasets are copied as-is
+  """
+  def repackitem(name,obj):
+    if isinstance(obj,h5py.Group):
+      copyattrs(obj,fOutput.require_group(name))
+    elif obj.shape is None or obj.dtype.kind not in 'biuf' or obj.size < REPACKMINIMUM:
+      fOutput.copy(obj,name)
+    else:
+      dataset = fOutput.create_dataset(name,shape=obj.shape,dtype=obj.dtype,chunks=True
+                                      ,fillvalue=obj.fillvalue
+                                      ,**filterkwargs()
+                                      )
+      dataset[...] = obj[()]
+      copyattrs(obj,dataset)
+
+  fInput.visititems(repackitem)
+
+
+########################################################################
+def linkgroups(fInput,fOutput,fnLink):
+  """Link output HDF5 file to contents of input HDF5 file
+
+     Creates the groups on the path to GlintAngle in the output file,
+     with the attributes of the input groups, and an HDF5 external link
+     to fnLink for every other member of each of those groups, so the
+     output file looks like a full copy but holds only GlintAngle
+  """
+  path = ''
+  for name in GLINTANGLE.split('/')[:-1] + [None]:
+
+    inGroup = fInput[path or '/']
+    outGroup = fOutput.require_group(path or '/')
+
+    for key,value in inGroup.attrs.items(): outGroup.attrs[key] = value
+
+    for member in inGroup:
+      if member != name:
+        outGroup[member] = h5py.ExternalLink(fnLink,'/'.join(['',path,member]).replace('//','/'))
+
+    if name is not None: path = path and '/'.join([path,name]) or name
+
+
+########################################################################
+def storagebytes(fInput):
+  """Total storage size of all datasets in HDF5 file, bytes"""
+  sizes = []
+  def addsize(name,obj):
+    if isinstance(obj,h5py.Dataset): sizes.append(obj.id.get_storage_size())
+
+  fInput.visititems(addsize)
+
+  return sum(sizes)
+
+
+########################################################################
+def filterkwargs():
+  """create_dataset() filter arguments per --compression and --shuffle"""
+  kwargs = dict(shuffle=options.shuffle)
+  if options.compression == 'gzip':
+    kwargs.update(compression='gzip',compression_opts=options.compression_level)
+  elif options.compression == 'lzf':
+    kwargs.update(compression='lzf')
+  return kwargs
+
+
+def glintdataset(fOutput,shape,chunkRows=None,product='GlintAngle'):
+  """Create GlintAngle, or --geometry product, dataset per --chunks,
+     --compression, --shuffle and --encoding
+
+     chunkRows is the rows per chunk of row blocks (--memory-budget),
+     unless --chunks is given; filters without chunks imply auto chunks
+  """
+  dtype,fillValue = ENCODINGS[options.encoding]
+  kwargs = filterkwargs()
+
+  chunks = chunkRows and (chunkRows,shape[1],) or None
+  if options.chunks is True:
+    chunks = True
+  elif options.chunks:
+    chunks = tuple([min(n,size) for n,size in zip(options.chunks,shape)])
+  if chunks is None and ('compression' in kwargs or options.shuffle): chunks = True
+
+  ### Any leftover of a failed append run is replaced
+  path = writepath(product)
+  if path in fOutput: del fOutput[path]
+
+  dataset = fOutput.create_dataset(path,shape=shape,dtype=dtype,chunks=chunks,fillvalue=fillValue,**kwargs)
+
+  dataset.attrs['_FillValue'] = fillValue
+  if options.encoding == 'int16':
+    dataset.attrs['scale_factor'] = numpy.float32(options.scale_factor)
+    dataset.attrs['add_offset'] = numpy.float32(ADDOFFSETS.get(product,0.))
+
+  return dataset
+
+
+def encodeglint(angles,product='GlintAngle'):
+  """Glint angles, or --geometry product, degrees, as stored per
+     --encoding; see ENCODINGS
+  """
+  dtype,fillValue = ENCODINGS[options.encoding]
+  if options.encoding != 'int16': return angles.astype(dtype)
+
+  dark = angles >= numpy.float32(glintvec.DARK)
+  packed = numpy.clip(numpy.round((angles-ADDOFFSETS.get(product,0.)) / options.scale_factor),-INT16LIMIT,INT16LIMIT)
+  return numpy.where(dark,fillValue,packed).astype(dtype)
+
+
+def writeproducts(fOutput,results):
+  """Create and write datasets of whole-swath results from glintblock()
+
+     Returns total storage size, bytes
+  """
+  nBytes = 0
+  for product in products():
+    dataset = glintdataset(fOutput,results[product].shape,product=product)
+    dataset[...] = encodeglint(results[product],product)
+    nBytes += dataset.id.get_storage_size()
+  replaceproducts(fOutput)
+  return nBytes
+
+
+def writepath(product):
+  """HDF5 path to write product to:  productpath(), plus NEWSUFFIX with
+     --output-mode=append
+  """
+  if options.output_mode == 'append': return productpath(product) + NEWSUFFIX
+  return productpath(product)
+
+
+def replaceproducts(fOutput):
+  """--output-mode=append:  replace any existing GlintAngle and --geometry
+     products with those written, complete, to writepath()
+  """
+  if options.output_mode != 'append': return
+  deleteproducts(fOutput)
+  for product in products(): fOutput.move(writepath(product),productpath(product))
 
+
+def deleteproducts(fOutput,suffix=''):
+  """Delete GlintAngle and --geometry products from file, --output-mode=append;
+     with suffix NEWSUFFIX, delete partly written products
+  """
+  for product in products():
+    if productpath(product)+suffix in fOutput: del fOutput[productpath(product)+suffix]
+
+
+########################################################################
+def prepareoutput(fnInput,fInput,fOutput):
+  """Put input file contents, other than GlintAngle, in output file
+
+     - copy:  copy all top level groups
+     - sidecar:  external links to input file; see linkgroups()
+     - append:  nothing to do; output file is input file
+  """
+  if options.output_mode == 'copy':
+    copygroups(fInput,fOutput)
+
+  elif options.output_mode == 'sidecar':
+    linkgroups(fInput,fOutput,os.path.relpath(fnInput,os.path.dirname(os.path.abspath(fOutput.filename))))
+
+
+########################################################################
+def tagfile(fnInput,overwrite=False,profile=False):
+  """Add GlintAngle to one TOMS/EP .he5 file, writing ..._glint.he5
+
+     If overwrite is True, replace any existing output
+     If profile is True, write cProfile dump to options.profile_dir
+
+     Returns (status, seconds, messages,)
+     - status is one of 'tagged', 'skipped', 'failed'
+     - messages is a list of (stream, text,) pairs, stream is 'stdout'
+       or 'stderr', for the caller to write; see report(); with
+       options.metrics, the last pair is ('metrics', record,), where
+       record is a dict from taginstrument.Instrument.finish()
+  """
+  t0 = time.time()
+  messages = []
+  instrument = taginstrument.Instrument(fnInput)
+
+  if profile:
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+  try:
+    status = _tagfile(fnInput,overwrite,messages,instrument)
+  except:
+    status = 'failed'
+    messages.append(('stderr',"### Failed to add glint to file '%s':\n%s" % (fnInput,traceback.format_exc(),),))
+
+  if profile:
+    profiler.disable()
+    profiler.dump_stats(os.path.join(options.profile_dir,os.path.basename(fnInput)+'.prof'))
+
+  if options.metrics: messages.append(('metrics',instrument.finish(status),))
+
+  return status, time.time()-t0, messages
+
+
+def tagjob(job):
+  """tagfile() wrapper for Pool.imap; job is (fnInput,overwrite,profile,)"""
+  return tagfile(*job)
+
+
+def outputskip(fnOutput,reason):
+  """Message for an output file, copy or sidecar mode, not created"""
+  return "### Skipping creation of glint file '%s'; %s\n" % (fnOutput,reason,)
+
+
+def openappend(fnInput,overwrite,instrument):
+  """--output-mode=append:  open input file 'r+'
+
+     Returns (file, None,), or (None, skip message,) if the file is not
+     writeable, or already contains GlintAngle and overwrite is False;
+     existing products are replaced only when written, see writeproducts()
+  """
+  try:
+    with instrument.stage('open'):
+      fInput = h5py.File(fnInput,'r+')
+  except (IOError,OSError):
+    return None,"### Skipping file '%s'; it is not writeable\n" % (fnInput,)
+
+  if GLINTANGLE in fInput and not overwrite:
     fInput.close()
+    return None,"### Skipping file '%s'; it already contains GlintAngle\n" % (fnInput,)
+
+  return fInput,None
+
+
+def _tagfile(fnInput,overwrite,messages,instrument):
 
-    fOutput.create_dataset('HDFEOS/SWATHS/EP TOMS Column Amount O3/Geolocation Fields/GlintAngle',data=glintAngles)
+  reason = skipreason(fnInput)
+  if reason:
+    messages.append(('stderr',"### Skipping file '%s'; %s\n" % (fnInput,reason,),))
+    return 'skipped'
 
+  if options.output_mode == 'append':
+
+    ### Add GlintAngle to input file in place
+    fnTemp = None
+    fInput,reason = openappend(fnInput,overwrite,instrument)
+    if reason:
+      messages.append(('stderr',reason,))
+      return 'skipped'
+    fOutput = fInput
+
+  else:
+
+    ### Write to temporary file, rename to output file when complete, so
+    ### a crash never leaves a partial output file under the final name
+    fnOutput = outputname(fnInput)
+    fnTemp = fnOutput + '.tmp'
+
+    if not overwrite and os.path.exists(fnOutput):
+      messages.append(('stderr',outputskip(fnOutput,'it already exists'),))
+      return 'skipped'
+
+    try:
+      with instrument.stage('open'):
+        fOutput = h5py.File(fnTemp,'w')
+    except (IOError,OSError) as e:
+      messages.append(('stderr',outputskip(fnOutput,"temporary file '%s' is un-writeable:  %s" % (fnTemp,e,)),))
+      return 'skipped'
+
+    ### Read HDF5 file
+    try:
+      with instrument.stage('open'):
+        fInput=h5py.File(fnInput,'r')
+    except:
+      fOutput.close()
+      os.remove(fnTemp)
+      raise
+
+  try:
+    writeglint(fnInput,fInput,fOutput,messages,instrument)
+  except:
+    if fInput is fOutput:
+      try:
+        deleteproducts(fOutput,NEWSUFFIX)
+      except:
+        pass
+    else:
+      fInput.close()
     fOutput.close()
+    if fnTemp: os.remove(fnTemp)
+    raise
+
+  with instrument.stage('close'):
+    if fInput is not fOutput: fInput.close()
+    fOutput.close()
+
+  if fnTemp:
+    instrument.add('byteswritten',os.path.getsize(fnTemp))
+    os.rename(fnTemp,fnOutput)
+
+  return 'tagged'
+
+
+def writeglint(fnInput,fInput,fOutput,messages,instrument):
+  """Calculate GlintAngle from input file, write it to output file"""
+
+  firstTomsUTC,tomsZeroEpoch = zeroepoch(fInput,instrument)
+
+  messages.append(('stdout','%s(Epoch)  %s(Start)  %s\n' % (utcet.et2utc(tomsZeroEpoch,'ISOC',1),firstTomsUTC,fnInput,),))
+
+  nRows,nPixels = fInput[GEOLOCATION+'/Latitude'].shape
+  rowsPerBlock = blockrows(nRows,nPixels,options.memory_budget)
+
+  instrument.add('pixels',nRows*nPixels)
+
+  def output():
+    with instrument.stage('output'):
+      prepareoutput(fnInput,fInput,fOutput)
+      if options.output_mode == 'copy': instrument.add('bytesread',storagebytes(fInput))
+
+  if rowsPerBlock >= nRows:
+
+    ### Whole swath in memory
+    results = glintblock(fInput,tomsZeroEpoch,slice(None),instrument)
+
+    output()
+
+    with instrument.stage('write'):
+      nBytes = writeproducts(fOutput,results)
+
+  else:
+
+    ### Row blocks:  read, compute and write each block into chunked GlintAngle
+    output()
+
+    datasets = dict([(product,glintdataset(fOutput,(nRows,nPixels,),rowsPerBlock,product),) for product in products()])
+
+    for row0 in range(0,nRows,rowsPerBlock):
+      rows = slice(row0,min(row0+rowsPerBlock,nRows))
+      results = glintblock(fInput,tomsZeroEpoch,rows,instrument)
+      with instrument.stage('write'):
+        for product,dataset in datasets.items(): dataset[rows] = encodeglint(results[product],product)
+
+    nBytes = sum([dataset.id.get_storage_size() for dataset in datasets.values()])
+    replaceproducts(fOutput)
+
+  if options.output_mode == 'append': instrument.add('byteswritten',nBytes)
+
+  checkmessages(fnInput,messages)
+
+
+def checkmessages(fnInput,messages):
+  """Add --sun-check, --tle-check and --geometry-check results so far
+     to messages
+  """
+
+  if options.sun_check and not options.sun_direct:
+    messages.append(('stderr',"### Sun ephemeris:  %d spkezr calls; maximum angular error %.3g radian so far; file '%s'\n"
+                               % (sunEphemeris.spkezrCalls,sunEphemeris.maxerror,fnInput,),))
+
+  if options.tle_check and tle is not None:
+    messages.append(('stderr',"### TLE check:  maximum Spacecraft* differences %.3fkm altitude, %.4fdeg latitude, %.4fdeg longitude so far; file '%s'\n"
+                               % (tleErrors['altitude'],tleErrors['latitude'],tleErrors['longitude'],fnInput,),))
+
+  if options.geometry_check:
+    messages.append(('stderr',"### Geometry check:  maximum differences from input fields %s so far; file '%s'\n"
+                               % (', '.join(['%.4fdeg %s' % (geometryErrors[product],product,) for product in sorted(geometryErrors)]) or 'none'
+                                 ,fnInput,),))
+
+
+########################################################################
+### Pipelined batch mode (--pipeline):  three stages, one process each,
+### linked by queues of at most --pipeline-depth files, so read, compute
+### and write of consecutive files overlap:
+###
+###   prefetch process:  open input, read metadata and the whole swath's
+###                      geolocation arrays of the next file(s)
+###   main process:      TLE, Sun vectors and glint angles
+###   writer process:    copy or link groups, write GlintAngle, close and
+###                      rename the output of the previous file(s)
+###
+### Processes rather than threads, because h5py holds the GIL during
+### HDF5 calls; all SPICE calls stay in the main process.  At most
+### 2*depth+3 files' arrays are in memory at once.
+
+class Granule:
+  """One input file in the --pipeline stages; passed between processes
+     without open HDF5 files
+  """
+
+  def __init__(self,job):
+    self.job = job
+    self.fnInput,self.overwrite = job[:2]
+    self.t0 = time.time()
+    self.messages = []
+    self.instrument = taginstrument.Instrument(self.fnInput)
+
+    ### Status is None until skipped, failed or tagged
+    self.status = None
+    self.firstTomsUTC = self.tomsZeroEpoch = None
+    self.geolocation = self.fields = self.inputs = self.results = None
+    self.spiceCalls = {}
+
+  ######################################################################
+  def skip(self,text):
+    self.status = 'skipped'
+    self.messages.append(('stderr',text,))
+
+  def fail(self):
+    self.status = 'failed'
+    self.messages.append(('stderr',"### Failed to add glint to file '%s':\n%s" % (self.fnInput,traceback.format_exc(),),))
+    self.geolocation = self.fields = self.inputs = self.results = None
+
+  def result(self):
+    """(status, seconds, messages,), as tagfile()
+
+       The stages ran in three processes:  the metrics record's CPU time
+       is the sum of the stages' CPU times, and its SPICE calls are those
+       of the compute stage
+    """
+    if options.metrics:
+      record = self.instrument.finish(self.status)
+      record['cpu'] = sum([times['cpu'] for times in record['stages'].values()])
+      record['spicecalls'] = self.spiceCalls
+      self.messages.append(('metrics',record,))
+    return self.status, time.time()-self.t0, self.messages
+
+
+def pipelinesetup(optionsArg):
+  """Prefetch and writer process setup:  options and leapseconds only"""
+  global options
+  options = optionsArg
+  utcet.load()
+
+
+def pipelineread(granule):
+  """Prefetch stage:  check input, read metadata and geolocation"""
+
+  fnInput,instrument = granule.fnInput,granule.instrument
+  fInput = None
+
+  try:
+    reason = skipreason(fnInput)
+    if reason: return granule.skip("### Skipping file '%s'; %s\n" % (fnInput,reason,))
+
+    if options.output_mode == 'append':
+      fInput,reason = openappend(fnInput,granule.overwrite,instrument)
+      if reason: return granule.skip(reason)
+
+    else:
+      fnOutput = outputname(fnInput)
+      if os.path.exists(fnOutput) and not granule.overwrite:
+        return granule.skip(outputskip(fnOutput,'it already exists'))
+      with instrument.stage('open'):
+        fInput = h5py.File(fnInput,'r')
+
+    granule.firstTomsUTC,granule.tomsZeroEpoch = zeroepoch(fInput,instrument)
+
+    with instrument.stage('read'):
+      granule.geolocation = readgeolocation(fInput)
+      granule.fields = readfields(fInput)
+      instrument.add('bytesread',sum([a.nbytes for a in granule.geolocation + list(granule.fields.values()) if a is not None]))
+      if options.geometry_check: granule.inputs = inputgeometry(fInput,slice(None))
+
+  except:
+    granule.fail()
+
+  if fInput is not None: fInput.close()
+
+
+def pipelinecompute(granule):
+  """Compute stage, main process:  glint angles"""
+
+  if granule.status is not None: return
+
+  spiceCalls0 = dict(taginstrument.spiceCalls)
+
+  try:
+    granule.messages.append(('stdout','%s(Epoch)  %s(Start)  %s\n'
+                                      % (utcet.et2utc(granule.tomsZeroEpoch,'ISOC',1),granule.firstTomsUTC,granule.fnInput,),))
+    granule.instrument.add('pixels',granule.geolocation[1].size)
+    granule.results = glintproducts(granule.tomsZeroEpoch,granule.geolocation,granule.instrument,granule.fields)
+    if options.geometry_check: geometrycheck(granule.results,granule.inputs)
+    granule.geolocation = granule.fields = granule.inputs = None
+    checkmessages(granule.fnInput,granule.messages)
+  except:
+    granule.fail()
+
+  granule.spiceCalls = dict([(name,count-spiceCalls0.get(name,0),) for name,count in taginstrument.spiceCalls.items()
+                             if count > spiceCalls0.get(name,0)
+                            ])
+
+
+def pipelinewrite(granule):
+  """Write stage:  output file contents and GlintAngle; close, rename"""
+
+  if granule.status is not None: return
+
+  fnInput,instrument = granule.fnInput,granule.instrument
+  fInput = fOutput = fnTemp = None
+
+  try:
+    if options.output_mode == 'append':
+      with instrument.stage('open'):
+        fInput = fOutput = h5py.File(fnInput,'r+')
+    else:
+      fnOutput = outputname(fnInput)
+      fnTemp = fnOutput + '.tmp'
+      try:
+        with instrument.stage('open'):
+          fOutput = h5py.File(fnTemp,'w')
+      except (IOError,OSError) as e:
+        granule.results = None
+        return granule.skip(outputskip(fnOutput,"temporary file '%s' is un-writeable:  %s" % (fnTemp,e,)))
+      with instrument.stage('open'):
+        fInput = h5py.File(fnInput,'r')
+
+    with instrument.stage('output'):
+      prepareoutput(fnInput,fInput,fOutput)
+      if options.output_mode == 'copy': instrument.add('bytesread',storagebytes(fInput))
+
+    with instrument.stage('write'):
+      nBytes = writeproducts(fOutput,granule.results)
+    if not fnTemp: instrument.add('byteswritten',nBytes)
+    granule.results = None
+
+    with instrument.stage('close'):
+      if fInput is not fOutput: fInput.close()
+      fOutput.close()
+
+    if fnTemp:
+      instrument.add('byteswritten',os.path.getsize(fnTemp))
+      os.rename(fnTemp,fnOutput)
+
+    granule.status = 'tagged'
+
+  except:
+    granule.fail()
+    if fInput is fOutput and fOutput is not None and fOutput.id.valid:
+      try:
+        deleteproducts(fOutput,NEWSUFFIX)
+      except:
+        pass
+    for f in set([fInput,fOutput]):
+      if f is not None and f.id.valid: f.close()
+    if fnTemp and os.path.exists(fnTemp): os.remove(fnTemp)
+
+
+def pipelinereader(jobs,readQueue,optionsArg,mainPid):
+  """Prefetch process; mainPid is the main process, which takes from
+     readQueue
+  """
+  pipelinesetup(optionsArg)
+  for job in jobs:
+    granule = Granule(job)
+    pipelineread(granule)
+    pipelineput(readQueue,granule,parentPid=mainPid)
+  pipelineput(readQueue,None,parentPid=mainPid)
+
+
+def pipelinewriter(writeQueue,doneQueue,optionsArg,mainPid):
+  """Writer process; mainPid is the main process, which puts to
+     writeQueue
+  """
+  pipelinesetup(optionsArg)
+  while True:
+    granule = pipelineget(writeQueue,parentPid=mainPid)
+    if granule is None: break
+    pipelinewrite(granule)
+    doneQueue.put(granule)
+  doneQueue.put(None)
+
+
+def pipelinecheck(stageQueue,process,parentPid):
+  """Raise RuntimeError if the process at the other end of stageQueue
+     has died:  process, or, from a stage process, its parent process
+     parentPid; items still buffered for it are abandoned, so that this
+     process can exit
+  """
+  if process is not None and not process.is_alive():
+    message = '--pipeline %s process exited with code %s' % (process.name,process.exitcode,)
+  elif parentPid is not None and os.getppid() != parentPid:
+    message = '--pipeline main process %d exited' % (parentPid,)
+  else:
+    return
+  stageQueue.cancel_join_thread()
+  raise RuntimeError(message)
+
+
+def pipelineget(stageQueue,process=None,block=True,parentPid=None):
+  """Next item from a stage's queue; queue.Empty if not block and none
+     is ready; raises RuntimeError if the process putting to it has died
+     (see pipelinecheck)
+  """
+  while True:
+    try:
+      return stageQueue.get(block,1.)
+    except queue.Empty:
+      pipelinecheck(stageQueue,process,parentPid)
+      if not block: raise
+
+
+def pipelineput(stageQueue,item,process=None,parentPid=None):
+  """Put item on a stage's bounded queue; raises RuntimeError if the
+     process taking from it has died (see pipelinecheck)
+  """
+  while True:
+    try:
+      return stageQueue.put(item,True,1.)
+    except queue.Full:
+      pipelinecheck(stageQueue,process,parentPid)
+
+
+def pipeline(jobs,depth,record):
+  """Process jobs in the --pipeline stages; see above
+
+     record(job,status,seconds,messages) is called in the main process,
+     in input order
+  """
+  readQueue = multiprocessing.Queue(depth)
+  writeQueue = multiprocessing.Queue(depth)
+  doneQueue = multiprocessing.Queue()
+
+  reader = multiprocessing.Process(target=pipelinereader,args=(jobs,readQueue,options,os.getpid(),),name='prefetch')
+  writer = multiprocessing.Process(target=pipelinewriter,args=(writeQueue,doneQueue,options,os.getpid(),),name='writer')
+
+  def recorddone(block):
+    while True:
+      try:
+        granule = pipelineget(doneQueue,writer,block)
+      except queue.Empty:
+        return
+      if granule is None: return
+      record(*((granule.job,)+granule.result()))
+
+  reader.start()
+  writer.start()
+  try:
+    while True:
+      granule = pipelineget(readQueue,reader)
+      if granule is None: break
+      pipelinecompute(granule)
+      pipelineput(writeQueue,granule,writer)
+      recorddone(False)
+
+    pipelineput(writeQueue,None,writer)
+    recorddone(True)
+    reader.join()
+    writer.join()
+  except:
+    reader.terminate()
+    writer.terminate()
+    for stageQueue in (readQueue,writeQueue,): stageQueue.cancel_join_thread()
+    raise
+
+
+########################################################################
+def report(messages):
+  """Write messages from tagfile() to stdout/stderr; skip metrics"""
+  for stream,text in messages:
+    if stream not in ('stdout','stderr',): continue
+    stream = stream=='stdout' and sys.stdout or sys.stderr
+    stream.write(text)
+    stream.flush()
+
+
+########################################################################
+def summarize(results):
+  """Write per-file status summary to stderr
+
+     results is a list of (fnInput, status, seconds,)
+  """
+  counts = {}
+  for fnInput,status,seconds in results:
+    counts[status] = counts.get(status,0) + 1
+    sys.stderr.write('### %-7s %8.2fs  %s\n' % (status,seconds,fnInput,))
+
+  sys.stderr.write('### Summary:  %d file(s); %s\n'
+                  % (len(results),', '.join(['%d %s' % (counts[k],k,) for k in sorted(counts)]),)
+                  )
+  sys.stderr.flush()
+
+
+########################################################################
+def chunkshape(text):
+  """--chunks value:  'auto', or ROWS,PIXELS"""
+  if text == 'auto': return True
+  try:
+    rows,pixels = [int(n) for n in text.split(',')]
+    assert rows > 0 and pixels > 0
+  except:
+    raise argparse.ArgumentTypeError("expected 'auto' or ROWS,PIXELS; got %r" % (text,))
+  return rows,pixels
+
+
+def scalefactor(text):
+  """--scale-factor value:  large enough that no product saturates int16;
+     see INT16ANGLE
+  """
+  try:
+    scale = float(text)
+  except ValueError:
+    raise argparse.ArgumentTypeError('expected a number; got %r' % (text,))
+  if not (scale >= INT16ANGLE / INT16LIMIT):
+    raise argparse.ArgumentTypeError('%r is too small; +/-%g deg would not fit in int16, need at least %.7f' % (text,INT16ANGLE,INT16ANGLE/INT16LIMIT,))
+  return scale
+
+
+def selectexpression(text):
+  """--select value:  checked tagselect.py expression"""
+  try:
+    tagselect.Selection(text)
+  except ValueError as e:
+    raise argparse.ArgumentTypeError(str(e))
+  return text
+
+
+def geometrylist(text):
+  """--geometry value:  'all', or comma-separated glintvec.PRODUCTS"""
+  if text == 'all': return list(glintvec.PRODUCTS[1:])
+  geometry = [product for product in text.split(',') if product]
+  unknown = [product for product in geometry if product not in glintvec.PRODUCTS]
+  if unknown: raise argparse.ArgumentTypeError('unknown product(s) %s; expected %s' % (','.join(unknown),','.join(glintvec.PRODUCTS),))
+  return geometry
+
+
+########################################################################
+def makeparser():
+  """Command-line parser; parse_args([]) gives the default options"""
+
+  parser = argparse.ArgumentParser(description='Add GlintAngle to TOMS/EP .he5 files')
+  parser.add_argument('--workers',type=int,default=1
+                     ,help='Number of worker processes (default 1; 0 => one per CPU)')
+  parser.add_argument('--output-mode',choices=('copy','append','sidecar',),default='copy'
+                     ,help='copy input to ..._glint.he5 (default); append to input, replacing products only when all are written; sidecar ..._glint.he5 with external links')
+  parser.add_argument('--manifest',default=None,metavar='SQLITE'
+                     ,help='Processing manifest; skip files already done, redo failed or stale files')
+  parser.add_argument('--manifest-hash',action='store_true',default=False
+                     ,help='Record SHA-1 of inputs in manifest; unchanged hash => not stale')
+  parser.add_argument('--memory-budget',type=float,default=None,metavar='MiB'
+                     ,help='Process rows in blocks to keep memory under MiB per process')
+  parser.add_argument('--sun-direct',action='store_true',default=False
+                     ,help='Call spkezr for every scan row; no interpolation')
+  parser.add_argument('--sun-check',action='store_true',default=False
+                     ,help='Report interpolated Sun vector error against spkezr')
+  parser.add_argument('--metrics',default=None,metavar='FILE'
+                     ,help='Write per-file stage timings, throughput and SPICE call counts to FILE')
+  parser.add_argument('--metrics-format',choices=('jsonl','prometheus',),default='jsonl'
+                     ,help='jsonl:  one JSON record per file (default); prometheus:  run totals, text format')
+  parser.add_argument('--profile-dir',default=None,metavar='DIR'
+                     ,help='Write cProfile dumps for sampled files to DIR')
+  parser.add_argument('--profile-every',type=int,default=100,metavar='N'
+                     ,help='Profile the first of every N files (default 100)')
+  parser.add_argument('--tle',default=None,metavar='FILE'
+                     ,help='Earth Probe two-line elements, for missing Spacecraft* fields')
+  parser.add_argument('--tle-check',action='store_true',default=False
+                     ,help='Report Spacecraft* field differences from --tle positions')
+  parser.add_argument('--chunks',type=chunkshape,default=None,metavar='ROWS,PIXELS'
+                     ,help="GlintAngle chunk shape, or 'auto'")
+  parser.add_argument('--compression',choices=('none','gzip','lzf',),default='none'
+                     ,help='GlintAngle (and --repack) compression filter')
+  parser.add_argument('--compression-level',type=int,default=4,metavar='N'
+                     ,help='gzip level, 0-9 (default 4)')
+  parser.add_argument('--shuffle',action='store_true',default=False
+                     ,help='Byte shuffle filter before compression')
+  parser.add_argument('--encoding',choices=sorted(ENCODINGS),default='float32'
+                     ,help='GlintAngle storage type (default float32)')
+  parser.add_argument('--scale-factor',type=scalefactor,default=0.01,metavar='DEG'
+                     ,help='int16 encoding scale_factor, degrees (default 0.01; at least 180/32766)')
+  parser.add_argument('--repack',action='store_true',default=False
+                     ,help='copy mode:  rewrite copied numeric datasets per --compression/--shuffle')
+  parser.add_argument('--geometry',type=geometrylist,default=[],metavar='PRODUCT,...'
+                     ,help="Also write these glintvec.PRODUCTS, or 'all', as <product>%s" % (GEOMETRYSUFFIX,))
+  parser.add_argument('--geometry-check',action='store_true',default=False
+                     ,help='Report --geometry product differences from input fields of the same names')
+  parser.add_argument('--pipeline',action='store_true',default=False
+                     ,help='With --workers=1, overlap read, compute and write of consecutive files')
+  parser.add_argument('--pipeline-depth',type=int,default=1,metavar='N'
+                     ,help='Files queued between --pipeline stages (default 1)')
+  parser.add_argument('--select',type=selectexpression,default=None,metavar='EXPR'
+                     ,help='Compute only pixels where EXPR over swath fields is true; see tagselect.py')
+  parser.add_argument('--cull-dark',action='store_true',default=False
+                     ,help='Compute only day-side pixels, by an inexpensive test made first')
+  parser.add_argument('files',nargs='*',help='TOMS/EP .he5 files')
+
+  return parser
+
+
+########################################################################
+def main(argv):
+
+  options = makeparser().parse_args(argv)
+
+  if not options.files: return
+
+  workers = options.workers or multiprocessing.cpu_count()
+
+  results = []
+
+  ### With a manifest, skip files already done; (re)do the rest,
+  ### replacing any output left by a failed, stale or interrupted run
+  manifest = options.manifest and tagmanifest.Manifest(options.manifest,usehash=options.manifest_hash)
+
+  jobs = []
+  for fnInput in options.files:
+
+    if manifest and not skipreason(fnInput):
+      fnOutput = options.output_mode == 'append' and fnInput or outputname(fnInput)
+      if manifest.needed(fnInput,fnOutput) is None:
+        report([('stderr',"### Skipping file '%s'; done per manifest\n" % (fnInput,),)])
+        results.append((fnInput,'skipped',0.,))
+        continue
+      manifest.start(fnInput,fnOutput,options.output_mode)
+
+    jobs.append((fnInput,bool(manifest)
+                ,bool(options.profile_dir) and len(jobs) % max(1,options.profile_every) == 0
+                ,))
+
+  metrics = options.metrics and taginstrument.MetricsWriter(options.metrics,options.metrics_format)
+
+  if options.profile_dir and not os.path.isdir(options.profile_dir): os.makedirs(options.profile_dir)
+
+  def record(job,status,seconds,messages):
+    report(messages)
+    if metrics:
+      for stream,text in messages:
+        if stream == 'metrics': metrics.write(text)
+    results.append((job[0],status,seconds,))
+    if manifest and not skipreason(job[0]):
+      manifest.finish(job[0],status=='tagged' and 'done' or status,seconds
+                     ,''.join([text for stream,text in messages if stream=='stderr'])
+                     )
+
+  if workers > 1 and len(jobs) > 1:
+
+    ### Each worker loads the kernels once; the parent process writes
+    ### the messages for one file at a time, in input order
+    pool = multiprocessing.Pool(min(workers,len(jobs)),initializer=setup,initargs=(options,))
+    try:
+      for job,(status,seconds,messages,) in zip(jobs,pool.imap(tagjob,jobs)):
+        record(job,status,seconds,messages)
+      pool.close()
+    except:
+      pool.terminate()
+      raise
+    finally:
+      pool.join()
+
+  elif jobs and options.pipeline:
+
+    ### Prefetch and writer processes; see pipeline()
+    setup(options)
+    pipeline(jobs,max(1,options.pipeline_depth),record)
+
+  elif jobs:
+
+    setup(options)
+
+    for job in jobs:
+      status,seconds,messages = tagjob(job)
+      record(job,status,seconds,messages)
+
+  if manifest: manifest.close()
+
+  summarize(results)
+
+
+if __name__=="__main__" and sys.argv[1:]:
+  main(sys.argv[1:])
 
 """
 HDFEOS
@@ -0,0 +1,165 @@
+"""
+taginstrument.py - Profiling and throughput instrumentation for tag.py
+
+Per-file records of stage wall and CPU times, pixel counts and rates,
+bytes read and written, and SPICE call counts; written as JSON lines,
+one record per file, or as a Prometheus text-format file of totals over
+the run (rewritten atomically after each file, e.g. for the node
+exporter textfile collector).
+
+Usage:
+
+  import taginstrument
+  taginstrument.countspice(spice)           ### once per process
+
+  instrument = taginstrument.Instrument(fnInput)
+  with instrument.stage('read'):
+    ...
+  instrument.add('pixels',nPixels)
+  record = instrument.finish('tagged')
+
+  writer = taginstrument.MetricsWriter('metrics.jsonl','jsonl')
+  writer.write(record)
+
+"""
+
+import os
+import json
+import time
+import contextlib
+
+### CPU time of this process
+cputime = getattr(time,'process_time',None) or time.clock
+
+### SPICE calls per function name, this process; see countspice()
+spiceCalls = {}
+
+
+########################################################################
+def countspice(spiceModule):
+  """Wrap every function of the SPICE module with a call counter
+
+     Call once per process; all modules that use spice.xxx() will then
+     be counted in spiceCalls
+  """
+  if getattr(spiceModule,'_tagCounted',False): return
+
+  def counted(name,function):
+    def wrapper(*args,**kwargs):
+      spiceCalls[name] = spiceCalls.get(name,0) + 1
+      return function(*args,**kwargs)
+    return wrapper
+
+  for name in dir(spiceModule):
+    function = getattr(spiceModule,name)
+    if name[:1] != '_' and callable(function) and not isinstance(function,type):
+      setattr(spiceModule,name,counted(name,function))
+
+  spiceModule._tagCounted = True
+
+
+class Instrument:
+  """Stage timings and counters for one file"""
+
+  def __init__(self,fnInput):
+    self.fnInput = fnInput
+    self.wall = {}
+    self.cpu = {}
+    self.counters = {}
+    self._spiceCalls0 = dict(spiceCalls)
+    self._wall0 = time.time()
+    self._cpu0 = cputime()
+
+  ######################################################################
+  @contextlib.contextmanager
+  def stage(self,name):
+    """Accumulate wall and CPU time of a with-block under stage name"""
+    wall0,cpu0 = time.time(),cputime()
+    try:
+      yield
+    finally:
+      self.wall[name] = self.wall.get(name,0.) + time.time() - wall0
+      self.cpu[name] = self.cpu.get(name,0.) + cputime() - cpu0
+
+  ######################################################################
+  def add(self,name,value):
+    """Add value to counter name, e.g. 'pixels', 'bytesread'"""
+    self.counters[name] = self.counters.get(name,0) + value
+
+  ######################################################################
+  def finish(self,status):
+    """Return this file's record, a JSON-serializable dict"""
+
+    wall = time.time() - self._wall0
+
+    calls = dict([(name,count-self._spiceCalls0.get(name,0),) for name,count in spiceCalls.items()
+                  if count > self._spiceCalls0.get(name,0)
+                 ])
+
+    record = dict(file=self.fnInput
+                 ,status=status
+                 ,time=self._wall0
+                 ,pid=os.getpid()
+                 ,wall=wall
+                 ,cpu=cputime()-self._cpu0
+                 ,stages=dict([(name,dict(wall=self.wall[name],cpu=self.cpu[name],),) for name in self.wall])
+                 ,spicecalls=calls
+                 )
+    record.update(self.counters)
+    record['pixelspersecond'] = wall > 0. and self.counters.get('pixels',0) / wall or 0.
+
+    return record
+
+
+class MetricsWriter:
+  """Write per-file records as JSON lines, or as Prometheus text totals
+
+     Arguments:
+       path -- output file
+       format -- 'jsonl' (append one line per file) or 'prometheus'
+  """
+
+  def __init__(self,path,format='jsonl'):
+    self.path = path
+    self.format = format
+    self.totals = {}
+
+  ######################################################################
+  def write(self,record):
+
+    if self.format == 'jsonl':
+      f = open(self.path,'a')
+      f.write(json.dumps(record,sort_keys=True) + '\n')
+      f.close()
+      return
+
+    ### Prometheus:  accumulate totals, rewrite file atomically
+    def inc(key,value): self.totals[key] = self.totals.get(key,0) + value
+
+    inc(('tag_files_total','status="%s"' % (record['status'],),),1)
+    inc(('tag_file_seconds_total','kind="wall"',),record['wall'])
+    inc(('tag_file_seconds_total','kind="cpu"',),record['cpu'])
+    for name,times in record['stages'].items():
+      for kind in ('wall','cpu',):
+        inc(('tag_stage_seconds_total','stage="%s",kind="%s"' % (name,kind,),),times[kind])
+    for name,count in record['spicecalls'].items():
+      inc(('tag_spice_calls_total','function="%s"' % (name,),),count)
+    for name in ('pixels','bytesread','byteswritten',):
+      inc(('tag_%s_total' % (name,),'',),record.get(name,0))
+    if 'pixelscomputed' in record: inc(('tag_pixelscomputed_total','',),record['pixelscomputed'])
+
+    self.totals[('tag_last_pixels_per_second','',)] = record['pixelspersecond']
+
+    lines = []
+    lastMetric = None
+    for (metric,labels),value in sorted(self.totals.items()):
+      if metric != lastMetric:
+        lastMetric = metric
+        lines.append('# TYPE %s %s' % (metric,metric.endswith('_total') and 'counter' or 'gauge',))
+      lines.append('%s%s %r' % (metric,labels and '{%s}' % (labels,) or '',float(value),))
+
+    fnTemp = self.path + '.tmp'
+    f = open(fnTemp,'w')
+    f.write('\n'.join(lines) + '\n')
+    f.close()
+    os.rename(fnTemp,self.path)
@@ -0,0 +1,136 @@
+"""
+tagmanifest.py - Processing manifest for resumable tag.py batch runs
+
+SQLite database with one row per input file, recording the input size,
+mtime and (optionally) SHA-1 hash, the output file, the processing
+status and timing.  Used by the parent tag.py process only, so pool
+workers never contend for the database.
+
+A file needs (re)processing if
+  - it has no row, or
+  - its status is not 'done' (e.g. 'running' after a crash, or 'failed'), or
+  - its size or mtime have changed (and, if hashing, its SHA-1 has changed), or
+  - its output file is missing
+
+Usage:
+
+  import tagmanifest
+  manifest = tagmanifest.Manifest('TOMSEPL2/tag_manifest.sqlite')
+  reason = manifest.needed(fnInput,fnOutput)   ### None if already done
+  manifest.start(fnInput,fnOutput,'copy')
+  manifest.finish(fnInput,'done',seconds,'')
+
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+
+
+class Manifest:
+  """Processing manifest; see module docstring
+
+     Arguments:
+       path -- SQLite database file; created if it does not exist
+       usehash -- compare SHA-1 hashes of inputs whose size or mtime
+                  have changed, instead of treating them as stale
+  """
+
+  def __init__(self,path,usehash=False):
+    self.path = path
+    self.usehash = usehash
+    self._db = sqlite3.connect(path)
+    self._db.execute("""CREATE TABLE IF NOT EXISTS files
+                        ( input TEXT PRIMARY KEY
+                        , size INTEGER
+                        , mtime REAL
+                        , sha1 TEXT
+                        , output TEXT
+                        , mode TEXT
+                        , status TEXT
+                        , started REAL
+                        , finished REAL
+                        , seconds REAL
+                        , message TEXT
+                        )""")
+    self._db.commit()
+
+  ######################################################################
+  def _key(self,fnInput):
+    return os.path.abspath(fnInput)
+
+  ######################################################################
+  def _sha1(self,fnInput):
+    sha1 = hashlib.sha1()
+    f = open(fnInput,'rb')
+    try:
+      for block in iter(lambda: f.read(1<<20),b''): sha1.update(block)
+    finally:
+      f.close()
+    return sha1.hexdigest()
+
+  ######################################################################
+  def row(self,fnInput):
+    """Return row for input file as dict, or None"""
+    cursor = self._db.execute('SELECT * FROM files WHERE input=?',(self._key(fnInput),))
+    values = cursor.fetchone()
+    if values is None: return None
+    return dict(zip([d[0] for d in cursor.description],values))
+
+  ######################################################################
+  def needed(self,fnInput,fnOutput):
+    """Return reason file needs processing, or None if it is done"""
+
+    row = self.row(fnInput)
+    if row is None: return 'new'
+
+    if row['status'] != 'done': return 'previous status was %s' % (row['status'],)
+
+    if not os.path.exists(fnOutput): return 'output is missing'
+
+    st = os.stat(fnInput)
+    if st.st_size == row['size'] and st.st_mtime == row['mtime']: return None
+
+    if self.usehash and row['sha1'] and st.st_size == row['size']:
+      if self._sha1(fnInput) == row['sha1']:
+        ### Same contents:  update mtime so hash is not needed next time
+        self._db.execute('UPDATE files SET mtime=? WHERE input=?',(st.st_mtime,self._key(fnInput),))
+        self._db.commit()
+        return None
+
+    return 'input has changed'
+
+  ######################################################################
+  def start(self,fnInput,fnOutput,mode):
+    """Record start of processing for input file"""
+    st = os.stat(fnInput)
+    self._db.execute('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?,?,?)'
+                    ,(self._key(fnInput),st.st_size,st.st_mtime
+                     ,self.usehash and self._sha1(fnInput) or None
+                     ,os.path.abspath(fnOutput),mode
+                     ,'running',time.time(),None,None,None
+                     ,))
+    self._db.commit()
+
+  ######################################################################
+  def finish(self,fnInput,status,seconds,message=''):
+    """Record end of processing:  status 'done', 'failed' or 'skipped'
+
+       Input files modified in place (mode 'append') are re-stat'ed
+    """
+    row = self.row(fnInput)
+    if status == 'done' and row and row['mode'] == 'append':
+      st = os.stat(fnInput)
+      self._db.execute('UPDATE files SET size=?, mtime=?, sha1=? WHERE input=?'
+                      ,(st.st_size,st.st_mtime
+                       ,self.usehash and self._sha1(fnInput) or None
+                       ,self._key(fnInput)
+                       ,))
+    self._db.execute('UPDATE files SET status=?, finished=?, seconds=?, message=? WHERE input=?'
+                    ,(status,time.time(),seconds,message,self._key(fnInput),))
+    self._db.commit()
+
+  ######################################################################
+  def close(self):
+    self._db.close()
@@ -0,0 +1,178 @@
+"""
+tagselect.py - Pixel selection expressions for tag.py --select
+
+A selection is a Python-syntax expression over TOMS/EP swath field names
+(Geolocation Fields or Data Fields), evaluated with NumPy to a boolean
+mask of the pixels to compute.  Only a small, safe subset of Python is
+accepted, checked when the expression is parsed:  field names, integer
+and float constants, parentheses, and the operators
+
+  and  or  not                        (element-wise)
+  ==  !=  <  <=  >  >=                (chains allowed, e.g. 0 < x < 5)
+  &  |  ^  ~  <<  >>                  (bitwise, for flag fields)
+  +  -  *  /  //  %
+
+No calls, attributes, subscripts or other names are allowed.
+
+N.B. as in Python, & binds tighter than comparisons but looser than
+<< and arithmetic:  write (GroundPixelQualityFlags & 15) == 0, not
+GroundPixelQualityFlags & 15 == 0.
+
+Fields with one value per row (e.g. MeasurementQualityFlags, shape
+(nRows,)) are broadcast across the pixels of the row.
+
+Usage:
+
+  import tagselect
+  selection = tagselect.Selection('(GroundPixelQualityFlags & 15) == 0 and MeasurementQualityFlags == 0')
+  selection.names                      ### field names, sorted
+  mask = selection.evaluate(dict(GroundPixelQualityFlags=...,MeasurementQualityFlags=...)
+                           ,(nRows,nPixels)
+                           )
+
+"""
+
+import ast
+import sys
+import numpy
+
+try:
+  NUMBERS = (int,long,float,)
+except NameError:
+  NUMBERS = (int,float,)
+
+### Constant node type and its value attribute, resolved once:  ast.parse
+### makes Constant nodes from Python 3.8 on (ast.Num is deprecated, and
+### warns when used); Num nodes before, although 3.6 and 3.7 define
+### ast.Constant
+if sys.version_info >= (3,8,):
+  CONSTANT,CONSTANTVALUE = ast.Constant,'value'
+else:
+  CONSTANT,CONSTANTVALUE = ast.Num,'n'
+
+BINARYOPERATORS = {ast.BitAnd:numpy.bitwise_and
+                  ,ast.BitOr:numpy.bitwise_or
+                  ,ast.BitXor:numpy.bitwise_xor
+                  ,ast.LShift:numpy.left_shift
+                  ,ast.RShift:numpy.right_shift
+                  ,ast.Add:numpy.add
+                  ,ast.Sub:numpy.subtract
+                  ,ast.Mult:numpy.multiply
+                  ,ast.Div:numpy.true_divide
+                  ,ast.FloorDiv:numpy.floor_divide
+                  ,ast.Mod:numpy.mod
+                  }
+
+COMPARISONS = {ast.Eq:numpy.equal
+              ,ast.NotEq:numpy.not_equal
+              ,ast.Lt:numpy.less
+              ,ast.LtE:numpy.less_equal
+              ,ast.Gt:numpy.greater
+              ,ast.GtE:numpy.greater_equal
+              }
+
+UNARYOPERATORS = {ast.Not:numpy.logical_not
+                 ,ast.Invert:numpy.invert
+                 ,ast.USub:numpy.negative
+                 ,ast.UAdd:numpy.positive
+                 }
+
+
+########################################################################
+class Selection:
+  """Parsed, checked selection expression; see module docstring
+
+     Raises ValueError for syntax errors and disallowed constructs
+  """
+
+  def __init__(self,expression):
+    self.expression = expression
+    try:
+      self.tree = ast.parse(expression.strip(),mode='eval')
+    except SyntaxError as e:
+      raise ValueError('Selection syntax error:  %s; %r' % (e.msg,expression,))
+    names = set()
+    self._check(self.tree.body,names)
+    self.names = sorted(names)
+
+  ######################################################################
+  def _check(self,node,names):
+    """Raise ValueError unless every node is allowed; collect names"""
+
+    if isinstance(node,ast.Name):
+      names.add(node.id)
+      return
+
+    if constant(node) is not None: return
+
+    if isinstance(node,ast.BoolOp) and isinstance(node.op,(ast.And,ast.Or,)):
+      children = node.values
+    elif isinstance(node,ast.BinOp) and type(node.op) in BINARYOPERATORS:
+      children = [node.left,node.right]
+    elif isinstance(node,ast.UnaryOp) and type(node.op) in UNARYOPERATORS:
+      children = [node.operand]
+    elif isinstance(node,ast.Compare) and not [op for op in node.ops if type(op) not in COMPARISONS]:
+      children = [node.left] + node.comparators
+    else:
+      raise ValueError('Selection may not contain %s:  %r' % (type(node).__name__,self.expression,))
+
+    for child in children: self._check(child,names)
+
+  ######################################################################
+  def evaluate(self,fields,shape):
+    """Boolean mask, shaped shape, of pixels selected
+
+       fields -- {name: array} of at least self.names; arrays shaped as
+                 a leading part of shape, e.g. (nRows,) for (nRows,nPixels)
+    """
+    ndim = len(shape)
+    values = {}
+    for name in self.names:
+      a = numpy.asarray(fields[name])
+      if a.shape != tuple(shape[:a.ndim]):
+        raise ValueError('Selection field %s has shape %s; expected a leading part of %s' % (name,a.shape,tuple(shape),))
+      values[name] = a.reshape(a.shape + (1,)*(ndim-a.ndim))
+
+    result = numpy.asarray(self._evaluate(self.tree.body,values))
+    if result.dtype != numpy.bool_: result = result != 0
+    return numpy.broadcast_to(result,shape)
+
+  def _evaluate(self,node,values):
+
+    if isinstance(node,ast.Name): return values[node.id]
+
+    value = constant(node)
+    if value is not None: return value
+
+    if isinstance(node,ast.BoolOp):
+      combine = numpy.logical_or
+      if isinstance(node.op,ast.And): combine = numpy.logical_and
+      result = numpy.asarray(self._evaluate(node.values[0],values)) != 0
+      for child in node.values[1:]: result = combine(result,numpy.asarray(self._evaluate(child,values)) != 0)
+      return result
+
+    if isinstance(node,ast.BinOp):
+      return BINARYOPERATORS[type(node.op)](self._evaluate(node.left,values),self._evaluate(node.right,values))
+
+    if isinstance(node,ast.UnaryOp):
+      operand = self._evaluate(node.operand,values)
+      if isinstance(node.op,ast.Not): operand = numpy.asarray(operand) != 0
+      return UNARYOPERATORS[type(node.op)](operand)
+
+    ### Compare:  a < b < c => (a < b) & (b < c)
+    result = True
+    left = self._evaluate(node.left,values)
+    for op,comparator in zip(node.ops,node.comparators):
+      right = self._evaluate(comparator,values)
+      result = numpy.logical_and(result,COMPARISONS[type(op)](left,right))
+      left = right
+    return result
+
+
+########################################################################
+def constant(node):
+  """Value of an int or float constant node, else None"""
+  if not isinstance(node,CONSTANT): return None
+  value = getattr(node,CONSTANTVALUE)
+  if isinstance(value,bool) or not isinstance(value,NUMBERS): return None
+  return value
@@ -0,0 +1,400 @@
+"""
+tagwatch.py - Watch-folder service for tag.py, with warm kernels
+
+Watch an incoming directory for TOMS/EP .he5 granules and add GlintAngle
+to each as it arrives, with a persistent pool of tag.py workers:  Python
+startup, the h5py/spice imports and kernel loading are paid once per
+worker, not once per delivery batch, so the latency of a file from
+arrival to ..._glint.he5 is about its compute time.
+
+Arrival:  on Linux, inotify (via ctypes) reports files closed after
+writing or moved into the directory; these are queued at once.  The
+directory is also scanned every --interval seconds, which is the only
+mechanism where inotify is unavailable (or with --poll):  a file is
+queued when its size and mtime have not changed for --settle seconds.
+Files tag.py would skip by name (e.g. ..._glint.he5, .tmp) and files
+whose output already exists (or, with --manifest, that are done per the
+manifest) are ignored.
+
+Queued files are processed by at most --workers files at a time; the
+tag.py options other than those below apply as usual (e.g.
+--output-mode, --manifest, --metrics, --memory-budget, --tle).
+
+Status:  --status=FILE is rewritten (atomically) as JSON after every
+change and at least every --interval seconds:  queue depth (settling,
+queued, running), file counts by status, and latency statistics,
+seconds, from arrival to done (latency), queued to started (wait), and
+tag.py compute time (compute).
+
+SIGTERM or SIGINT stops the service after the running files are done.
+
+Usage:
+
+  python tagwatch.py INCOMING/ [--status=status.json] [--workers=4]
+                     [--interval=2] [--settle=5] [--poll] [--once]
+                     [tag.py options ...]
+
+  --once  Exit when the files in the directory are done
+
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import ctypes
+import select
+import signal
+import struct
+import argparse
+import collections
+import multiprocessing
+import tag
+import tagmanifest
+import taginstrument
+
+
+########################################################################
+class INotify:
+  """Minimal inotify(7) via ctypes:  names of files closed after writing
+     or moved into one directory
+
+     Raises OSError where inotify is not available
+  """
+
+  IN_CLOSE_WRITE = 0x00000008
+  IN_MOVED_TO = 0x00000080
+  IN_Q_OVERFLOW = 0x00004000
+  IN_NONBLOCK = 0o4000
+
+  EVENT = struct.Struct('iIII')
+
+  def __init__(self,directory):
+    try:
+      libc = ctypes.CDLL(None,use_errno=True)
+      init1,addwatch = libc.inotify_init1,libc.inotify_add_watch
+    except (AttributeError,OSError,):
+      raise OSError(errno.ENOSYS,'inotify is not available')
+
+    self.fd = init1(self.IN_NONBLOCK)
+    if self.fd < 0: raise OSError(ctypes.get_errno(),'inotify_init1 failed')
+
+    if addwatch(self.fd,os.path.abspath(directory).encode(),self.IN_CLOSE_WRITE|self.IN_MOVED_TO) < 0:
+      os.close(self.fd)
+      raise OSError(ctypes.get_errno(),'inotify_add_watch failed:  %s' % (directory,))
+
+  ######################################################################
+  def fileno(self):
+    return self.fd
+
+  def read(self):
+    """Names of files in events since last read; None after an overflow"""
+    names = []
+    while True:
+      try:
+        data = os.read(self.fd,65536)
+      except OSError as e:
+        if e.errno == errno.EAGAIN: return names
+        raise
+      offset = 0
+      while offset < len(data):
+        wd,mask,cookie,length = self.EVENT.unpack_from(data,offset)
+        offset += self.EVENT.size
+        if mask & self.IN_Q_OVERFLOW: names = None
+        elif names is not None: names.append(data[offset:offset+length].rstrip(b'\0').decode())
+        offset += length
+      if names is None: return None
+
+  def close(self):
+    os.close(self.fd)
+
+
+########################################################################
+class Watcher:
+  """Arrivals of files in one directory; see module docstring
+
+     Arguments:
+       directory -- incoming directory
+       interval -- seconds between directory scans
+       settle -- seconds of unchanged size and mtime before a scanned
+                 file is ready
+       poll -- if True, do not use inotify
+       accept -- if not None, only paths for which accept(path) is true
+                 are watched
+  """
+
+  def __init__(self,directory,interval,settle,poll=False,accept=None):
+    self.directory = directory
+    self.accept = accept
+    self.interval = interval
+    self.settle = settle
+
+    ### Candidates:  {path: [size, mtime, arrival, unchanged since]};
+    ### delivered:  {path: (size, mtime,)} of files already returned
+    self.candidates = {}
+    self.delivered = {}
+    self.lastScan = None
+
+    self.inotify = None
+    if not poll:
+      try:
+        self.inotify = INotify(directory)
+      except OSError as e:
+        sys.stderr.write('### inotify unavailable (%s); polling every %gs\n' % (e,interval,))
+
+    ### Self-pipe:  wake() from any thread interrupts wait()
+    self.wakeRead,self.wakeWrite = os.pipe()
+
+  ######################################################################
+  def wake(self):
+    os.write(self.wakeWrite,b'.')
+
+  def wait(self,timeout):
+    """Wait up to timeout seconds for an inotify event, a wake() or the
+       next scan
+    """
+    if self.lastScan is not None: timeout = max(0.,min(timeout,self.lastScan+self.interval-time.time()))
+    fds = [self.wakeRead]
+    if self.inotify: fds.append(self.inotify.fileno())
+    try:
+      readable = select.select(fds,[],[],timeout)[0]
+    except (select.error,OSError,):
+      readable = []     ### EINTR, e.g. SIGTERM
+    if self.wakeRead in readable: os.read(self.wakeRead,4096)
+
+  ######################################################################
+  def stat(self,path):
+    """(size, mtime,) of regular file path, or None"""
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+    if not os.path.isfile(path): return None
+    return st.st_size,st.st_mtime
+
+  def ready(self):
+    """List of (path, arrival time,) of files ready to be processed"""
+    now = time.time()
+    ready = {}
+
+    ### Files closed or moved in:  ready now
+    if self.inotify:
+      names = self.inotify.read()
+      if names is None:
+        self.lastScan = None
+        names = []
+      for name in names:
+        path = os.path.join(self.directory,name)
+        if self.accept and not self.accept(path): continue
+        st = self.stat(path)
+        if st and self.delivered.get(path) != st:
+          ready[path] = self.candidates.pop(path,[None,None,now])[2]
+          self.delivered[path] = st
+
+    ### Scan:  new and changed files become candidates, and are ready
+    ### when unchanged for self.settle seconds
+    if self.lastScan is None or now >= self.lastScan + self.interval:
+      self.lastScan = now
+      present = set()
+      for name in os.listdir(self.directory):
+        path = os.path.join(self.directory,name)
+        if self.accept and not self.accept(path): continue
+        present.add(path)
+        st = self.stat(path)
+        if st is None or path in ready or self.delivered.get(path) == st: continue
+        candidate = self.candidates.get(path)
+        if candidate is None:
+          self.candidates[path] = [st[0],st[1],now,now]
+        elif tuple(candidate[:2]) != st:
+          candidate[:2] = st
+          candidate[3] = now
+        elif now - candidate[3] >= self.settle:
+          ready[path] = candidate[2]
+          self.delivered[path] = st
+          del self.candidates[path]
+      for path in list(self.candidates):
+        if path not in present: del self.candidates[path]
+      for path in list(self.delivered):
+        if path not in present: del self.delivered[path]
+
+    return sorted(ready.items(),key=lambda item:(item[1],item[0],))
+
+  def redeliver(self,path):
+    """Update the delivered size and mtime of path, e.g. after append"""
+    st = self.stat(path)
+    if st: self.delivered[path] = st
+
+
+########################################################################
+class Status:
+  """Queue depth, counts and latency statistics; written as JSON"""
+
+  def __init__(self,path,directory,workers):
+    self.path = path
+    self.doc = dict(pid=os.getpid(),directory=os.path.abspath(directory),workers=workers
+                   ,started=time.time(),updated=None,stopping=False
+                   ,settling=0,queued=0,running=0
+                   ,files={},last=None
+                   ,latency=self.stats(),wait=self.stats(),compute=self.stats()
+                   )
+
+  def stats(self):
+    return dict(count=0,mean=0.,max=0.,last=None)
+
+  ######################################################################
+  def add(self,name,seconds):
+    stats = self.doc[name]
+    stats['count'] += 1
+    stats['mean'] += (seconds-stats['mean']) / stats['count']
+    stats['max'] = max(stats['max'],seconds)
+    stats['last'] = seconds
+
+  def finish(self,fnInput,status,arrival,queued,started,seconds):
+    """Record one file's status and times"""
+    now = time.time()
+    self.doc['files'][status] = self.doc['files'].get(status,0) + 1
+    self.doc['last'] = dict(file=fnInput,status=status,finished=now,latency=now-arrival,compute=seconds)
+    self.add('latency',now-arrival)
+    self.add('wait',started-queued)
+    self.add('compute',seconds)
+
+  def write(self,settling,queued,running,stopping=False):
+    self.doc.update(updated=time.time(),settling=settling,queued=queued,running=running,stopping=stopping)
+    if not self.path: return
+    fnTemp = self.path + '.tmp'
+    f = open(fnTemp,'w')
+    f.write(json.dumps(self.doc,indent=1,sort_keys=True) + '\n')
+    f.close()
+    os.rename(fnTemp,self.path)
+
+
+########################################################################
+def workersetup(options):
+  """Pool worker initializer:  ignore SIGINT and SIGTERM, e.g. sent to
+     the whole process group; the service stops the workers when the
+     running files are done.  Then tag.setup()
+  """
+  signal.signal(signal.SIGINT,signal.SIG_IGN)
+  signal.signal(signal.SIGTERM,signal.SIG_IGN)
+  tag.setup(options)
+
+
+########################################################################
+def makeparser():
+  """Command-line parser of tagwatch.py options; others are tag.py's"""
+
+  parser = argparse.ArgumentParser(description='Watch a directory; add GlintAngle to TOMS/EP .he5 files as they arrive'
+                                  ,epilog='Other options are passed to tag.py; see tag.py --help')
+  parser.add_argument('directory',help='Incoming directory')
+  parser.add_argument('--status',default=None,metavar='FILE'
+                     ,help='JSON status file:  queue depth, counts and latency')
+  parser.add_argument('--interval',type=float,default=2.,metavar='SECONDS'
+                     ,help='Directory scan interval (default 2)')
+  parser.add_argument('--settle',type=float,default=5.,metavar='SECONDS'
+                     ,help='Scanned files are ready when unchanged this long (default 5)')
+  parser.add_argument('--poll',action='store_true',default=False
+                     ,help='Do not use inotify; scan only')
+  parser.add_argument('--once',action='store_true',default=False
+                     ,help='Exit when the files in the directory are done')
+  return parser
+
+
+########################################################################
+def main(argv):
+
+  watchOptions,rest = makeparser().parse_known_args(argv)
+  options = tag.makeparser().parse_args(rest)
+  if options.files: makeparser().error('unrecognized arguments:  %s' % (' '.join(options.files),))
+
+  workers = options.workers or multiprocessing.cpu_count()
+
+  manifest = options.manifest and tagmanifest.Manifest(options.manifest,usehash=options.manifest_hash)
+  metrics = options.metrics and taginstrument.MetricsWriter(options.metrics,options.metrics_format)
+  if options.profile_dir and not os.path.isdir(options.profile_dir): os.makedirs(options.profile_dir)
+
+  watcher = Watcher(watchOptions.directory,watchOptions.interval,watchOptions.settle,watchOptions.poll
+                   ,accept=lambda path:not tag.skipreason(path)
+                   )
+  status = Status(watchOptions.status,watchOptions.directory,workers)
+
+  ### Each worker loads the kernels once, for the life of the service
+  pool = multiprocessing.Pool(workers,initializer=workersetup,initargs=(options,))
+
+  ### Queue:  (job, arrival, queued,); running:  {fnInput: (job, arrival,
+  ### queued, started, AsyncResult,)}
+  queue = collections.deque()
+  running = {}
+  nJobs = [0]
+
+  stopping = []
+  def stop(signum,frame):
+    stopping.append(signum)
+    watcher.wake()
+  signal.signal(signal.SIGTERM,stop)
+  signal.signal(signal.SIGINT,stop)
+
+  def enqueue(fnInput,arrival):
+    if fnInput in running: return
+    fnOutput = options.output_mode == 'append' and fnInput or tag.outputname(fnInput)
+    if manifest:
+      if manifest.needed(fnInput,fnOutput) is None: return
+      manifest.start(fnInput,fnOutput,options.output_mode)
+    elif fnOutput != fnInput and os.path.exists(fnOutput):
+      return
+    job = (fnInput,bool(manifest)
+          ,bool(options.profile_dir) and nJobs[0] % max(1,options.profile_every) == 0
+          ,)
+    nJobs[0] += 1
+    queue.append((job,arrival,time.time(),))
+
+  def record(fnInput):
+    job,arrival,queued,started,result = running.pop(fnInput)
+    try:
+      jobStatus,seconds,messages = result.get()
+    except:
+      jobStatus,seconds,messages = 'failed',time.time()-started,[('stderr','### Worker failed on file %s\n' % (fnInput,),)]
+    tag.report(messages)
+    if metrics:
+      for stream,text in messages:
+        if stream == 'metrics': metrics.write(text)
+    if manifest:
+      manifest.finish(fnInput,jobStatus=='tagged' and 'done' or jobStatus,seconds
+                     ,''.join([text for stream,text in messages if stream=='stderr'])
+                     )
+    watcher.redeliver(fnInput)
+    status.finish(fnInput,jobStatus,arrival,queued,started,seconds)
+
+  try:
+    while True:
+
+      if not stopping:
+        for fnInput,arrival in watcher.ready(): enqueue(fnInput,arrival)
+
+      for fnInput in [fnInput for fnInput in running if running[fnInput][-1].ready()]: record(fnInput)
+
+      while queue and not stopping and len(running) < workers:
+        job,arrival,queued = queue.popleft()
+        running[job[0]] = (job,arrival,queued,time.time()
+                          ,pool.apply_async(tag.tagjob,(job,),callback=lambda result:watcher.wake())
+                          ,)
+
+      status.write(len(watcher.candidates),len(queue),len(running),bool(stopping))
+
+      if stopping and not running: break
+      if watchOptions.once and not (watcher.candidates or queue or running) and watcher.lastScan is not None: break
+
+      watcher.wait(watchOptions.interval)
+
+    pool.close()
+  except:
+    pool.terminate()
+    raise
+  finally:
+    pool.join()
+    if manifest: manifest.close()
+    if watcher.inotify: watcher.inotify.close()
+
+
+if __name__=="__main__" and sys.argv[1:]:
+  main(sys.argv[1:])
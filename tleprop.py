@@ -0,0 +1,405 @@
+"""
+tleprop.py - Vectorized two-line element (TLE) propagation
+
+NumPy equivalents of the SPICE calls made one epoch at a time by
+glint_c.c and glint_f.f:
+
+  getelm(frstyr,lines)       => spice.getelm, parse TLE to elements
+  ev2lin(ets,geophs,elems)   => ev2lin_, NORAD SGP4 near-Earth model
+  reclat(states)             => spice.reclat
+
+and, for tag.py, geodetic altitude, latitude and longitude of the
+spacecraft, e.g. when a granule's Spacecraft* fields are missing or to
+cross-check them:  TEME states are rotated to Earth-fixed by Greenwich
+mean sidereal time (IAU 1982, UT1 ~ UTC; polar motion ignored), then
+converted with glintvec.recgeo.
+
+ev2lin() propagates one set of elements over a whole array of epochs at
+once; against ev2lin_, positions agree to better than 1 mm over +/-5
+days from the epoch.  Only near-Earth orbits (period less than 225
+minutes, e.g. Earth Probe) are supported.
+
+Time conversions use utcet.py, which reads the leapseconds kernel.
+
+Usage:
+
+  import tleprop
+  tle = tleprop.TLE(lines)                  ### or tleprop.readtle(fn)
+  states = tle.states(ets)                  ### (N,6), km and km/s, TEME
+  altKms,latDegs,lonDegs = tle.geodetic(ets,re,rp)
+
+  python tleprop.py > p.out                 ### same output as glint_c
+
+"""
+
+import sys
+import numpy
+import utcet
+import glintvec
+
+### from http://naif.jpl.nasa.gov/pub/naif/toolkit_docs/FORTRAN/spicelib/ev2lin.html
+GEOPHS = (1.082616e-3, -2.53881e-6, -1.65597e-6   ### J2, J3, J4
+         ,7.43669161e-2                           ### KE
+         ,120.0, 78.0                             ### QO, SO
+         ,6378.135                                ### ER
+         ,1.0                                     ### AE
+         )
+
+### Earth Probe TLE of glint_c.c and glint_f.f
+LINES = ('1 23940U 96037A   12341.93476993  .00000273  00000-0  75967-4 0  1187'
+        ,'2 23940 097.9131 164.1161 0029731 023.1886 337.0617 14.53048997873601'
+        )
+
+twopi = 2. * numpy.pi
+rpd = numpy.pi / 180.
+dpr = 180. / numpy.pi
+
+### Minutes per day
+MNPDAY = 1440.
+
+
+########################################################################
+def impliedexponent(field):
+  """TLE field with implied decimal point and exponent, e.g. ' 75967-4'"""
+  field = field.strip()
+  if not field: return 0.
+  sign = 1.
+  if field[0] in '+-':
+    sign = field[0] == '-' and -1. or 1.
+    field = field[1:]
+  mantissa,exponent = field[:-2],field[-2:]
+  return sign * float('.' + mantissa) * 10.**int(exponent)
+
+
+def getelm(frstyr,lines):
+  """Parse TLE lines; return (epoch, elems) as spice.getelm
+
+     Arguments:
+       frstyr -- first year of two-digit years, e.g. 1996:  96 => 1996,
+                 12 => 2012
+       lines -- the two lines of the TLE
+
+     elems are NDT20 (rad/min**2), NDD60 (rad/min**3), BSTAR,
+     INCL, NODE0, ECC, OMEGA, M0 (rad), N0 (rad/min), EPOCH (s past J2000)
+  """
+  line1,line2 = lines[0],lines[1]
+  if line1[:2] != '1 ' or line2[:2] != '2 ':
+    raise ValueError('Not a two-line element set:  %r' % (lines,))
+
+  year = int(line1[18:20]) + 1900
+  if year < frstyr: year += 100
+  dayOfYear = float(line1[20:32])
+
+  ### UTC seconds past J2000 of the epoch, converted to ET
+  day = int(dayOfYear)
+  midnight = utcet.utc2et('%04d-%03dT00:00:00' % (year,day,))
+  epoch = utcet.utcseconds2et(utcet.et2utcseconds(midnight) + (dayOfYear-day) * 86400.)
+
+  elems = numpy.array([float(line1[33:43]) * twopi / MNPDAY**2
+                      ,impliedexponent(line1[44:52]) * twopi / MNPDAY**3
+                      ,impliedexponent(line1[53:61])
+                      ,float(line2[8:16]) * rpd
+                      ,float(line2[17:25]) * rpd
+                      ,float('.' + line2[26:33].strip())
+                      ,float(line2[34:42]) * rpd
+                      ,float(line2[43:51]) * rpd
+                      ,float(line2[52:63]) * twopi / MNPDAY
+                      ,epoch
+                      ])
+
+  return epoch,elems
+
+
+########################################################################
+def ev2lin(ets,geophs,elems):
+  """States (km, km/s), TEME, at epochs ets, from elements of getelm()
+
+     NORAD SGP4 near-Earth model (Spacetrack Report #3), as SPICE
+     EV2LIN; returns array shaped ets.shape + (6,)
+  """
+  j2,j3,j4,ke,qo,so,er,ae = [float(g) for g in geophs]
+  ndt20,ndd60,bstar,xincl,xnodeo,eo,omegao,xmo,xno,epoch = [float(e) for e in elems]
+
+  ets = numpy.asarray(ets,dtype=numpy.float64)
+
+  tothrd = 2. / 3.
+  ck2 = .5 * j2 * ae**2
+  ck4 = -.375 * j4 * ae**4
+  qoms2t = ((qo-so) * ae / er)**4
+  s = ae * (1. + so/er)
+
+  ### Recover original mean motion (xnodp) and semimajor axis (aodp)
+  a1 = (ke/xno)**tothrd
+  cosio = numpy.cos(xincl)
+  theta2 = cosio * cosio
+  x3thm1 = 3.*theta2 - 1.
+  eosq = eo * eo
+  betao2 = 1. - eosq
+  betao = numpy.sqrt(betao2)
+  del1 = 1.5 * ck2 * x3thm1 / (a1*a1*betao*betao2)
+  ao = a1 * (1. - del1*(.5*tothrd + del1*(1. + 134./81.*del1)))
+  delo = 1.5 * ck2 * x3thm1 / (ao*ao*betao*betao2)
+  xnodp = xno / (1.+delo)
+  aodp = ao / (1.-delo)
+
+  if twopi / xnodp >= 225.:
+    raise ValueError('Deep-space orbit (period %.1f minutes); only near-Earth orbits are supported' % (twopi/xnodp,))
+
+  ### Perigee below 220km:  simplified drag terms
+  isimp = (aodp*(1.-eo)/ae) < (220./er + ae)
+
+  ### Perigee below 156km:  altered s and qoms2t
+  s4 = s
+  qoms24 = qoms2t
+  perige = (aodp*(1.-eo) - ae) * er
+  if perige < 156.:
+    s4 = perige - 78.
+    if perige <= 98.: s4 = 20.
+    qoms24 = ((120.-s4) * ae / er)**4
+    s4 = s4/er + ae
+
+  pinvsq = 1. / (aodp*aodp*betao2*betao2)
+  tsi = 1. / (aodp-s4)
+  eta = aodp * eo * tsi
+  etasq = eta * eta
+  eeta = eo * eta
+  psisq = abs(1.-etasq)
+  coef = qoms24 * tsi**4
+  coef1 = coef / psisq**3.5
+  c2 = coef1 * xnodp * (aodp*(1. + 1.5*etasq + eeta*(4.+etasq))
+                        + .75*ck2*tsi/psisq*x3thm1*(8. + 3.*etasq*(8.+etasq)))
+  c1 = bstar * c2
+  sinio = numpy.sin(xincl)
+  a3ovk2 = -j3 / ck2 * ae**3
+  x1mth2 = 1. - theta2
+  c4 = 2. * xnodp * coef1 * aodp * betao2 * (eta*(2. + .5*etasq) + eo*(.5 + 2.*etasq)
+       - 2.*ck2*tsi/(aodp*psisq) * (-3.*x3thm1*(1. - 2.*eeta + etasq*(1.5 - .5*eeta))
+                                    + .75*x1mth2*(2.*etasq - eeta*(1.+etasq))*numpy.cos(2.*omegao)))
+  c5 = 2. * coef1 * aodp * betao2 * (1. + 2.75*(etasq+eeta) + eeta*etasq)
+  theta4 = theta2 * theta2
+  temp1 = 3. * ck2 * pinvsq * xnodp
+  temp2 = temp1 * ck2 * pinvsq
+  temp3 = 1.25 * ck4 * pinvsq * pinvsq * xnodp
+  xmdot = xnodp + .5*temp1*betao*x3thm1 + .0625*temp2*betao*(13. - 78.*theta2 + 137.*theta4)
+  x1m5th = 1. - 5.*theta2
+  omgdot = -.5*temp1*x1m5th + .0625*temp2*(7. - 114.*theta2 + 395.*theta4) + temp3*(3. - 36.*theta2 + 49.*theta4)
+  xhdot1 = -temp1 * cosio
+  xnodot = xhdot1 + (.5*temp2*(4. - 19.*theta2) + 2.*temp3*(3. - 7.*theta2)) * cosio
+  xnodcf = 3.5 * betao2 * xhdot1 * c1
+  t2cof = 1.5 * c1
+  xlcof = .125 * a3ovk2 * sinio * (3. + 5.*cosio) / (1. + cosio)
+  aycof = .25 * a3ovk2 * sinio
+  x7thm1 = 7.*theta2 - 1.
+
+  ### Circular orbits:  no eccentricity-dependent drag terms
+  c3 = omgcof = xmcof = 0.
+  if eo > 1e-4:
+    c3 = coef * tsi * a3ovk2 * xnodp * ae * sinio / eo
+    xmcof = -tothrd * coef * bstar * ae / eeta
+  omgcof = bstar * c3 * numpy.cos(omegao)
+  delmo = (1. + eta*numpy.cos(xmo))**3
+  sinmo = numpy.sin(xmo)
+
+  if not isimp:
+    c1sq = c1 * c1
+    d2 = 4. * aodp * tsi * c1sq
+    temp = d2 * tsi * c1 / 3.
+    d3 = (17.*aodp + s4) * temp
+    d4 = .5 * temp * aodp * tsi * (221.*aodp + 31.*s4) * c1
+    t3cof = d2 + 2.*c1sq
+    t4cof = .25 * (3.*d3 + c1*(12.*d2 + 10.*c1sq))
+    t5cof = .2 * (3.*d4 + 12.*c1*d3 + 6.*d2*d2 + 15.*c1sq*(2.*d2 + c1sq))
+
+  ### Secular gravity and atmospheric drag
+  tsince = (ets - epoch) / 60.
+  xmdf = xmo + xmdot*tsince
+  omgadf = omegao + omgdot*tsince
+  xnoddf = xnodeo + xnodot*tsince
+  omega = omgadf
+  xmp = xmdf
+  tsq = tsince * tsince
+  xnode = xnoddf + xnodcf*tsq
+  tempa = 1. - c1*tsince
+  tempe = bstar * c4 * tsince
+  templ = t2cof * tsq
+  if not isimp:
+    delomg = omgcof * tsince
+    delm = xmcof * ((1. + eta*numpy.cos(xmdf))**3 - delmo)
+    temp = delomg + delm
+    xmp = xmdf + temp
+    omega = omgadf - temp
+    tcube = tsq * tsince
+    tfour = tsince * tcube
+    tempa = tempa - d2*tsq - d3*tcube - d4*tfour
+    tempe = tempe + bstar*c5*(numpy.sin(xmp) - sinmo)
+    templ = templ + t3cof*tcube + tfour*(t4cof + tsince*t5cof)
+  a = aodp * tempa**2
+  e = eo - tempe
+  xl = xmp + omega + xnode + xnodp*templ
+  beta = numpy.sqrt(1. - e*e)
+  xn = ke / a**1.5
+
+  ### Long period periodics
+  axn = e * numpy.cos(omega)
+  temp = 1. / (a*beta*beta)
+  xll = temp * xlcof * axn
+  aynl = temp * aycof
+  xlt = xl + xll
+  ayn = e*numpy.sin(omega) + aynl
+
+  ### Solve Kepler's equation, all epochs at once, to convergence
+  capu = numpy.fmod(xlt-xnode,twopi)
+  epw = capu
+  for i in range(20):
+    sinepw = numpy.sin(epw)
+    cosepw = numpy.cos(epw)
+    temp3 = axn * sinepw
+    temp4 = ayn * cosepw
+    temp5 = axn * cosepw
+    temp6 = ayn * sinepw
+    epwNew = (capu - temp4 + temp3 - epw) / (1. - temp5 - temp6) + epw
+    converged = not epwNew.size or numpy.abs(epwNew-epw).max() <= 1e-13
+    epw = epwNew
+    if converged: break
+  sinepw = numpy.sin(epw)
+  cosepw = numpy.cos(epw)
+  temp3 = axn * sinepw
+  temp4 = ayn * cosepw
+  temp5 = axn * cosepw
+  temp6 = ayn * sinepw
+
+  ### Short period preliminary quantities
+  ecose = temp5 + temp6
+  esine = temp3 - temp4
+  elsq = axn*axn + ayn*ayn
+  temp = 1. - elsq
+  pl = a * temp
+  r = a * (1.-ecose)
+  temp1 = 1. / r
+  rdot = ke * numpy.sqrt(a) * esine * temp1
+  rfdot = ke * numpy.sqrt(pl) * temp1
+  temp2 = a * temp1
+  betal = numpy.sqrt(temp)
+  temp3 = 1. / (1.+betal)
+  cosu = temp2 * (cosepw - axn + ayn*esine*temp3)
+  sinu = temp2 * (sinepw - ayn - axn*esine*temp3)
+  u = numpy.arctan2(sinu,cosu)
+  sin2u = 2. * sinu * cosu
+  cos2u = 2. * cosu * cosu - 1.
+  temp = 1. / pl
+  temp1 = ck2 * temp
+  temp2 = temp1 * temp
+
+  ### Update for short periodics
+  rk = r*(1. - 1.5*temp2*betal*x3thm1) + .5*temp1*x1mth2*cos2u
+  uk = u - .25*temp2*x7thm1*sin2u
+  xnodek = xnode + 1.5*temp2*cosio*sin2u
+  xinck = xincl + 1.5*temp2*cosio*sinio*cos2u
+  rdotk = rdot - xn*temp1*x1mth2*sin2u
+  rfdotk = rfdot + xn*temp1*(x1mth2*cos2u + 1.5*x3thm1)
+
+  ### Orientation vectors
+  sinuk = numpy.sin(uk)
+  cosuk = numpy.cos(uk)
+  sinik = numpy.sin(xinck)
+  cosik = numpy.cos(xinck)
+  sinnok = numpy.sin(xnodek)
+  cosnok = numpy.cos(xnodek)
+  xmx = -sinnok * cosik
+  xmy = cosnok * cosik
+  ux = xmx*sinuk + cosnok*cosuk
+  uy = xmy*sinuk + sinnok*cosuk
+  uz = sinik * sinuk
+  vx = xmx*cosuk - cosnok*sinuk
+  vy = xmy*cosuk - sinnok*sinuk
+  vz = sinik * cosuk
+
+  ### Position (km) and velocity (km/s)
+  return numpy.stack((rk*ux*er,rk*uy*er,rk*uz*er
+                     ,(rdotk*ux + rfdotk*vx)*er/60.
+                     ,(rdotk*uy + rfdotk*vy)*er/60.
+                     ,(rdotk*uz + rfdotk*vz)*er/60.
+                     ),axis=-1)
+
+
+########################################################################
+def reclat(states):
+  """Radii, longitudes, latitudes (radians) of positions, as spice.reclat"""
+  states = numpy.asarray(states,dtype=numpy.float64)
+  x,y,z = states[...,0],states[...,1],states[...,2]
+  return numpy.sqrt(x*x+y*y+z*z),numpy.arctan2(y,x),numpy.arctan2(z,numpy.hypot(x,y))
+
+
+def gmst(ets):
+  """Greenwich mean sidereal angles (radians) at epochs; IAU 1982, UT1 = UTC"""
+  ets = numpy.asarray(ets,dtype=numpy.float64)
+  t = utcet.et2utcseconds(ets) / (86400.*36525.)
+  seconds = 67310.54841 + (876600.*3600. + 8640184.812866)*t + .093104*t*t - 6.2e-6*t*t*t
+  return numpy.fmod(seconds,86400.) * twopi / 86400.
+
+
+def teme2ecef(ets,states):
+  """Positions, TEME to Earth-fixed (pseudo Earth-fixed, no polar motion)"""
+  g = gmst(ets)
+  cosg,sing = numpy.cos(g),numpy.sin(g)
+  x,y,z = states[...,0],states[...,1],states[...,2]
+  return numpy.stack((cosg*x + sing*y,cosg*y - sing*x,z,),axis=-1)
+
+
+########################################################################
+class TLE:
+  """One two-line element set, propagated over arrays of epochs
+
+     Arguments:
+       lines -- the two lines of the TLE
+       frstyr -- first year of two-digit years; see getelm()
+       geophs -- geophysical constants; see GEOPHS
+  """
+
+  def __init__(self,lines,frstyr=1996,geophs=GEOPHS):
+    self.lines = tuple(lines)
+    self.geophs = geophs
+    self.epoch,self.elems = getelm(frstyr,lines)
+
+  ######################################################################
+  def states(self,ets):
+    """States (km, km/s), TEME, at epochs; shape ets.shape + (6,)"""
+    return ev2lin(ets,self.geophs,self.elems)
+
+  ######################################################################
+  def geodetic(self,ets,re,rp):
+    """Geodetic altitudes (km), latitudes and longitudes (degrees)
+
+       re,rp -- Earth equatorial and polar radii, km
+    """
+    ets = numpy.asarray(ets,dtype=numpy.float64)
+    lon,lat,alt = glintvec.recgeo(teme2ecef(ets,self.states(ets)),re,(re-rp)/re)
+    return alt,dpr*lat,dpr*lon
+
+
+def readtle(fn,frstyr=1996):
+  """TLE of first line 1 and line 2 pair in a text file"""
+  lines = [line.rstrip() for line in open(fn)]
+  for line1,line2 in zip(lines[:-1],lines[1:]):
+    if line1[:2] == '1 ' and line2[:2] == '2 ': return TLE((line1,line2,),frstyr)
+  raise ValueError("No two-line element set in '%s'" % (fn,))
+
+
+########################################################################
+if __name__=="__main__":
+
+  ### Same output as glint_c.c, for the Makefile test
+  utcet.load('naif0011.tls')
+
+  tle = TLE(LINES)
+  sys.stdout.write('\n%s\n%s\n%s\n\n' % (utcet.et2utc(tle.epoch,'ISOC',3),LINES[0],LINES[1],))
+
+  for i,elem in enumerate(tle.elems):
+    if not i%5: sys.stdout.write('\n')
+    sys.stdout.write('%17.8e' % (elem,))
+  sys.stdout.write('\n\n')
+
+  ets = tle.epoch + numpy.arange(0.,225*60.,300.)
+  rs,lons,lats = reclat(tle.states(ets))
+  for et,r,lon,lat in zip(ets,rs,lons,lats):
+    sys.stdout.write('%s %10.3f %8.3f %8.3f\n' % (utcet.et2utc(et,'ISOC',3),r,lon*dpr,lat*dpr,))
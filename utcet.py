@@ -0,0 +1,252 @@
+"""
+utcet.py - Vectorized UTC <=> ET (TDB) time conversions
+
+NumPy equivalents of spice.utc2et, spice.et2utc and spice.deltet for
+whole arrays of times, e.g. the full Time field of a TOMS granule:  the
+leapseconds kernel (naif0011.tls) is read once (kernelpool.py), then
+conversions are array operations, with no per-value SPICE calls.
+
+Same model as SPICE:
+
+  TAI = UTC + DELTA_AT          ### leap seconds table
+  TDT = TAI + DELTA_T_A         ### 32.184s
+  ET  = TDT + K*sin(E)          ### E = M + EB*sin(M), M = M0 + M1*TDT
+
+As SPICE, the periodic term of ET to UTC is evaluated at ET.  Against
+SPICE, conversions agree to within one float64 rounding (~1e-7s or
+less), and formatted strings are identical, including leap seconds
+(23:59:60) and epochs before the leap seconds table.
+
+UTC strings are ISO calendar (YYYY-MM-DDTHH:MM:SS.ffffff, or with a space
+for T) or day-of-year (YYYY-DDDTHH:MM:SS.ffffff) formats; trailing Z,
+time and fractional seconds are optional.
+
+Usage:
+
+  import utcet
+  utcet.load('naif0011.tls')                ### optional; default below
+  ets = utcet.utc2et(['1996-07-25T00:36:27.5','1996-208T00:36:28Z'])
+  utcs = utcet.et2utc(ets,'ISOC',3)
+  ets = utcet.toms2et(fInput['.../Geolocation Fields/Time'][:])
+  ets = utcet.datetime642et(numpy.datetime64('2012-12-06T22:26:04.122'))
+
+"""
+
+import os
+import re
+import numpy
+import kernelpool
+
+### Default leapseconds kernel; current directory, else next to this file
+LSK = 'naif0011.tls'
+
+### J2000 epoch as formal UTC calendar time; ET (TDB) seconds past J2000
+### are counted from 2000-01-01T12:00:00 TDB
+J2000 = numpy.datetime64('2000-01-01T12:00:00','ns')
+
+### TOMS Time field:  TAI seconds past 1993-01-01T00:00:00 UTC
+TOMSZERO = '1993-01-01T00:00:00'
+
+### Loaded leapseconds table; see load()
+_leapSeconds = None
+
+UTCRE = re.compile(r'^\s*(\d{4})-(?:(\d{1,2})-(\d{1,2})|(\d{3}))'
+                   r'(?:[T ](\d{1,2})(?::(\d{1,2})(?::(\d{1,2}(?:\.\d*)?))?)?)?\s*Z?\s*$')
+
+
+########################################################################
+def formalseconds(datetime64s):
+  """Formal seconds (86400 per day) past J2000 of datetime64 values"""
+  ns = (numpy.asarray(datetime64s).astype('datetime64[ns]') - J2000).astype(numpy.int64)
+  return (ns // 1000000000).astype(numpy.float64) + (ns % 1000000000) * 1e-9
+
+
+class LeapSeconds:
+  """Leapseconds kernel model; see module docstring"""
+
+  def __init__(self,fn):
+    self.fn = fn
+    values = kernelpool.getvalues(fn,['DELTET/DELTA_T_A','DELTET/K','DELTET/EB','DELTET/M','DELTET/DELTA_AT'])
+    self.deltaTA = values['DELTET/DELTA_T_A'][0]
+    self.k = values['DELTET/K'][0]
+    self.eb = values['DELTET/EB'][0]
+    self.m0,self.m1 = values['DELTET/M'][:2]
+
+    ### DELTA_AT values, and the formal UTC and TAI at which they take
+    ### effect; before the table, as SPICE, DELTA_AT is one less than
+    ### the first value
+    deltaAT = values['DELTET/DELTA_AT']
+    self.epochs = formalseconds(numpy.array(deltaAT[1::2]))
+    self.deltaATs = numpy.array(deltaAT[0::2],dtype=numpy.float64)
+    self.deltaATs = numpy.concatenate(([self.deltaATs[0]-1.],self.deltaATs,))
+    self.taiEpochs = self.epochs + self.deltaATs[1:]
+
+  ######################################################################
+  def periodic(self,ets):
+    """ET - TDT, seconds; ET or TDT may be used as argument"""
+    m = self.m0 + self.m1*ets
+    return self.k * numpy.sin(m + self.eb*numpy.sin(m))
+
+  def deltaat(self,utcs):
+    """DELTA_AT at formal UTC seconds"""
+    return self.deltaATs[numpy.searchsorted(self.epochs,utcs,side='right')]
+
+  ### N.B. the order of the additions follows SPICE, so that results
+  ###      agree to the last bit in most cases
+
+  def utc2et(self,utcs,deltaATs):
+    """ET of formal UTC seconds, given their DELTA_AT values"""
+    tdts = (utcs + deltaATs) + self.deltaTA
+    return tdts + self.periodic(tdts)
+
+  def et2utc(self,ets):
+    """Formal UTC seconds of ET, and indices of their DELTA_AT values
+
+       Within a leap second, UTC reaches the next DELTA_AT epoch
+    """
+    tais = (ets - self.periodic(ets)) - self.deltaTA
+    i = numpy.searchsorted(self.taiEpochs,tais,side='right')
+    return tais - self.deltaATs[i],i
+
+
+########################################################################
+def load(fn=None):
+  """Load leapseconds kernel (default LSK); return LeapSeconds"""
+  global _leapSeconds
+  if fn is None:
+    fn = LSK
+    if not os.path.exists(fn): fn = os.path.join(os.path.dirname(os.path.abspath(__file__)),LSK)
+  _leapSeconds = LeapSeconds(fn)
+  return _leapSeconds
+
+
+def leapseconds():
+  """Loaded LeapSeconds; load default LSK on first use"""
+  if _leapSeconds is None: load()
+  return _leapSeconds
+
+
+def _result(values,like):
+  """values as scalar if like is scalar, else array"""
+  if numpy.ndim(like) == 0: return values.reshape(()).item()
+  return values
+
+
+########################################################################
+def tai2et(tais):
+  """ET of TAI seconds past J2000 (formal UTC epoch)"""
+  ls = leapseconds()
+  tdts = numpy.asarray(tais,dtype=numpy.float64) + ls.deltaTA
+  return _result(tdts + ls.periodic(tdts),tais)
+
+
+def et2tai(ets):
+  ls = leapseconds()
+  ets = numpy.asarray(ets,dtype=numpy.float64)
+  return _result((ets - ls.periodic(ets)) - ls.deltaTA,ets)
+
+
+def utcseconds2et(utcs):
+  """ET of formal UTC seconds past J2000, as utc + spice.deltet(utc,'UTC')"""
+  ls = leapseconds()
+  utcs = numpy.asarray(utcs,dtype=numpy.float64)
+  return _result(ls.utc2et(utcs,ls.deltaat(utcs)),utcs)
+
+
+def et2utcseconds(ets):
+  """Formal UTC seconds past J2000 of ET, as ET - spice.deltet(et,'ET')"""
+  ets = numpy.asarray(ets,dtype=numpy.float64)
+  return _result(leapseconds().et2utc(ets)[0],ets)
+
+
+########################################################################
+def _parseutc(utc):
+  """Parse one UTC string:  (formal seconds of day start, seconds of day)"""
+  mo = UTCRE.match(utc)
+  if not mo: raise ValueError("Unrecognized UTC string '%s'" % (utc,))
+  year,month,day,doy,hour,minute,second = mo.groups()
+  if doy:
+    date = numpy.datetime64('%s-01-01' % (year,),'D') + numpy.timedelta64(int(doy)-1,'D')
+  else:
+    date = numpy.datetime64('%s-%02d-%02d' % (year,int(month),int(day),),'D')
+  return formalseconds(date).item(),int(hour or 0)*3600. + int(minute or 0)*60. + float(second or 0.)
+
+
+def utc2et(utcs):
+  """ET of UTC string or array of strings; see module docstring"""
+  strings = numpy.asarray(utcs)
+  flat = [str(s).strip().rstrip('Z') for s in strings.ravel()]
+
+  try:
+    ### Fast path:  NumPy ISO 8601 parsing, e.g. no day-of-year or leap second
+    datetimes = numpy.array(flat,dtype='datetime64[ns]')
+    days = datetimes.astype('datetime64[D]')
+    dayStarts = formalseconds(days)
+    secondsOfDay = (datetimes - days.astype('datetime64[ns]')).astype(numpy.int64) * 1e-9
+  except ValueError:
+    parsed = numpy.array([_parseutc(s) for s in flat],dtype=numpy.float64).reshape((-1,2))
+    dayStarts,secondsOfDay = parsed[:,0],parsed[:,1]
+
+  ### DELTA_AT of the day applies through any leap second at its end
+  ls = leapseconds()
+  ets = ls.utc2et(dayStarts + secondsOfDay,ls.deltaat(dayStarts))
+  return _result(ets.reshape(strings.shape),utcs)
+
+
+def datetime642et(datetime64s):
+  """ET of UTC datetime64 value or array"""
+  return utcseconds2et(formalseconds(datetime64s))
+
+
+def et2datetime64(ets,unit='us'):
+  """UTC datetime64 of ET; a leap second 23:59:60.x becomes 00:00:00.x"""
+  utcs = numpy.asarray(et2utcseconds(ets),dtype=numpy.float64)
+  ns = numpy.round(utcs*1e9).astype(numpy.int64)
+  return _result((J2000 + ns.astype('timedelta64[ns]')).astype('datetime64[%s]' % (unit,)),ets)
+
+
+def toms2et(times,zeroUTC=TOMSZERO):
+  """ET of TOMS Time field values, TAI seconds past zeroUTC"""
+  return tai2et(et2tai(utc2et(zeroUTC)) + numpy.asarray(times,dtype=numpy.float64))
+
+
+########################################################################
+def et2utc(ets,format='ISOC',prec=3):
+  """UTC strings of ET value or array, as spice.et2utc
+
+     format -- 'ISOC' (YYYY-MM-DDTHH:MM:SS.fff) or 'ISOD' (YYYY-DDDTHH:MM:SS.fff)
+     prec -- number of decimal places of seconds, 0 to 6; rounded
+  """
+  if format not in ('ISOC','ISOD',): raise ValueError("Unsupported format '%s'" % (format,))
+  ls = leapseconds()
+  ets = numpy.asarray(ets,dtype=numpy.float64)
+  utcs,i = ls.et2utc(ets.ravel())
+
+  ### Round half up to prec, in microseconds
+  seconds = numpy.floor(utcs)
+  us = seconds.astype(numpy.int64)*1000000 + numpy.floor((utcs-seconds)*10**prec + .5).astype(numpy.int64)*10**(6-prec)
+
+  ### From the next DELTA_AT epoch, subtract the leap second(s); within
+  ### the leap second, show 23:59:60
+  n = len(ls.epochs)
+  iNext = numpy.minimum(i,n-1)
+  step = ((ls.deltaATs[iNext+1] - ls.deltaATs[iNext]) * 1000000).astype(numpy.int64)
+  excess = us - (ls.epochs[iNext] * 1000000).astype(numpy.int64)
+  after = (i < n) & (excess >= 0)
+  leap = after & (excess < step)
+  us = us - numpy.where(after,step,0)
+  datetimes = J2000.astype('datetime64[us]') + us.astype('timedelta64[us]')
+  strings = numpy.datetime_as_string(datetimes,unit='us')
+
+  width = 19 + (prec and prec+1 or 0)
+  results = []
+  for s,isLeap,datetime in zip(strings.tolist(),leap.tolist(),datetimes):
+    s = s[:width]
+    if isLeap: s = s[:17] + '60' + s[19:]
+    if format == 'ISOD':
+      doy = (datetime.astype('datetime64[D]') - datetime.astype('datetime64[Y]').astype('datetime64[D]')).astype(int) + 1
+      s = '%s-%03d%s' % (s[:4],doy,s[10:],)
+    results.append(s)
+
+  if ets.ndim == 0: return results[0]
+  return numpy.array(results).reshape(ets.shape)